@@ -4,6 +4,9 @@ import time
 import json
 from datetime import datetime, timezone, timedelta
 
+import jsonl_follow
+from config import ASSIGN_FEED_ADDR
+
 # -----------------------
 # CONFIG
 # -----------------------
@@ -29,6 +32,10 @@ MASTER_LOG = os.path.join(OUT_DIR, "neuralsense_accuracy_master_log.txt")
 # This is run_live output file
 ZONE_ASSIGNMENTS_PATH = os.path.join("output", "zone_assignments.jsonl")
 
+# When set (config ASSIGN_FEED_ADDR, e.g. "127.0.0.1:47200"), subscribe to
+# run_live's UDP assignment feed instead of following the file.
+FEED_ADDR = ASSIGN_FEED_ADDR
+
 KST = timezone(timedelta(hours=9))
 
 def ts_kst(ts_float):
@@ -61,31 +68,17 @@ def safe_int_input(prompt):
         except ValueError:
             print("Please type a number (example: 1).")
 
-def tail_follow_jsonl(path, start_at_end=True):
-    """
-    Generator that yields parsed JSON objects from a growing JSONL file.
-    start_at_end=True means only new lines from now on (recommended for live test).
-    """
-    with open(path, "r", encoding="utf-8") as f:
-        if start_at_end:
-            f.seek(0, 2)
-        while True:
-            line = f.readline()
-            if not line:
-                time.sleep(0.1)
-                continue
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                yield json.loads(line)
-            except Exception:
-                continue
+def open_assignment_stream():
+    """Follower over run_live assignments: read(timeout) -> list of records."""
+    if FEED_ADDR:
+        return jsonl_follow.UdpFeed(FEED_ADDR)
+    # start_at_end=True: only new lines from now on (recommended for live test)
+    return jsonl_follow.FileFollower(ZONE_ASSIGNMENTS_PATH, start_at_end=True)
 
 def main():
     os.makedirs(OUT_DIR, exist_ok=True)
 
-    if not os.path.exists(ZONE_ASSIGNMENTS_PATH):
+    if not FEED_ADDR and not os.path.exists(ZONE_ASSIGNMENTS_PATH):
         print("ERROR: {} not found.".format(ZONE_ASSIGNMENTS_PATH))
         print("Make sure run_live.py is running and writing output/zone_assignments.jsonl")
         return
@@ -93,7 +86,7 @@ def main():
     print("Tracking MACs:")
     for m in TRACK_MACS:
         print(" -", m)
-    print("Reading:", ZONE_ASSIGNMENTS_PATH)
+    print("Reading:", "UDP feed " + FEED_ADDR if FEED_ADDR else ZONE_ASSIGNMENTS_PATH)
     print("Test duration (sec):", TEST_DURATION_SEC)
     print("Output folder:", OUT_DIR)
 
@@ -127,76 +120,83 @@ def main():
         print("SETTLING_SEC={}, STABLE_STREAK_REQUIRED={}".format(SETTLING_SEC, STABLE_STREAK_REQUIRED))
         print("Logging per-phone JSONL into:", OUT_DIR)
 
-        # Follow zone_assignments.jsonl from "now"
-        stream = tail_follow_jsonl(ZONE_ASSIGNMENTS_PATH, start_at_end=True)
-
-        while time.time() < end:
-            evt = next(stream)
-
-            phone = str(evt.get("phone_id", "")).lower().strip()
-            if phone not in TRACK_MACS:
-                continue
-
-            # predicted zone
-            try:
-                pred_zone = int(evt.get("zone_id"))
-            except Exception:
-                continue
-
-            ts = evt.get("ts", time.time())
-            try:
-                ts = float(ts)
-            except Exception:
-                ts = time.time()
-
-            elapsed = time.time() - start
-
-            # Settling period: skip predictions in first SETTLING_SEC
-            in_settling = elapsed < SETTLING_SEC
-
-            # Streak tracking (always updated, even during settling)
-            if pred_zone == streak_zone[phone]:
-                streak_count[phone] += 1
-            else:
-                streak_zone[phone] = pred_zone
-                streak_count[phone] = 1
-
-            cur_streak = streak_count[phone]
-            if cur_streak >= STABLE_STREAK_REQUIRED:
-                streak_reached[phone] = True
-
-            # Decide whether to count this prediction
-            skip_settling = in_settling
-            skip_streak = not streak_reached[phone]
-            should_count = not skip_settling and not skip_streak
-
-            if skip_settling:
-                settling_skipped[phone] += 1
-
-            is_correct = (pred_zone == true_zone)
-            if should_count:
-                total[phone] += 1
-                if is_correct:
-                    correct[phone] += 1
-
-            # Write the record (includes correctness and new fields)
-            rec = {
-                "ts": ts,
-                "ts_kst": evt.get("ts_kst", ts_kst(ts)),
-                "phone_id": phone,
-                "true_zone_id": true_zone,
-                "pred_zone_id": pred_zone,
-                "is_correct": is_correct,
-                "settling_skipped": skip_settling,
-                "streak_at_pred": cur_streak,
-                "counted": should_count,
-                "x": evt.get("x"),
-                "y": evt.get("y"),
-                "confidence": evt.get("confidence"),
-                "sources": evt.get("sources"),
-                "vector": evt.get("vector")
-            }
-            append_jsonl(out_files[phone], rec)
+        # Follow zone_assignments from "now"; read() returns at the deadline
+        # even when no new assignment arrives.
+        stream = open_assignment_stream()
+
+        while True:
+            remaining = end - time.time()
+            if remaining <= 0:
+                break
+            for evt in stream.read(remaining):
+                phone = str(evt.get("phone_id", "")).lower().strip()
+                if phone not in TRACK_MACS:
+                    continue
+
+                # predicted zone
+                try:
+                    pred_zone = int(evt.get("zone_id"))
+                except Exception:
+                    continue
+
+                ts = evt.get("ts", time.time())
+                try:
+                    ts = float(ts)
+                except Exception:
+                    ts = time.time()
+
+                elapsed = time.time() - start
+
+                # Settling period: skip predictions in first SETTLING_SEC
+                in_settling = elapsed < SETTLING_SEC
+
+                # Streak tracking (always updated, even during settling)
+                if pred_zone == streak_zone[phone]:
+                    streak_count[phone] += 1
+                else:
+                    streak_zone[phone] = pred_zone
+                    streak_count[phone] = 1
+
+                cur_streak = streak_count[phone]
+                if cur_streak >= STABLE_STREAK_REQUIRED:
+                    streak_reached[phone] = True
+
+                # Decide whether to count this prediction
+                skip_settling = in_settling
+                skip_streak = not streak_reached[phone]
+                should_count = not skip_settling and not skip_streak
+
+                if skip_settling:
+                    settling_skipped[phone] += 1
+
+                is_correct = (pred_zone == true_zone)
+                if should_count:
+                    total[phone] += 1
+                    if is_correct:
+                        correct[phone] += 1
+
+                # Write the record (includes correctness and new fields)
+                rec = {
+                    "ts": ts,
+                    "ts_kst": evt.get("ts_kst", ts_kst(ts)),
+                    "phone_id": phone,
+                    "true_zone_id": true_zone,
+                    "pred_zone_id": pred_zone,
+                    "is_correct": is_correct,
+                    "settling_skipped": skip_settling,
+                    "streak_at_pred": cur_streak,
+                    "counted": should_count,
+                    "x": evt.get("x"),
+                    "y": evt.get("y"),
+                    "confidence": evt.get("confidence"),
+                    "second_zone_id": evt.get("second_zone_id"),
+                    "margin": evt.get("margin"),
+                    "test_start_ts": start,
+                    "sources": evt.get("sources"),
+                    "vector": evt.get("vector")
+                }
+                append_jsonl(out_files[phone], rec)
+        stream.close()
 
         print("TEST END true_zone={} @ {}".format(true_zone, ts_kst(time.time())))
 
@@ -0,0 +1,166 @@
+# admission.py
+#
+# Overload protection for run_live_geometry.
+#
+# - Intake: the MQTT callback only timestamps and queues messages; one worker
+#   thread scores them. Queue wait (now - rx_ts at dequeue) is the processing
+#   lag, which the callback-only design could not see (the backlog sat in the
+#   socket). Items that waited longer than ADMISSION_MAX_AGE_SEC go to the
+#   on_stale callback instead (run_live only logs their raw line), so a burst
+#   drains at logging speed instead of queueing up to ADMISSION_QUEUE_MAX.
+# - AdmissionController: EWMA of that lag picks a load level
+#     0 normal      everything is scored and logged
+#     1 shed        lag >= ADMISSION_SHED_LAG_SEC: new MACs and low-sample
+#                   devices are scored only for a 1-in-ADMISSION_SAMPLE_EVERY
+#                   sample of devices (by MAC hash, so a sampled device keeps
+#                   all its messages); raw lines of shed messages are deferred
+#     2 critical    lag >= ADMISSION_CRITICAL_LAG_SEC: only established
+#                   sessions (confirmed zone) and TRACK_MACS are scored
+#   and drops a level once the lag is below half its threshold (and the level
+#   has been held LEVEL_HOLD_SEC: shedding empties the queue fast). Deferred raw
+#   lines are written back in bounded batches once the level is 0 again, and
+#   all of them at shutdown (run_live writes them to their own
+#   raw_rssi_deferred.jsonl, which is in rx order on its own).
+# - Every decision is counted; counts print with [STATS] and on level changes.
+
+import threading
+import time
+import zlib
+from collections import deque
+
+from config import (ADMISSION_SHED_LAG_SEC, ADMISSION_CRITICAL_LAG_SEC, ADMISSION_SAMPLE_EVERY,
+                    ADMISSION_QUEUE_MAX, ADMISSION_DEFER_MAX, ADMISSION_MAX_AGE_SEC, TRACK_MACS)
+
+PRIORITY = 0        # sessions with a confirmed zone, tracked MACs: always scored
+LOW_SAMPLE = 1      # seen, no confirmed zone yet
+NEW_MAC = 2
+LAG_ALPHA = 0.05
+LEVEL_HOLD_SEC = 10.0   # a raised level is kept at least this long (no flapping)
+FLUSH_BATCH = 2000  # deferred raw lines written per admitted message at level 0
+LEVEL_NAMES = ("normal", "shed", "critical")
+
+class AdmissionController:
+    def __init__(self, shed_lag=ADMISSION_SHED_LAG_SEC, critical_lag=ADMISSION_CRITICAL_LAG_SEC,
+                 sample_every=ADMISSION_SAMPLE_EVERY, defer_max=ADMISSION_DEFER_MAX, tracked=TRACK_MACS):
+        self.shed_lag = shed_lag
+        self.critical_lag = critical_lag
+        self.sample_every = max(1, int(sample_every))
+        self.tracked = set(tracked)
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.level = 0
+        self.level_since = 0.0
+        self.deferred = deque(maxlen=defer_max)     # (write_fn, line, ts)
+        self.counts = {"admitted": 0, "shed_new_mac": 0, "shed_low_sample": 0,
+                       "raw_deferred": 0, "raw_flushed": 0, "raw_dropped": 0, "intake_dropped": 0, "intake_stale": 0}
+
+    def observe(self, lag):
+        """Update the lag estimate; returns the level after this message."""
+        self.lag += LAG_ALPHA * (lag - self.lag)
+        self.max_lag = max(self.max_lag, lag)
+        up = 2 if self.lag >= self.critical_lag else 1 if self.lag >= self.shed_lag else 0
+        hold = 2 if self.lag >= self.critical_lag / 2 else 1 if self.lag >= self.shed_lag / 2 else 0
+        level = max(up, min(self.level, hold))
+        if level < self.level and time.monotonic() - self.level_since < LEVEL_HOLD_SEC:
+            level = self.level
+        if level != self.level:
+            print("[ADMISSION] {} -> {} (lag {:.2f}s) | {}".format(
+                LEVEL_NAMES[self.level], LEVEL_NAMES[level], self.lag, self.summary()))
+            self.level = level
+            self.level_since = time.monotonic()
+        return level
+
+    def admit(self, mac, priority):
+        """True if this message should be scored at the current level."""
+        if self.level == 0 or priority == PRIORITY or mac in self.tracked:
+            self.counts["admitted"] += 1
+            return True
+        if self.level == 1 and zlib.crc32(mac.encode()) % self.sample_every == 0:
+            self.counts["admitted"] += 1
+            return True
+        self.counts["shed_new_mac" if priority == NEW_MAC else "shed_low_sample"] += 1
+        return False
+
+    def defer(self, write, line, ts):
+        if len(self.deferred) == self.deferred.maxlen:
+            self.counts["raw_dropped"] += 1
+        self.deferred.append((write, line, ts))
+        self.counts["raw_deferred"] += 1
+
+    def flush_some(self):
+        """Write back up to FLUSH_BATCH deferred raw lines while the level is 0."""
+        if self.level or not self.deferred:
+            return
+        for _ in range(min(FLUSH_BATCH, len(self.deferred))):
+            write, line, ts = self.deferred.popleft()
+            write(line, ts)
+            self.counts["raw_flushed"] += 1
+
+    def flush_all(self):
+        """Write back every deferred raw line (shutdown: nothing is lost)."""
+        while self.deferred:
+            write, line, ts = self.deferred.popleft()
+            write(line, ts)
+            self.counts["raw_flushed"] += 1
+
+    def summary(self):
+        return " ".join("{}={}".format(k, v) for k, v in self.counts.items()) + \
+            " max_lag={:.2f}s".format(self.max_lag)
+
+class Intake:
+    """Bounded FIFO between the MQTT thread and one scoring worker.
+    handle(item, rx_ts) runs on the worker after admission.observe(lag);
+    items older than max_age go to on_stale(item, rx_ts) instead, if given.
+    admission.counts is only written by the worker: drops at a full queue are
+    counted under the queue lock and copied over when the worker dequeues."""
+
+    def __init__(self, handle, admission, max_items=ADMISSION_QUEUE_MAX, on_error=None,
+                 on_stale=None, max_age=ADMISSION_MAX_AGE_SEC):
+        self.handle = handle
+        self.on_stale = on_stale
+        self.max_age = max_age
+        self.on_error = on_error
+        self.admission = admission
+        self.max_items = max_items
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name="intake", daemon=True)
+        self.thread.start()
+
+    def put(self, item, rx_ts):
+        with self.cond:
+            if len(self.items) >= self.max_items:
+                self.dropped += 1
+                return
+            self.items.append((item, rx_ts))
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.items and not self.closed:
+                    self.cond.wait()
+                self.admission.counts["intake_dropped"] = self.dropped
+                if not self.items:
+                    return
+                item, rx_ts = self.items.popleft()
+            lag = time.time() - rx_ts
+            self.admission.observe(lag)
+            try:
+                if self.on_stale is not None and lag > self.max_age > 0:
+                    self.admission.counts["intake_stale"] += 1
+                    self.on_stale(item, rx_ts)
+                else:
+                    self.handle(item, rx_ts)
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error("intake_handle", e)
+
+    def close(self):
+        """Score what is queued, then stop the worker."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
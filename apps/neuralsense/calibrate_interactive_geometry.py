@@ -1,4 +1,12 @@
 # calibrate_interactive.py (PATCHED: receive-time + abs sync window)
+#
+# Several calibration phones can work at once, each in its own zone:
+#   python calibrate_interactive_geometry.py --phones a8:76:50:e9:28:20,b0:54:76:5c:99:d5
+# (start the sniffers with the same list: --target-mac mac1,mac2). Each round
+# asks for one zone per phone; messages are demultiplexed by MAC into
+# independent collectors, and each zone's record is saved as soon as its
+# collector is done.
+import argparse
 import os
 import sys
 import json
@@ -9,6 +17,9 @@ from queue import Queue, Empty
 from datetime import datetime, timezone, timedelta
 import paho.mqtt.client as mqtt
 
+from calibration_stream import ZoneCalibration
+import sniffer_control
+
 MQTT_HOST = "100.87.27.7"
 MQTT_PORT = 1883
 MQTT_TOPIC = "neuralsense/rssi"
@@ -94,73 +105,153 @@ def drain_queue(q):
         except Empty:
             break
 
-def freeze_vec(vec):
-    return tuple(sorted((pi, float(v)) for pi, v in vec.items()))
-
-def compute_zone_stats(vectors):
-    """Compute per-Pi mean and std from a list of normalized vectors."""
-    if not vectors:
-        return {}
-    all_pis = set()
-    for v in vectors:
-        all_pis.update(v.keys())
-    stats = {}
-    for pi in sorted(all_pis):
-        vals = [float(v[pi]) for v in vectors if pi in v]
-        if not vals:
-            continue
-        mean = sum(vals) / len(vals)
-        var = sum((x - mean) ** 2 for x in vals) / len(vals) if len(vals) > 1 else 0.0
-        std = var ** 0.5
-        stats[pi] = {"mean": round(mean, 2), "std": round(std, 2), "n": len(vals)}
-    return stats
-
-def filter_multipath_vectors(vectors, z_threshold=Z_THRESHOLD):
-    """Remove vectors where any Pi deviates > z_threshold*sigma from its per-Pi mean."""
-    if len(vectors) < 3:
-        return vectors  # too few to meaningfully filter
-    stats = compute_zone_stats(vectors)
-    filtered = []
-    for v in vectors:
-        keep = True
-        for pi, val in v.items():
-            s = stats.get(pi)
-            if s is None or s["std"] < 0.01:
-                continue  # skip zero-variance Pis
-            z = abs(float(val) - s["mean"]) / s["std"]
-            if z > z_threshold:
-                keep = False
+class ZoneCollector:
+    """Samples, sync state and vectors of one phone calibrating one zone."""
+
+    def __init__(self, phone, zid, x, y, start):
+        self.phone = phone
+        self.zid = zid
+        self.x = x
+        self.y = y
+        self.start = start
+        self.samples = {pi: deque() for pi in ALL_PIS}
+        self.latest = {pi: None for pi in ALL_PIS}  # latest[pi] = (rx_ts, rssi)
+        # Deduplicated vectors + online per-Pi stats (calibration_stream.py)
+        self.zone_cal = ZoneCalibration(ALL_PIS, MAX_VECTORS_PER_ZONE, Z_THRESHOLD)
+
+    def done(self, now):
+        return (all(len(self.samples[pi]) >= MAX_SAMPLES_PER_PI for pi in ALL_PIS)
+                or self.zone_cal.full() or now - self.start > TIMEOUT_SEC)
+
+    def add(self, rx_ts, pi, rssi):
+        """Feed one reading; True if it was kept as a sample."""
+        self.latest[pi] = (rx_ts, rssi)
+        sampled = False
+        if len(self.samples[pi]) < MAX_SAMPLES_PER_PI and outlier_ok(self.samples[pi], rssi):
+            self.samples[pi].append(rssi)
+            sampled = True
+
+        # Use ABS time difference to avoid out-of-order / jitter issues
+        active_raw = {
+            p: int(self.latest[p][1])
+            for p in ALL_PIS
+            if self.latest[p] and (abs(rx_ts - self.latest[p][0]) <= SYNC_WINDOW_SEC)
+        }
+
+        if len(active_raw) >= MIN_PIS_FOR_VECTOR:
+            self.zone_cal.add(normalize_vector(active_raw))
+        return sampled
+
+    def status(self, compact):
+        if compact:
+            full = sum(1 for pi in ALL_PIS if len(self.samples[pi]) >= MAX_SAMPLES_PER_PI)
+            return "z{}:{}/{}pis v:{}".format(self.zid, full, len(ALL_PIS), len(self.zone_cal))
+        status = ["{}:{}/{}".format(pi, len(self.samples[pi]), MAX_SAMPLES_PER_PI) for pi in ALL_PIS]
+        return "   " + "  ".join(status) + "   vectors:{} {}".format(
+            len(self.zone_cal), self.zone_cal.progress())
+
+    def save(self):
+        # Improvement C: filter multipath spikes and compute per-Pi stats
+        n_raw = len(self.zone_cal)
+        vectors_filtered, pi_stats = self.zone_cal.finalize()
+
+        record_ts = time.time()
+        rec = {
+            "created_ts": record_ts,
+            "created_ts_kst": now_kst_str(record_ts),
+            "zone_id": self.zid,
+            "x": self.x,
+            "y": self.y,
+            "phone_mac_used": self.phone,
+            "max_samples_per_pi": MAX_SAMPLES_PER_PI,
+            "sync_window_sec": SYNC_WINDOW_SEC,
+            "min_pis_for_vector": MIN_PIS_FOR_VECTOR,
+            "vectors_collected": len(vectors_filtered),
+            "vectors_raw": n_raw,
+            "vectors_after_filter": len(vectors_filtered),
+            "vector_type": "normalized_rssi_minus_median",
+            "timebase": "rx_time_laptop",
+            "pi_stats": pi_stats,
+            "vectors": vectors_filtered
+        }
+        append_jsonl(OUT_CAL_JSONL, rec)
+
+        clear_status_line()
+        removed = n_raw - len(vectors_filtered)
+        print("SAVED calibration for zone", self.zid,
+              "vectors:", len(vectors_filtered),
+              "(filtered {} multipath spikes from {})".format(removed, n_raw))
+        print("Wrote ->", OUT_CAL_JSONL)
+
+def ask_zones(phones, zones):
+    """One zone per phone for the next round ({phone: zid}); a blank answer
+    leaves that phone out (multi-phone only)."""
+    if len(phones) == 1:
+        while True:
+            zid = int(input("1) Zone ID: ").strip())
+            if zid in zones:
+                return {phones[0]: zid}
+            print("Invalid zone.")
+    plan = {}
+    for phone in phones:
+        while True:
+            ans = input("1) Zone ID for {} (blank: skip): ".format(phone)).strip()
+            if not ans:
                 break
-        if keep:
-            filtered.append(v)
-    return filtered
+            zid = int(ans)
+            if zid not in zones:
+                print("Invalid zone.")
+            elif zid in plan.values():
+                print("Zone {} already has a phone this round.".format(zid))
+            else:
+                plan[phone] = zid
+                break
+    return plan
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--phones", default=CAL_PHONE_MAC,
+                    help="calibration phone MAC(s), comma-separated; each calibrates its own zone")
+    args = ap.parse_args()
+    phones = []
+    for mac in args.phones.split(","):
+        mac = mac.strip().lower()
+        if mac and mac not in phones:
+            phones.append(mac)
+    if not phones:
+        raise SystemExit("ERROR: --phones is empty")
+
     os.makedirs("output", exist_ok=True)
     zones = load_zones()
 
-    print("CALIBRATION PHONE MAC:", CAL_PHONE_MAC)
+    print("CALIBRATION PHONE MAC:", ", ".join(phones))
     print("MAX samples per Pi:", MAX_SAMPLES_PER_PI)
     print("Vector rule: ≥{} Pis within {}s".format(MIN_PIS_FOR_VECTOR, SYNC_WINDOW_SEC))
     print("NOTE: Using RECEIVE TIME (laptop clock) for synchronization.")
     print("NOTE: Storing NORMALIZED vectors (rssi - median).")
 
     rssi_queue = Queue()
+    phone_set = set(phones)
 
     def on_message(client, userdata, msg):
         # Use RX time so Pi clock drift doesn't break sync
         rx_ts = time.time()
         try:
-            obj = json.loads(msg.payload.decode("utf-8"))
-            if obj.get("mac", "").lower() != CAL_PHONE_MAC:
-                return
-            rpi_id = str(obj.get("rpi_id", "")).strip().lower()
-            rssi = int(obj["rssi"])
+            events = sniffer_control.iter_events(json.loads(msg.payload.decode("utf-8")))
         except Exception:
             return
+        for obj in events:
+            try:
+                mac = obj.get("mac", "").lower()
+                if mac not in phone_set or obj.get("spool"):
+                    continue
+                rpi_id = str(obj.get("rpi_id", "")).strip().lower()
+                rssi = int(obj["rssi"])
+            except Exception:
+                continue
 
-        if rpi_id in ALL_PIS:
-            rssi_queue.put((rx_ts, rpi_id, rssi))
+            if rpi_id in ALL_PIS:
+                rssi_queue.put((rx_ts, mac, rpi_id, rssi))
 
     client = mqtt.Client(client_id="laptop-calibrate")
     client.on_message = on_message
@@ -168,98 +259,47 @@ def main():
     client.subscribe(MQTT_TOPIC)
     client.loop_start()
 
+    compact = len(phones) > 1
     try:
         while True:
-            zid = int(input("1) Zone ID: ").strip())
-            if zid not in zones:
-                print("Invalid zone.")
-                continue
-
-            x, y = zones[zid]
-            print("CALIBRATING ZONE", zid, "(x={}, y={})".format(x, y))
+            plan = ask_zones(phones, zones)
+            if not plan:
+                print("No zones assigned.")
+            for phone, zid in plan.items():
+                x, y = zones[zid]
+                print("CALIBRATING ZONE", zid, "(x={}, y={})".format(x, y) + (" with " + phone if compact else ""))
 
             drain_queue(rssi_queue)
 
-            samples = {pi: deque() for pi in ALL_PIS}
-            latest = {pi: None for pi in ALL_PIS}  # latest[pi] = (rx_ts, rssi)
-            vectors = []
-            seen = set()
-
             start = time.time()
+            # One independent collector per phone, each saved when it is done
+            collectors = {phone: ZoneCollector(phone, zid, zones[zid][0], zones[zid][1], start)
+                          for phone, zid in plan.items()}
 
-            while True:
+            while collectors:
                 now = time.time()
-                status = ["{}:{}/{}".format(pi, len(samples[pi]), MAX_SAMPLES_PER_PI) for pi in ALL_PIS]
-                draw_status_line("   " + "  ".join(status) + "   vectors:{}".format(len(vectors)))
+                draw_status_line(" | ".join(c.status(compact) for c in collectors.values()))
 
-                if all(len(samples[pi]) >= MAX_SAMPLES_PER_PI for pi in ALL_PIS):
-                    break
-                if len(vectors) >= MAX_VECTORS_PER_ZONE:
-                    break
-                if now - start > TIMEOUT_SEC:
+                for phone in [p for p, c in collectors.items() if c.done(now)]:
+                    collectors.pop(phone).save()
+                if not collectors:
                     break
 
                 try:
-                    rx_ts, pi, rssi = rssi_queue.get(timeout=0.2)
+                    rx_ts, phone, pi, rssi = rssi_queue.get(timeout=0.2)
                 except Empty:
                     continue
 
-                latest[pi] = (rx_ts, rssi)
-
-                if len(samples[pi]) < MAX_SAMPLES_PER_PI and outlier_ok(samples[pi], rssi):
-                    samples[pi].append(rssi)
+                c = collectors.get(phone)
+                if c is None:
+                    continue
+                if c.add(rx_ts, pi, rssi):
                     clear_status_line()
-                    print("SAMPLE {} {}/{} RSSI={} dBm @ {}".format(
-                        pi, len(samples[pi]), MAX_SAMPLES_PER_PI, rssi, now_kst_str(rx_ts)
+                    print("{}SAMPLE {} {}/{} RSSI={} dBm @ {}".format(
+                        "[zone {}] ".format(c.zid) if compact else "",
+                        pi, len(c.samples[pi]), MAX_SAMPLES_PER_PI, rssi, now_kst_str(rx_ts)
                     ))
 
-                # Use ABS time difference to avoid out-of-order / jitter issues
-                active_raw = {
-                    p: int(latest[p][1])
-                    for p in ALL_PIS
-                    if latest[p] and (abs(rx_ts - latest[p][0]) <= SYNC_WINDOW_SEC)
-                }
-
-                if len(active_raw) >= MIN_PIS_FOR_VECTOR:
-                    active_norm = normalize_vector(active_raw)
-                    key = freeze_vec(active_norm)
-                    if key not in seen:
-                        seen.add(key)
-                        vectors.append(active_norm)
-
-            # Improvement C: filter multipath spikes and compute per-Pi stats
-            vectors_raw = vectors
-            vectors_filtered = filter_multipath_vectors(vectors_raw)
-            pi_stats = compute_zone_stats(vectors_filtered)
-
-            record_ts = time.time()
-            rec = {
-                "created_ts": record_ts,
-                "created_ts_kst": now_kst_str(record_ts),
-                "zone_id": zid,
-                "x": x,
-                "y": y,
-                "phone_mac_used": CAL_PHONE_MAC,
-                "max_samples_per_pi": MAX_SAMPLES_PER_PI,
-                "sync_window_sec": SYNC_WINDOW_SEC,
-                "min_pis_for_vector": MIN_PIS_FOR_VECTOR,
-                "vectors_collected": len(vectors_filtered),
-                "vectors_raw": len(vectors_raw),
-                "vectors_after_filter": len(vectors_filtered),
-                "vector_type": "normalized_rssi_minus_median",
-                "timebase": "rx_time_laptop",
-                "pi_stats": pi_stats,
-                "vectors": vectors_filtered
-            }
-            append_jsonl(OUT_CAL_JSONL, rec)
-
-            clear_status_line()
-            removed = len(vectors_raw) - len(vectors_filtered)
-            print("SAVED calibration for zone", zid,
-                  "vectors:", len(vectors_filtered),
-                  "(filtered {} multipath spikes from {})".format(removed, len(vectors_raw)))
-            print("Wrote ->", OUT_CAL_JSONL)
-
             if input("2) Continue calibration? (y/n): ").lower() != "y":
                 break
     finally:
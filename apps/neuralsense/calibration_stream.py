@@ -0,0 +1,205 @@
+# calibration_stream.py
+#
+# Streaming per-zone calibration state for calibrate_interactive_geometry.py.
+#
+# - Vectors live in one preallocated int16 array (normalized dBm in tenths,
+#   MISSING for absent Pis); duplicates are rejected by a 64-bit hash of the
+#   row bytes instead of a set of frozen tuples.
+# - Per-Pi mean/variance are updated online (Welford) as vectors arrive, and
+#   each vector is z-checked against the running stats, so the progress line
+#   shows spread and suspected multipath spikes while collecting. The live
+#   check only counts suspects; nothing is dropped before finalize().
+#   add() writes straight into the preallocated row and updates the
+#   accumulators per present Pi in plain Python (no temporaries per call).
+# - finalize() applies the multipath filter (any Pi beyond Z_THRESHOLD sigma
+#   of the zone's per-Pi mean) to all rows at once with NumPy and returns the
+#   same vectors / pi_stats the batch filter produced, in milliseconds.
+#
+# Usage (benchmark against the batch implementation):
+#   python calibration_stream.py
+
+import math
+import time
+
+import numpy as np
+
+from config import MAX_VECTORS_PER_ZONE, Z_THRESHOLD
+
+MISSING = np.iinfo(np.int16).min
+STREAM_MIN_N = 20       # running stats needed before live spike flags
+MIN_STD = 0.01          # Pis with less spread are not z-checked
+
+class ZoneCalibration:
+    def __init__(self, pis, max_vectors=MAX_VECTORS_PER_ZONE, z_threshold=Z_THRESHOLD):
+        self.pis = list(pis)
+        self.col = {pi: j for j, pi in enumerate(self.pis)}
+        self.max_vectors = max_vectors
+        self.z_threshold = z_threshold
+        self.rows = np.full((max_vectors, len(self.pis)), MISSING, dtype=np.int16)
+        self.count = 0
+        self.hashes = set()
+        self.duplicates = 0
+        self.spikes = 0             # vectors flagged by the running z-check
+        # Welford accumulators per Pi
+        self.n = [0] * len(self.pis)
+        self.mean = [0.0] * len(self.pis)
+        self.m2 = [0.0] * len(self.pis)
+
+    def __len__(self):
+        return self.count
+
+    def full(self):
+        return self.count >= self.max_vectors
+
+    def add(self, norm_vec):
+        """Store a normalized vector {pi: dBm}; False if full or a duplicate."""
+        if self.count >= self.max_vectors:
+            return False
+        row = self.rows[self.count]         # still all MISSING
+        cells = [(self.col[pi], int(round(float(v) * 10))) for pi, v in norm_vec.items()]
+        for j, t in cells:
+            row[j] = t
+        h = hash(row.tobytes())
+        if h in self.hashes:
+            row.fill(MISSING)
+            self.duplicates += 1
+            return False
+        self.hashes.add(h)
+        self.count += 1
+
+        spike = False
+        for j, t in cells:
+            x = t / 10.0
+            n, mean = self.n[j], self.mean[j]
+            # z-check against the stats before this vector
+            if n >= STREAM_MIN_N:
+                std = math.sqrt(self.m2[j] / n)
+                if std >= MIN_STD and abs(x - mean) / std > self.z_threshold:
+                    spike = True
+            n += 1
+            delta = x - mean
+            mean += delta / n
+            self.m2[j] += delta * (x - mean)
+            self.n[j], self.mean[j] = n, mean
+        if spike:
+            self.spikes += 1
+        return True
+
+    def std(self):
+        n = np.array(self.n, dtype=np.float64)
+        m2 = np.array(self.m2)
+        return np.sqrt(np.divide(m2, n, out=np.zeros_like(m2), where=n > 1))
+
+    def live_stats(self):
+        """{pi: (n, mean, std)} of everything collected so far."""
+        std = self.std()
+        return {pi: (int(self.n[j]), float(self.mean[j]), float(std[j]))
+                for j, pi in enumerate(self.pis) if self.n[j]}
+
+    def progress(self):
+        """Short status text: vectors flagged by the running z-check (final
+        filtering uses the complete stats) and the noisiest Pi."""
+        text = "suspect:{}".format(self.spikes)
+        if self.count >= 2:
+            std = self.std()
+            j = int(np.argmax(std))
+            text += " max_std:{:.1f}({})".format(std[j], self.pis[j])
+        return text
+
+    def finalize(self):
+        """(filtered vectors as dicts, pi_stats of the kept vectors)."""
+        rows = self.rows[:self.count]
+        present = rows != MISSING
+        vals = rows.astype(np.float64) / 10.0
+        keep = np.ones(self.count, dtype=bool)
+        if self.count >= 3:
+            # Stats rounded as in the stored pi_stats, like the batch filter
+            mean = np.round(np.array(self.mean), 2)
+            std = np.round(self.std(), 2)
+            check = present & (std >= MIN_STD)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                z = np.abs(vals - mean) / std
+            keep = ~((z > self.z_threshold) & check).any(axis=1)
+        kept_vals = vals[keep]
+        kept_present = present[keep]
+
+        pi_stats = {}
+        for pi in sorted(self.pis):
+            j = self.col[pi]
+            col = kept_vals[kept_present[:, j], j]
+            if not len(col):
+                continue
+            pi_stats[pi] = {"mean": round(float(col.mean()), 2), "std": round(float(col.std()), 2), "n": int(len(col))}
+
+        vectors = []
+        for row, mask in zip(kept_vals.tolist(), kept_present.tolist()):
+            vectors.append({pi: v for pi, v, m in zip(self.pis, row, mask) if m})
+        return vectors, pi_stats
+
+# --- benchmark ---
+
+def _batch_stats(vectors):
+    all_pis = set()
+    for v in vectors:
+        all_pis.update(v.keys())
+    stats = {}
+    for pi in sorted(all_pis):
+        vals = [float(v[pi]) for v in vectors if pi in v]
+        mean = sum(vals) / len(vals)
+        var = sum((x - mean) ** 2 for x in vals) / len(vals) if len(vals) > 1 else 0.0
+        stats[pi] = {"mean": round(mean, 2), "std": round(var ** 0.5, 2), "n": len(vals)}
+    return stats
+
+def _batch_filter(vectors, z_threshold=Z_THRESHOLD):
+    if len(vectors) < 3:
+        return vectors
+    stats = _batch_stats(vectors)
+    out = []
+    for v in vectors:
+        if all(stats[pi]["std"] < MIN_STD or abs(float(val) - stats[pi]["mean"]) / stats[pi]["std"] <= z_threshold
+               for pi, val in v.items()):
+            out.append(v)
+    return out
+
+def _bench(n=MAX_VECTORS_PER_ZONE, seed=0):
+    rng = np.random.default_rng(seed)
+    pis = ["pi10", "pi5", "pi7", "pi8", "pi9", "pi11", "pi12", "pi13"]
+    base = rng.integers(-80, -45, len(pis))
+    raw = []
+    for _ in range(n * 2):
+        r = base + rng.normal(0, 3, len(pis)).round()
+        if rng.random() < 0.03:
+            r[rng.integers(len(pis))] += rng.choice((-15, 15))     # multipath spike
+        m = float(np.median(r))
+        raw.append({pi: round(float(v) - m, 1) for pi, v in zip(pis, r)})
+
+    t0 = time.perf_counter()
+    seen, vectors = set(), []
+    for v in raw:
+        key = tuple(sorted(v.items()))
+        if key not in seen and len(vectors) < n:
+            seen.add(key)
+            vectors.append(v)
+    t_collect_old = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    old = _batch_filter(vectors)
+    old_stats = _batch_stats(old)
+    t_final_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    zc = ZoneCalibration(pis, n)
+    for v in raw:
+        zc.add(v)
+    t_collect_new = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    new, new_stats = zc.finalize()
+    t_final_new = time.perf_counter() - t0
+
+    print("{} vectors, {} kept (batch) / {} kept (stream), {} flagged live".format(
+        len(vectors), len(old), len(new), zc.spikes))
+    print("identical vectors: {} | identical pi_stats: {}".format(old == new, old_stats == new_stats))
+    print("collect: batch {:.1f} ms, stream {:.1f} ms".format(1e3 * t_collect_old, 1e3 * t_collect_new))
+    print("save:    batch {:.1f} ms, stream {:.1f} ms".format(1e3 * t_final_old, 1e3 * t_final_new))
+
+if __name__ == "__main__":
+    _bench()
@@ -0,0 +1,266 @@
+# device_table.py
+#
+# Compact session/device tables for run_live_geometry's MAC session linking
+# (replaces the mac_to_sid / sid_last_seen / mac_last_seen_ts dicts).
+#
+# - pack_mac(): "aa:bb:cc:dd:ee:ff" -> 48-bit int, 16-hex hashed IDs
+#   (sniffer --hash-macs) -> ~64-bit int (negative, so the two never collide);
+#   anything else stays a str. unpack_mac() gives the original string back.
+#   Used as the key of the session table and the per-MAC RSSI buffers.
+# - Pi IDs are interned to rows of an rssi_window.PiIndex seeded from
+#   config.PI_IDS (grows when an unknown Pi shows up).
+# - SessionTable: struct of arrays. Per MAC slot: session row (int32) and
+#   last-seen ts (float64). Per session row: session ID, last-seen ts and the
+#   rank vector of its last normalized RSSI vector as an int8 row (-1 = Pi not
+#   heard). Linking only ever compared ranks, so the dBm values are not kept.
+#   Slots and rows are appended in first-seen order and squeezed by expire(),
+#   so scans see MACs and sessions in the same order the dicts had.
+# - match(): the stale-session scan of resolve_session in one vectorized pass
+#   (first stale MAC order, first minimum wins, as before).
+#
+# Usage (benchmark: bytes per tracked device, dict tables vs SessionTable):
+#   python device_table.py
+
+import time
+import tracemalloc
+
+import numpy as np
+
+from config import PI_IDS
+from rssi_window import PiIndex
+
+_HEX = frozenset("0123456789abcdef")
+
+def pack_mac(mac):
+    """Lowercase MAC or hashed ID -> int key (str if neither)."""
+    if len(mac) == 17 and mac[2::3] == ":::::":
+        h = mac.replace(":", "")
+        if len(h) == 12 and _HEX.issuperset(h):
+            return int(h, 16)
+    elif len(mac) == 16 and _HEX.issuperset(mac):
+        return ~int(mac, 16)
+    return mac
+
+def unpack_mac(key):
+    if isinstance(key, str):
+        return key
+    if key < 0:
+        return "%016x" % ~key
+    h = "%012x" % key
+    return ":".join(h[i:i + 2] for i in range(0, 12, 2))
+
+def _grown(a, n):
+    """Copy of `a` with room for at least n rows (capacity doubles)."""
+    cap = len(a)
+    while cap < n:
+        cap *= 2
+    out = np.empty((cap,) + a.shape[1:], dtype=a.dtype)
+    out[:len(a)] = a
+    return out
+
+class SessionTable:
+    """MAC -> session linking state (see module header)."""
+
+    def __init__(self, pis=PI_IDS, capacity=1024):
+        self.index = PiIndex(pis)
+        # Per MAC slot
+        self.slot = {}                      # packed MAC -> slot
+        self.keys = []                      # slot -> packed MAC
+        self.mac_row = np.empty(capacity, dtype=np.int32)
+        self.mac_ts = np.empty(capacity)
+        # Per session row
+        self.row = {}                       # session ID -> row
+        self.sids = []                      # row -> session ID
+        self.sess_ts = np.empty(capacity)
+        self.ranks = np.empty((capacity, max(1, len(self.index.pis))), dtype=np.int8)
+
+    def __contains__(self, key):
+        return key in self.slot
+
+    def __len__(self):
+        return len(self.keys)
+
+    def sessions(self):
+        return len(self.sids)
+
+    def _widen(self):
+        """Make room for Pis interned since the ranks array was sized."""
+        extra = len(self.index.pis) - self.ranks.shape[1]
+        if extra > 0:
+            self.ranks = np.hstack([self.ranks, np.full((len(self.ranks), extra), -1, dtype=np.int8)])
+
+    def _rank_row(self, vec):
+        """Ranks of a normalized vector, strongest Pi = 0; ties keep dict order
+        (same order as run_live_geometry.rank_vector)."""
+        ordered = sorted(vec, key=lambda p: -float(vec[p]))
+        cols = [self.index.add(p) for p in ordered]
+        self._widen()
+        r = np.full(self.ranks.shape[1], -1, dtype=np.int8)
+        r[cols] = np.arange(len(cols))
+        return r
+
+    def _session_row(self, sid):
+        r = self.row.get(sid)
+        if r is None:
+            r = self.row[sid] = len(self.sids)
+            self.sids.append(sid)
+            if r >= len(self.sess_ts):
+                self.sess_ts = _grown(self.sess_ts, r + 1)
+                self.ranks = _grown(self.ranks, r + 1)
+        return r
+
+    def _add_mac(self, key, r, ts):
+        s = self.slot[key] = len(self.keys)
+        self.keys.append(key)
+        if s >= len(self.mac_row):
+            self.mac_row = _grown(self.mac_row, s + 1)
+            self.mac_ts = _grown(self.mac_ts, s + 1)
+        self.mac_row[s] = r
+        self.mac_ts[s] = ts
+
+    def touch(self, key, now_ts, vec):
+        """Known MAC: refresh it and its session, return the session ID (else None)."""
+        s = self.slot.get(key)
+        if s is None:
+            return None
+        self.mac_ts[s] = now_ts
+        r = self.mac_row[s]
+        self.sess_ts[r] = now_ts
+        self.ranks[r] = self._rank_row(vec)
+        return self.sids[r]
+
+    def sid_of(self, key):
+        """Session ID of a known MAC (else None), without refreshing it."""
+        s = self.slot.get(key)
+        return None if s is None else self.sids[self.mac_row[s]]
+
+    def assign(self, key, sid, now_ts, vec):
+        """Bind a new MAC to session `sid` (created if new) and refresh it."""
+        r = self._session_row(sid)
+        self.sess_ts[r] = now_ts
+        self.ranks[r] = self._rank_row(vec)
+        self._add_mac(key, r, now_ts)
+
+    def match(self, vec, stale_cutoff):
+        """(session ID, rank distance) of the closest session that has a MAC
+        silent since stale_cutoff, or (None, inf)."""
+        n = len(self.keys)
+        rows = self.mac_row[:n][self.mac_ts[:n] <= stale_cutoff]
+        if not len(rows):
+            return None, float("inf")
+        cand, first = np.unique(rows, return_index=True)
+        cand = cand[np.argsort(first)]
+        live = self._rank_row(vec).astype(np.int16)
+        old = self.ranks[cand].astype(np.int16)
+        mask = (old >= 0) & (live >= 0)
+        cnt = mask.sum(axis=1)
+        tot = np.where(mask, np.abs(old - live), 0).sum(axis=1)
+        dist = np.divide(tot, cnt, out=np.full(len(cand), np.inf), where=cnt > 0)
+        i = int(np.argmin(dist))
+        return self.sids[cand[i]], float(dist[i])
+
+    def expire(self, cutoff):
+        """Drop sessions last seen before cutoff and their MACs.
+        Returns (session IDs, packed MACs) removed, in table order."""
+        nr = len(self.sids)
+        stale = self.sess_ts[:nr] < cutoff
+        if not stale.any():
+            return [], []
+        n = len(self.keys)
+        drop = stale[self.mac_row[:n]]
+        stale_sids = [self.sids[r] for r in np.flatnonzero(stale).tolist()]
+        stale_keys = [self.keys[s] for s in np.flatnonzero(drop).tolist()]
+
+        keep_r = ~stale
+        remap = np.cumsum(keep_r, dtype=np.int32) - 1
+        k = int(keep_r.sum())
+        self.sess_ts[:k] = self.sess_ts[:nr][keep_r]
+        self.ranks[:k] = self.ranks[:nr][keep_r]
+        self.sids = [sid for sid, keep in zip(self.sids, keep_r.tolist()) if keep]
+        self.row = {sid: r for r, sid in enumerate(self.sids)}
+
+        keep_s = ~drop
+        k = int(keep_s.sum())
+        self.mac_row[:k] = remap[self.mac_row[:n][keep_s]]
+        self.mac_ts[:k] = self.mac_ts[:n][keep_s]
+        self.keys = [key for key, keep in zip(self.keys, keep_s.tolist()) if keep]
+        self.slot = {key: s for s, key in enumerate(self.keys)}
+        return stale_sids, stale_keys
+
+    def columns(self):
+        """Copy of the table for live_checkpoint (taken between messages)."""
+        n, nr = len(self.keys), len(self.sids)
+        return {"pis": list(self.index.pis), "keys": list(self.keys),
+                "mac_row": self.mac_row[:n].copy(), "mac_ts": self.mac_ts[:n].copy(),
+                "sids": list(self.sids), "sess_ts": self.sess_ts[:nr].copy(), "ranks": self.ranks[:nr].copy()}
+
+    def restore(self, cols):
+        """Load live_checkpoint.load_snapshot()'s "sessions" columns into an empty table."""
+        col = [self.index.add(p) for p in cols["pis"]]
+        self._widen()
+        ranks = np.frombuffer(cols["ranks"], dtype=np.int8).reshape(len(cols["sids"]), len(col))
+        for sid, ts, rank in zip(cols["sids"], cols["sess_ts"], ranks):
+            r = self._session_row(sid)
+            self.sess_ts[r] = ts
+            self.ranks[r] = -1
+            self.ranks[r, col] = rank
+        for key, r, ts in zip(cols["keys"], cols["mac_row"], cols["mac_ts"]):
+            self._add_mac(key, r, ts)
+
+def _bench(devices=20000, pis=8, seed=0):
+    """Tables as run_live_geometry holds them for `devices` MACs (one session
+    each, all Pis heard): tracemalloc bytes per device and one new-MAC scan."""
+    rng = np.random.default_rng(seed)
+    names = list(PI_IDS[:pis])
+    octets = rng.integers(0, 256, (devices, 6)).tolist()
+    raw = rng.integers(-90, -40, (devices, pis)).tolist()
+
+    def mac(i):
+        return ":".join("%02x" % b for b in octets[i])
+
+    def norm(i):
+        m = float(np.median(raw[i]))
+        return {pi: round(float(v) - m, 1) for pi, v in zip(names, raw[i])}
+
+    def ranks_of(vec):
+        return {pi: r for r, pi in enumerate(sorted(vec, key=lambda p: -float(vec[p])))}
+
+    probe = norm(0)
+    print("{} devices x {} Pis".format(devices, pis))
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    mac_to_sid, sid_last_seen, mac_last_seen_ts = {}, {}, {}
+    for i in range(devices):
+        m, sid = mac(i), "S{:04d}".format(i + 1)
+        mac_to_sid[m] = sid
+        sid_last_seen[sid] = (float(i), norm(i))
+        mac_last_seen_ts[m] = float(i)
+    before = tracemalloc.get_traced_memory()[0] - base
+    t0 = time.perf_counter()
+    best, best_dist, checked = None, float("inf"), set()     # resolve_session's old scan
+    for m, sid in mac_to_sid.items():
+        if sid in checked or mac_last_seen_ts[m] > devices:
+            continue
+        checked.add(sid)
+        live, old = ranks_of(probe), ranks_of(sid_last_seen[sid][1])
+        dist = sum(abs(live[p] - old[p]) for p in live if p in old) / float(len(live))
+        if dist < best_dist:
+            best, best_dist = sid, dist
+    t_before = time.perf_counter() - t0
+    del mac_to_sid, sid_last_seen, mac_last_seen_ts
+
+    base = tracemalloc.get_traced_memory()[0]
+    table = SessionTable(names)
+    for i in range(devices):
+        table.assign(pack_mac(mac(i)), "S{:04d}".format(i + 1), float(i), norm(i))
+    after = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    assert table.match(probe, float(devices)) == (best, best_dist)
+    t_after = time.perf_counter() - t0
+
+    print("  dict tables:  {:5.0f} B/device, new-MAC scan {:7.1f} ms".format(before / devices, 1e3 * t_before))
+    print("  SessionTable: {:5.0f} B/device, new-MAC scan {:7.1f} ms".format(after / devices, 1e3 * t_after))
+
+if __name__ == "__main__":
+    _bench()
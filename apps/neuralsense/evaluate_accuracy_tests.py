@@ -0,0 +1,299 @@
+# evaluate_accuracy_tests.py
+#
+# Offline batch evaluator for accuracy tests.
+#
+# Inputs (any mix):
+#   - accuracy test folders (accuracy_tests, accuracy_tests_02252026, ...) holding
+#     neuralsense_test_zone_id_XX_MMDDYYYY_phone_id_MAC.jsonl files
+#   - replayed/recorded zone_assignments.jsonl + a ground-truth CSV
+#     (phone_id,true_zone_id,start,end; start/end epoch or "YYYY-mm-dd HH:MM[:SS]" KST)
+#
+# Output (JSON): per-phone and per-zone accuracy (raw, after settling, and
+# settling + streak-adjusted, i.e. what the live test counts), per-phone
+# confusion matrices, and confidence/margin calibration curves.
+#
+# Usage:
+#   python evaluate_accuracy_tests.py accuracy_tests_02252026 --out accuracy_eval.json
+#   python evaluate_accuracy_tests.py "accuracy_tests_*" --out accuracy_eval.json
+#   python evaluate_accuracy_tests.py --assignments output/zone_assignments.jsonl --truth truth.csv
+
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+import rolling_jsonl
+
+SETTLING_SEC = 10
+STABLE_STREAK_REQUIRED = 3
+RUN_GAP_SEC = 60.0          # records further apart than this start a new test run
+CONF_BINS = np.linspace(0.0, 1.0, 11)
+MARGIN_BINS = np.linspace(0.0, 1.0, 11)
+
+TEST_FILE_RE = re.compile(r"^neuralsense_test_zone_id_(\d+)_(\d{8})_phone_id_([0-9a-f]{12})\.jsonl$")
+
+def mac_colon(compact):
+    return ":".join(compact[i:i + 2] for i in range(0, 12, 2))
+
+def _num(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
+
+def load_test_folders(patterns):
+    """Columns from per-phone accuracy test files. Each (file, run) is a group;
+    runs inside one file are split on RUN_GAP_SEC gaps."""
+    cols = {k: [] for k in ("group", "phone", "true", "pred", "ts", "conf", "margin", "start")}
+    groups = []
+    files = []
+    for pat in patterns:
+        dirs = sorted(glob.glob(pat)) or [pat]
+        for d in dirs:
+            if os.path.isdir(d):
+                files.extend(os.path.join(d, n) for n in sorted(os.listdir(d)) if TEST_FILE_RE.match(n))
+            elif TEST_FILE_RE.match(os.path.basename(d)):
+                files.append(d)
+
+    for path in files:
+        m = TEST_FILE_RE.match(os.path.basename(path))
+        true_zone, date_str, mac = int(m.group(1)), m.group(2), mac_colon(m.group(3))
+        recs = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                    recs.append((float(r["ts"]), int(r["pred_zone_id"]), _num(r.get("confidence")),
+                                 _num(r.get("margin")), _num(r.get("test_start_ts")),
+                                 int(r.get("true_zone_id", true_zone))))
+                except Exception:
+                    continue
+        recs.sort()
+        last_ts = None
+        gid = None
+        for ts, pred, conf, margin, start, true in recs:
+            if gid is None or ts - last_ts > RUN_GAP_SEC:
+                gid = len(groups)
+                groups.append({"source": path, "phone_id": mac, "true_zone_id": true, "date": date_str,
+                               "start": ts if np.isnan(start) else start, "end": ts})
+            last_ts = ts
+            groups[gid]["end"] = ts
+            cols["group"].append(gid)
+            cols["phone"].append(mac)
+            cols["true"].append(true)
+            cols["pred"].append(pred)
+            cols["ts"].append(ts)
+            cols["conf"].append(conf)
+            cols["margin"].append(margin)
+            cols["start"].append(start)
+    return cols, groups
+
+def load_truth_csv(truth_csv):
+    """Ground-truth windows: [{"phone_id", "true_zone_id", "start", "end"}]."""
+    windows = []
+    with open(truth_csv, "r", encoding="utf-8") as f:
+        for w in csv.DictReader(f):
+            windows.append({"phone_id": w["phone_id"].strip().lower(), "true_zone_id": int(w["true_zone_id"]),
+                            "start": rolling_jsonl.parse_time_arg(w["start"]),
+                            "end": rolling_jsonl.parse_time_arg(w["end"])})
+    return windows
+
+def load_replayed(assign_path, truth_csv):
+    """Columns from zone_assignments within each ground-truth window."""
+    cols = {k: [] for k in ("group", "phone", "true", "pred", "ts", "conf", "margin", "start")}
+    groups = []
+    for w in load_truth_csv(truth_csv):
+        phone = w["phone_id"]
+        true = w["true_zone_id"]
+        start = w["start"]
+        end = w["end"]
+        gid = len(groups)
+        groups.append(dict(w, source=assign_path))
+        for r in rolling_jsonl.iter_range(assign_path, start, end):
+            if str(r.get("phone_id", "")).lower().strip() != phone:
+                continue
+            try:
+                pred = int(r["zone_id"])
+            except Exception:
+                continue
+            cols["group"].append(gid)
+            cols["phone"].append(phone)
+            cols["true"].append(true)
+            cols["pred"].append(pred)
+            cols["ts"].append(float(r["ts"]))
+            cols["conf"].append(_num(r.get("confidence")))
+            cols["margin"].append(_num(r.get("margin")))
+            cols["start"].append(start)
+    return cols, groups
+
+def to_arrays(cols):
+    a = {
+        "group": np.asarray(cols["group"], dtype=np.int64),
+        "true": np.asarray(cols["true"], dtype=np.int64),
+        "pred": np.asarray(cols["pred"], dtype=np.int64),
+        "ts": np.asarray(cols["ts"], dtype=np.float64),
+        "conf": np.asarray(cols["conf"], dtype=np.float64),
+        "margin": np.asarray(cols["margin"], dtype=np.float64),
+        "start": np.asarray(cols["start"], dtype=np.float64),
+    }
+    phones, a["phone"] = np.unique(np.asarray(cols["phone"], dtype=object).astype(str), return_inverse=True)
+    order = np.lexsort((a["ts"], a["group"]))
+    a = {k: v[order] for k, v in a.items()}
+    return a, [str(p) for p in phones]
+
+def counted_masks(a, settling_sec=SETTLING_SEC, streak_required=STABLE_STREAK_REQUIRED):
+    """Vectorized replica of the live test's counting rules.
+    Rows must be sorted by (group, ts). Returns (settled, counted, streak_len)."""
+    n = len(a["ts"])
+    if n == 0:
+        empty = np.zeros(0, dtype=bool)
+        return empty, empty, np.zeros(0, dtype=np.int64)
+    g = a["group"]
+    new_group = np.r_[True, g[1:] != g[:-1]]
+    group_first_idx = np.maximum.accumulate(np.where(new_group, np.arange(n), 0))
+
+    # Test start: recorded test_start_ts when present, else first record of the run
+    start = np.where(np.isnan(a["start"]), a["ts"][group_first_idx], a["start"])
+    settled = (a["ts"] - start) >= settling_sec
+
+    # Run-length of identical consecutive predictions within a group
+    new_run = new_group | np.r_[True, a["pred"][1:] != a["pred"][:-1]]
+    run_first_idx = np.maximum.accumulate(np.where(new_run, np.arange(n), 0))
+    streak_len = np.arange(n) - run_first_idx + 1
+
+    # Once a phone reaches the streak in a run, every later record counts
+    reached = (streak_len >= streak_required).astype(np.int64)
+    cum = np.cumsum(reached)
+    before_group = np.where(group_first_idx > 0, cum[group_first_idx - 1], 0)
+    streak_ok = (cum - before_group) > 0
+    return settled, settled & streak_ok, streak_len
+
+def _acc(correct, mask):
+    n = int(mask.sum())
+    c = int((correct & mask).sum())
+    return {"n": n, "correct": c, "accuracy": round(c / n, 4) if n else None}
+
+def calibration_curve(values, correct, bins):
+    ok = ~np.isnan(values)
+    v = values[ok]
+    c = correct[ok]
+    idx = np.clip(np.digitize(v, bins) - 1, 0, len(bins) - 2)
+    n = np.bincount(idx, minlength=len(bins) - 1)
+    hits = np.bincount(idx, weights=c.astype(np.float64), minlength=len(bins) - 1)
+    mean_v = np.bincount(idx, weights=v, minlength=len(bins) - 1)
+    out = []
+    for i in range(len(bins) - 1):
+        out.append({
+            "lo": round(float(bins[i]), 3), "hi": round(float(bins[i + 1]), 3), "n": int(n[i]),
+            "mean": round(float(mean_v[i] / n[i]), 4) if n[i] else None,
+            "accuracy": round(float(hits[i] / n[i]), 4) if n[i] else None,
+        })
+    return out
+
+def evaluate(a, phones, groups, settling_sec=SETTLING_SEC, streak_required=STABLE_STREAK_REQUIRED):
+    settled, counted, _ = counted_masks(a, settling_sec, streak_required)
+    correct = a["pred"] == a["true"]
+    everything = np.ones(len(correct), dtype=bool)
+
+    zones = np.unique(np.r_[a["true"], a["pred"]])
+    ti = np.searchsorted(zones, a["true"])
+    pi = np.searchsorted(zones, a["pred"])
+    nz = len(zones)
+
+    per_phone = {}
+    confusion = {}
+    for p, name in enumerate(phones):
+        m = a["phone"] == p
+        per_phone[name] = {"raw": _acc(correct, m), "settled": _acc(correct, m & settled),
+                           "counted": _acc(correct, m & counted)}
+        mc = m & counted
+        mat = np.bincount(ti[mc] * nz + pi[mc], minlength=nz * nz).reshape(nz, nz)
+        confusion[name] = mat.tolist()
+
+    per_zone = {}
+    for z in np.unique(a["true"]):
+        m = a["true"] == z
+        per_zone[str(int(z))] = {"raw": _acc(correct, m), "settled": _acc(correct, m & settled),
+                                 "counted": _acc(correct, m & counted)}
+
+    per_phone_zone = []
+    for gi, gmeta in enumerate(groups):
+        m = a["group"] == gi
+        if not m.any():
+            continue
+        row = dict(gmeta)
+        row.update({"raw": _acc(correct, m), "counted": _acc(correct, m & counted)})
+        per_phone_zone.append(row)
+
+    return {
+        "params": {"settling_sec": settling_sec, "stable_streak_required": streak_required,
+                   "run_gap_sec": RUN_GAP_SEC},
+        "records": int(len(correct)),
+        "overall": {"raw": _acc(correct, everything), "settled": _acc(correct, settled),
+                    "counted": _acc(correct, counted)},
+        "per_phone": per_phone,
+        "per_zone": per_zone,
+        "runs": per_phone_zone,
+        "confusion": {"zones": [int(z) for z in zones], "rows": "true_zone", "cols": "pred_zone",
+                      "by_phone": confusion},
+        "calibration": {
+            "confidence": calibration_curve(a["conf"][counted], correct[counted], CONF_BINS),
+            "margin": calibration_curve(a["margin"][counted], correct[counted], MARGIN_BINS),
+        },
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("folders", nargs="*", help="accuracy test folders or globs (e.g. 'accuracy_tests_*')")
+    ap.add_argument("--assignments", help="zone_assignments.jsonl (replayed or recorded)")
+    ap.add_argument("--truth", help="ground-truth CSV for --assignments: phone_id,true_zone_id,start,end")
+    ap.add_argument("--settling-sec", type=float, default=SETTLING_SEC)
+    ap.add_argument("--streak", type=int, default=STABLE_STREAK_REQUIRED)
+    ap.add_argument("--out", default=os.path.join("accuracy_tests", "accuracy_eval.json"))
+    args = ap.parse_args()
+    if not args.folders and not args.assignments:
+        ap.error("give accuracy test folders and/or --assignments with --truth")
+    if args.assignments and not args.truth:
+        ap.error("--assignments requires --truth")
+
+    t0 = time.perf_counter()
+    cols = {k: [] for k in ("group", "phone", "true", "pred", "ts", "conf", "margin", "start")}
+    groups = []
+    sources = []
+    if args.folders:
+        sources.append(("folders", load_test_folders(args.folders)))
+    if args.assignments:
+        sources.append(("replayed", load_replayed(args.assignments, args.truth)))
+    for _, (c, g) in sources:
+        off = len(groups)
+        for k in cols:
+            cols[k].extend(c[k] if k != "group" else [x + off for x in c[k]])
+        groups.extend(g)
+    t_load = time.perf_counter() - t0
+
+    a, phones = to_arrays(cols)
+    result = evaluate(a, phones, groups, args.settling_sec, args.streak)
+    result["generated_ts"] = time.time()
+    result["inputs"] = {"folders": args.folders, "assignments": args.assignments, "truth": args.truth}
+    result["timing_sec"] = {"load": round(t_load, 3), "evaluate": round(time.perf_counter() - t0 - t_load, 3)}
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=1)
+
+    o = result["overall"]["counted"]
+    print("records={} runs={} phones={} | counted accuracy {}/{} ({}) | load {:.2f}s eval {:.2f}s".format(
+        result["records"], len(result["runs"]), len(phones), o["correct"], o["n"],
+        o["accuracy"], result["timing_sec"]["load"], result["timing_sec"]["evaluate"]))
+    for name, r in sorted(result["per_phone"].items()):
+        print("  {}  raw {}  settled {}  counted {}".format(
+            name, r["raw"]["accuracy"], r["settled"]["accuracy"], r["counted"]["accuracy"]))
+    print("Wrote ->", args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+# fleet_controller.py
+#
+# Parallel Pi fleet controller (the pi_controller.sh commands, all Pis at once).
+#
+# - Every Pi is handled by its own worker thread under a per-host budget
+#   (FLEET_HOST_TIMEOUT_SEC, FLEET_CONNECT_TIMEOUT_SEC to connect), so an
+#   unreachable Pi costs one timeout, not one per Pi in turn.
+# - SSH connections are pooled with OpenSSH multiplexing (ControlMaster /
+#   ControlPersist): the first command opens a master connection per Pi,
+#   later commands and later runs within FLEET_SSH_PERSIST_SEC reuse it.
+#   BatchMode is on: load the key into ssh-agent first.
+# - Each action is one remote round trip (kill + launch + check in a single
+#   script). The REALTEK monitor interface found per Pi is cached in
+#   output/fleet_ifaces.json; a cached name is re-checked inside the same
+#   script and detected again only when it no longer matches.
+# - Results are one dict per Pi (ok, state, iface, detail, elapsed_sec),
+#   printed as a table or with --json; the exit code is 1 when any Pi failed.
+# - Hosts come from FLEET_HOSTS or --hosts hosts.json. A "local:<dir>" target
+#   runs the commands with bash locally, HOME=<dir> and <dir>/bin first on
+#   PATH, so the controller can be exercised against stand-in hosts.
+# - deploy ships neuralsense_pi/ plus the laptop-side modules the sniffer
+#   imports from one level up (PI_SHARED: config, mac_filter, ...) as one
+#   tar.gz over the SSH session into the Pi's home, then imports the sniffer
+#   there (without starting it) so a missing module or package fails the Pi.
+#
+# Usage:
+#   python fleet_controller.py status
+#   python fleet_controller.py deploy                 # then start-* to run the new code
+#   python fleet_controller.py monitor --channel 6
+#   python fleet_controller.py start-cal --cal-mac a8:76:50:e9:28:20
+#   python fleet_controller.py start-test --pis pi10,pi5
+#   python fleet_controller.py start-prod --hash-salt "..."
+#   python fleet_controller.py stop --json
+
+import argparse
+import io
+import json
+import os
+import shlex
+import subprocess
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import live_checkpoint
+from config import (FLEET_HOSTS, FLEET_CONNECT_TIMEOUT_SEC, FLEET_HOST_TIMEOUT_SEC, FLEET_WORKERS,
+                    FLEET_SSH_PERSIST_SEC, CAL_PHONE_MAC, TRACK_MACS, OUTPUT_DIR)
+
+IFACE_CACHE = os.path.join(OUTPUT_DIR, "fleet_ifaces.json")
+PI_DIR = "~/neuralsense_pi"
+SNIFFER = "sniff_and_send_unified.py"
+# pgrep/pkill pattern that does not match the bash running the script itself
+SNIFFER_PATTERN = "'[s]niff_and_send_unified[.]py'"
+ACTIONS = ("status", "monitor", "start-cal", "start-test", "start-prod", "stop", "deploy")
+IFACE_STALE = 3     # remote exit code: cached interface is not the REALTEK one
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Modules next to config.py that the sniffer imports through sys.path ".."
+# (the Pi's home directory); neuralsense_pi/ itself is shipped whole
+PI_SHARED = ("config.py", "mac_filter.py", "live_checkpoint.py", "sniffer_control.py", "stack_sampler.py")
+
+# Name of the device block (lines starting in column 0) holding the REALTEK nickname
+DETECT = "iwconfig 2>/dev/null | awk '/^[^ \\t]/ {dev = $1} /WIFI@REALTEK/ {print dev; exit}'"
+
+def parse_hosts(spec):
+    """"pi10=pi@1.2.3.4,pi5=..." -> {rpi_id: target} (insertion order kept)."""
+    hosts = {}
+    for item in spec.split(","):
+        pi, _, target = item.partition("=")
+        if pi.strip() and target.strip():
+            hosts[pi.strip().lower()] = target.strip()
+    return hosts
+
+def load_hosts(path=None):
+    if not path:
+        return parse_hosts(FLEET_HOSTS)
+    with open(path, "r", encoding="utf-8") as f:
+        return {str(pi).lower(): str(t) for pi, t in json.load(f).items()}
+
+def load_iface_cache(path=IFACE_CACHE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_iface_cache(cache, path=IFACE_CACHE):
+    try:
+        live_checkpoint.atomic_write_bytes(path, json.dumps(cache, indent=1, sort_keys=True).encode("utf-8"))
+    except OSError as e:
+        print("[FLEET] cannot write {}: {}".format(path, e))
+
+# --- transport ---
+
+def ssh_argv(target, script, connect_timeout=FLEET_CONNECT_TIMEOUT_SEC):
+    return ["ssh", "-o", "BatchMode=yes", "-o", "StrictHostKeyChecking=no",
+            "-o", "ConnectTimeout={}".format(max(1, int(connect_timeout))),
+            "-o", "ControlMaster=auto", "-o", "ControlPath=" + os.path.expanduser("~/.ssh/ns-%C"),
+            "-o", "ControlPersist={}".format(FLEET_SSH_PERSIST_SEC),
+            target, "bash -c " + shlex.quote(script)]
+
+def run_remote(target, script, timeout, data=None):
+    """(exit code, output) of script on target (`data` on its stdin);
+    255 = unreachable, None = timed out."""
+    if target.startswith("local:"):
+        home = os.path.abspath(target[len("local:"):])
+        env = dict(os.environ, HOME=home, PATH=os.path.join(home, "bin") + os.pathsep + os.environ.get("PATH", ""))
+        argv = ["bash", "-c", script]
+    else:
+        env = None
+        argv = ssh_argv(target, script, min(FLEET_CONNECT_TIMEOUT_SEC, timeout))
+    if timeout <= 0:
+        return None, "host budget used up"
+    # stdin closed (or fed): a stray prompt fails instead of waiting on this terminal
+    stdin = {"stdin": subprocess.DEVNULL} if data is None else {"input": data}
+    try:
+        r = subprocess.run(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                           timeout=timeout, env=env, **stdin)
+    except subprocess.TimeoutExpired:
+        return None, "timed out after {:.0f}s".format(timeout)
+    except OSError as e:
+        return 255, str(e)
+    return r.returncode, r.stdout.decode("utf-8", "replace").strip()
+
+# --- remote scripts (one round trip per action) ---
+
+def check_iface(iface):
+    return "iwconfig {0} 2>/dev/null | grep -q 'WIFI@REALTEK' || {{ echo IFACE_STALE; exit {1}; }}\n".format(
+        shlex.quote(iface), IFACE_STALE)
+
+def monitor_script(iface, channel):
+    return check_iface(iface) + "cd {} && sudo bash set_channel.sh {} {} 2>&1".format(
+        PI_DIR, int(channel), shlex.quote(iface))
+
+def start_script(pi, iface, flags):
+    log = "/tmp/sniffer_{}.log".format(pi)
+    return check_iface(iface) + (
+        "sudo pkill -f {pattern} 2>/dev/null; sleep 0.5\n"
+        "cd {dir} && (nohup sudo python3 {sniffer} --rpi-id {pi} --iface {iface} {flags} > {log} 2>&1 &)\n"
+        "sleep 1\n"
+        "if pgrep -f {pattern} >/dev/null; then echo RUNNING; else echo NOT_RUNNING; tail -5 {log}; exit 1; fi"
+    ).format(sniffer=SNIFFER, pattern=SNIFFER_PATTERN, dir=PI_DIR, pi=shlex.quote(pi), iface=shlex.quote(iface),
+             flags=" ".join(shlex.quote(f) for f in flags), log=log)
+
+STOP_SCRIPT = "if sudo pkill -f {0} 2>/dev/null; then echo stopped; else echo nothing running; fi".format(SNIFFER_PATTERN)
+
+STATUS_SCRIPT = (
+    "echo \"iface=$({detect})\"\n"
+    "echo \"proc=$(pgrep -a -f {pattern} 2>/dev/null | head -1)\"\n"
+    "echo \"spool=$(sudo cat /root/.neuralsense_spool/stats.json 2>/dev/null | tr -d '\\n')\""
+).format(detect=DETECT, pattern=SNIFFER_PATTERN)
+
+def deploy_bundle(root=HERE):
+    """(tar.gz bytes, file count) of neuralsense_pi/ and PI_SHARED, laid out
+    as on the Pi (paths relative to its home directory)."""
+    names = ["neuralsense_pi/" + n for n in sorted(os.listdir(os.path.join(root, "neuralsense_pi")))
+             if os.path.isfile(os.path.join(root, "neuralsense_pi", n))] + list(PI_SHARED)
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        for name in names:
+            tar.add(os.path.join(root, name), arcname=name)
+    return buf.getvalue(), len(names)
+
+DEPLOY_SCRIPT = (
+    "tar -xzf - -C ~ || exit 1\n"
+    "out=$(cd {dir} && python3 -c 'import sniff_and_send_unified' 2>&1) || {{ echo \"$out\" | tail -3; exit 1; }}\n"
+    "echo DEPLOYED"
+).format(dir=PI_DIR)
+
+def sniffer_mode(proc):
+    """Start mode from the sniffer command line (runtime switches: sniffer_control.py status)."""
+    if not proc:
+        return "stopped"
+    if "--target-mac" in proc:
+        return "calibration"
+    if "--track-macs" in proc:
+        return "test"
+    return "production"
+
+# --- per-Pi actions ---
+
+def host_action(pi, target, action, opts, cached_iface):
+    """Run one action on one Pi within FLEET_HOST_TIMEOUT_SEC; returns the result dict."""
+    t0 = time.time()
+    deadline = t0 + opts["host_timeout"]
+    res = {"pi": pi, "target": target, "action": action, "ok": False, "state": "failed",
+           "iface": cached_iface, "detail": ""}
+
+    def remaining():
+        return deadline - time.time()
+
+    def finish(ok, state, detail=""):
+        res.update(ok=ok, state=state, detail=detail, elapsed_sec=round(time.time() - t0, 2))
+        return res
+
+    def failed(rc, out):
+        if rc is None:
+            return finish(False, "timeout", out)
+        if rc == 255:
+            return finish(False, "unreachable", out.splitlines()[-1] if out else "")
+        return finish(False, "failed", out)
+
+    if action == "status":
+        rc, out = run_remote(target, STATUS_SCRIPT, remaining())
+        if rc != 0:
+            return failed(rc, out)
+        fields = dict(line.partition("=")[::2] for line in out.splitlines() if "=" in line)
+        res["iface"] = fields.get("iface") or None
+        try:
+            pending = json.loads(fields.get("spool") or "null")
+            pending = pending.get("pending") if isinstance(pending, dict) else None
+        except ValueError:
+            pending = None
+        res["spool_pending"] = pending
+        mode = sniffer_mode(fields.get("proc", ""))
+        return finish(True, mode, "no REALTEK interface" if not res["iface"] else "")
+
+    if action == "deploy":
+        rc, out = run_remote(target, DEPLOY_SCRIPT, remaining(), opts["bundle"])
+        if rc != 0:
+            return failed(rc, out)
+        return finish(True, "deployed", "{} files".format(opts["bundle_files"]))
+
+    if action == "stop":
+        rc, out = run_remote(target, STOP_SCRIPT, remaining())
+        if rc != 0:
+            return failed(rc, out)
+        return finish(True, "stopped" if out == "stopped" else "idle", out)
+
+    # monitor / start-*: need the interface; cached names are checked remotely
+    for attempt in range(2):
+        iface = res["iface"]
+        if not iface:
+            rc, out = run_remote(target, DETECT, remaining())
+            if rc != 0:
+                return failed(rc, out)
+            iface = res["iface"] = out.strip() or None
+            if not iface:
+                return finish(False, "no_iface", "no REALTEK interface found")
+        if action == "monitor":
+            script = monitor_script(iface, opts["channel"])
+        else:
+            script = start_script(pi, iface, opts["flags"])
+        rc, out = run_remote(target, script, remaining())
+        if rc == IFACE_STALE and attempt == 0:
+            res["iface"] = None     # renamed after a reboot: detect again once
+            continue
+        if rc != 0:
+            return failed(rc, out)
+        if action == "monitor":
+            if "Mode:Monitor" in out:
+                return finish(True, "monitor", "channel {}".format(opts["channel"]))
+            return finish(False, "failed", out.splitlines()[-1] if out else "no Mode:Monitor in iwconfig output")
+        return finish(True, "running", opts["mode"])
+    return finish(False, "no_iface", "interface changed twice")
+
+def run_fleet(hosts, action, opts, cache, workers=FLEET_WORKERS):
+    """Run action on all hosts concurrently; results in host order, cache updated in place."""
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(hosts)))) as pool:
+        futures = [pool.submit(host_action, pi, target, action, opts, cache.get(pi))
+                   for pi, target in hosts.items()]
+        results = [f.result() for f in futures]
+    for r in results:
+        if r["iface"]:
+            cache[r["pi"]] = r["iface"]
+        elif r["state"] == "no_iface" or (action == "status" and r["ok"]):
+            cache.pop(r["pi"], None)
+    return results
+
+def print_results(results, elapsed):
+    print("{:<6} {:<22} {:<12} {:<10} {:>7}  {}".format("PI", "TARGET", "STATE", "IFACE", "SEC", "DETAIL"))
+    for r in results:
+        detail = r["detail"]
+        if r.get("spool_pending") is not None:
+            detail = "spool pending {} {}".format(r["spool_pending"], detail).strip()
+        print("{:<6} {:<22} {:<12} {:<10} {:>7.2f}  {}".format(
+            r["pi"], r["target"][:22], r["state"], r["iface"] or "-", r["elapsed_sec"],
+            detail.replace("\n", " | ")[:80]))
+    ok = sum(1 for r in results if r["ok"])
+    print("{}: {} OK, {} failed in {:.1f}s".format(results[0]["action"] if results else "-", ok,
+                                                  len(results) - ok, elapsed))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("action", choices=ACTIONS)
+    ap.add_argument("--pis", default="", help="comma-separated Pi IDs (default: all hosts)")
+    ap.add_argument("--hosts", help="JSON {rpi_id: ssh target | local:<dir>} instead of FLEET_HOSTS")
+    ap.add_argument("--channel", type=int, default=6, help="monitor: channel to set")
+    ap.add_argument("--cal-mac", default=os.getenv("CAL_MAC", CAL_PHONE_MAC),
+                    help="start-cal: calibration phone(s), comma-separated")
+    ap.add_argument("--track-macs", default=",".join(TRACK_MACS), help="start-test: MACs to publish")
+    ap.add_argument("--hash-salt", default="", help="start-prod: hash MACs with this salt")
+    ap.add_argument("--extra", default="", help="more sniffer flags, e.g. \"--channels 1,6,11 --store gangnam01\"")
+    ap.add_argument("--timeout", type=float, default=FLEET_HOST_TIMEOUT_SEC, help="per-Pi budget in seconds")
+    ap.add_argument("--workers", type=int, default=FLEET_WORKERS)
+    ap.add_argument("--refresh-ifaces", action="store_true", help="ignore cached interface names")
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    args = ap.parse_args()
+
+    hosts = load_hosts(args.hosts)
+    if args.pis:
+        wanted = [p.strip().lower() for p in args.pis.split(",") if p.strip()]
+        unknown = [p for p in wanted if p not in hosts]
+        if unknown:
+            raise SystemExit("ERROR: unknown Pi(s): " + ", ".join(unknown))
+        hosts = {p: hosts[p] for p in wanted}
+
+    flags, mode = [], ""
+    if args.action == "start-cal":
+        flags, mode = ["--target-mac", args.cal_mac], "calibration"
+    elif args.action == "start-test":
+        flags, mode = ["--track-macs", args.track_macs], "test"
+    elif args.action == "start-prod":
+        flags, mode = (["--hash-macs", "--hash-salt", args.hash_salt] if args.hash_salt else []), "production"
+    flags += shlex.split(args.extra)
+    opts = {"host_timeout": args.timeout, "channel": args.channel, "flags": flags, "mode": mode}
+    if args.action == "deploy":
+        opts["bundle"], opts["bundle_files"] = deploy_bundle()
+
+    if any(not t.startswith("local:") for t in hosts.values()):
+        os.makedirs(os.path.expanduser("~/.ssh"), mode=0o700, exist_ok=True)     # ControlPath sockets
+    cache = {} if args.refresh_ifaces else load_iface_cache()
+    t0 = time.time()
+    results = run_fleet(hosts, args.action, opts, cache, args.workers)
+    save_iface_cache(cache)
+    if args.json:
+        print(json.dumps(results, indent=1))
+    else:
+        print_results(results, time.time() - t0)
+    raise SystemExit(0 if all(r["ok"] for r in results) else 1)
+
+if __name__ == "__main__":
+    main()
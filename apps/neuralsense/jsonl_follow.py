@@ -0,0 +1,251 @@
+# jsonl_follow.py
+#
+# Followers for live assignment records, all with the same interface:
+#   read(timeout) -> list of parsed records (empty list on timeout)
+#   close()
+#
+# - FileFollower: follows a growing JSONL file. Wakes on inotify events on
+#   Linux (stat polling elsewhere), reads everything available in one go,
+#   and survives rotation (rename/recreate) and truncation.
+# - UdpFeed: receives the datagram feed run_live_geometry publishes when
+#   ASSIGN_FEED_ADDR is set (one JSON record per datagram).
+# - QueueFeed: in-process feed; pass its put() as a run_live assignment listener.
+
+import ctypes
+import ctypes.util
+import json
+import os
+import queue
+import select
+import socket
+import sys
+import time
+
+READ_CHUNK = 1 << 16
+POLL_SEC = 0.25     # stat-polling interval when inotify is unavailable
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+def parse_addr(addr):
+    """'host:port' -> (host, port); '' -> None."""
+    if not addr:
+        return None
+    host, _, port = addr.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+def _parse_lines(data):
+    out = []
+    for line in data.split(b"\n"):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            out.append(json.loads(line))
+        except Exception:
+            continue
+    return out
+
+class _Inotify:
+    """Minimal ctypes inotify wrapper; raises OSError where unsupported."""
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is Linux-only")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._rm = libc.inotify_rm_watch
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add(self, path, mask):
+        wd = self._add(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed: " + path)
+        return wd
+
+    def remove(self, wd):
+        if wd is not None and wd >= 0:
+            self._rm(self.fd, wd)
+
+    def wait(self, timeout):
+        """Block until any event or timeout; events are drained, not parsed
+        (the follower re-checks the file itself)."""
+        r, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not r:
+            return False
+        while True:
+            try:
+                if not os.read(self.fd, 4096):
+                    break
+            except BlockingIOError:
+                break
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+class FileFollower:
+    def __init__(self, path, start_at_end=True):
+        self.path = path
+        self.f = None
+        self.ino = None
+        self.tail = b""
+        self.file_wd = None
+        try:
+            self.inotify = _Inotify()
+            d = os.path.dirname(os.path.abspath(path))
+            self.inotify.add(d, IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE)
+        except (OSError, AttributeError):
+            self.inotify = None
+        self._open(seek_end=start_at_end)
+
+    def _open(self, seek_end):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        if seek_end:
+            f.seek(0, os.SEEK_END)
+        if self.f is not None:
+            self.f.close()
+        self.f = f
+        self.ino = os.fstat(f.fileno()).st_ino
+        self.tail = b""
+        if self.inotify is not None:
+            self.inotify.remove(self.file_wd)
+            try:
+                self.file_wd = self.inotify.add(self.path, IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF)
+            except OSError:
+                self.file_wd = None
+        return True
+
+    def _drain(self):
+        """Everything appended since the last read, as complete lines."""
+        if self.f is None:
+            return []
+        chunks = []
+        while True:
+            chunk = self.f.read(READ_CHUNK)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        if not chunks:
+            return []
+        data = self.tail + b"".join(chunks)
+        cut = data.rfind(b"\n") + 1
+        self.tail = data[cut:]
+        return _parse_lines(data[:cut])
+
+    def _check_rotation(self):
+        """Reopen after rename/recreate; rewind after truncation."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        if self.f is None:
+            self._open(seek_end=False)
+            return self._drain()
+        if st.st_ino != self.ino:
+            out = self._drain()             # finish the rotated-away segment
+            self._open(seek_end=False)      # new segment: read from its start
+            return out + self._drain()
+        if st.st_size < self.f.tell():      # truncated in place (copy-truncate)
+            self.f.seek(0)
+            self.tail = b""
+            return self._drain()
+        return []
+
+    def read(self, timeout):
+        deadline = time.time() + max(0.0, timeout)
+        while True:
+            out = self._drain() or self._check_rotation()
+            if out:
+                return out
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return []
+            if self.inotify is not None:
+                self.inotify.wait(remaining)
+            else:
+                time.sleep(min(POLL_SEC, remaining))
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+        if self.inotify is not None:
+            self.inotify.close()
+
+class UdpFeed:
+    def __init__(self, addr):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.sock.bind(parse_addr(addr))
+
+    def read(self, timeout):
+        r, _, _ = select.select([self.sock], [], [], max(0.0, timeout))
+        if not r:
+            return []
+        out = []
+        self.sock.setblocking(False)
+        try:
+            while True:
+                try:
+                    data = self.sock.recv(65535)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except ConnectionResetError:  # Windows: ICMP port unreachable
+                    continue
+                out.extend(_parse_lines(data))
+        finally:
+            self.sock.setblocking(True)
+        return out
+
+    def close(self):
+        self.sock.close()
+
+class QueueFeed:
+    def __init__(self, maxsize=0):
+        self.q = queue.Queue(maxsize)
+
+    def put(self, rec):
+        try:
+            self.q.put_nowait(rec)
+        except queue.Full:
+            pass
+
+    def read(self, timeout):
+        try:
+            out = [self.q.get(timeout=max(0.0, timeout))]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                out.append(self.q.get_nowait())
+            except queue.Empty:
+                return out
+
+    def close(self):
+        pass
+
+class UdpPublisher:
+    """Sender side of UdpFeed; fire-and-forget, never blocks the scorer."""
+
+    def __init__(self, addr):
+        self.addr = parse_addr(addr)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    def __call__(self, rec):
+        try:
+            self.sock.sendto(json.dumps(rec, separators=(",", ":")).encode("utf-8"), self.addr)
+        except OSError:
+            pass  # no listener / buffer full: the file output is the record of truth
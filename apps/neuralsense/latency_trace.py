@@ -0,0 +1,185 @@
+# latency_trace.py
+#
+# End-to-end latency tracing for run_live_geometry from the sniffer's capture
+# "ts" and the laptop's rx time.
+#
+# - Clock offset per Pi: d = rx_ts - pi_ts is offset + network delay, and the
+#   delay is never negative, so the minimum of d per TRACE_BUCKET_SEC bucket
+#   tracks the offset. The estimate is the median of the last OFFSET_BUCKETS
+#   bucket minima (one congested or clock-stepped bucket does not move it);
+#   drift is the Theil-Sen slope of the minima over the last DRIFT_BUCKETS
+#   (reported from DRIFT_MIN_BUCKETS on).
+# - Network lag = d - offset, histogrammed per Pi per report interval, plus
+#   the share of messages already older than PER_PI_FRESH_SEC on arrival.
+# - Confident assignments are split into network (capture -> rx), queue
+#   (rx -> scorer, admission intake) and scoring stages; p50/p90/p99 of each
+#   and of capture -> assignment over the last WINDOW_ASSIGN assignments.
+# - Every LATENCY_TRACE_SEC one record goes to latency_trace.jsonl and a
+#   [TRACE] summary is printed; Pis are flagged "lagging" (lag p90 above
+#   TRACE_LAG_WARN_SEC), "drifting" (|drift| above TRACE_DRIFT_WARN_PPM) or
+#   "stepped" (a bucket minimum TRACE_STEP_SEC away from the estimate).
+
+import math
+from collections import deque
+
+import numpy as np
+
+from config import (LATENCY_TRACE_SEC, TRACE_BUCKET_SEC, TRACE_LAG_WARN_SEC, TRACE_DRIFT_WARN_PPM,
+                    TRACE_STEP_SEC, PER_PI_FRESH_SEC)
+
+LAG_BINS_MS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)     # upper edges; one open bucket above
+OFFSET_BUCKETS = 5
+DRIFT_BUCKETS = 30
+DRIFT_MIN_BUCKETS = 10  # fewer minima give slopes dominated by delay noise
+WINDOW_LAG = 2000       # recent lags per Pi for percentiles
+WINDOW_ASSIGN = 10000
+STAGES = ("network", "queue", "score", "total")
+
+def theil_sen(xs, ys):
+    """Median pairwise slope; None with fewer than two distinct x."""
+    slopes = [(ys[j] - ys[i]) / (xs[j] - xs[i])
+              for i in range(len(xs)) for j in range(i + 1, len(xs)) if xs[j] != xs[i]]
+    return float(np.median(slopes)) if slopes else None
+
+class PiClock:
+    """Offset / drift / lag state of one Pi."""
+
+    def __init__(self, bucket_sec=TRACE_BUCKET_SEC):
+        self.bucket_sec = bucket_sec
+        self.bucket = None
+        self.bucket_min = math.inf
+        self.minima = deque(maxlen=DRIFT_BUCKETS)   # (bucket start, min d)
+        self.offset = None
+        self.drift_ppm = None
+        self.steps = 0          # clock steps seen this interval
+        self.hist = [0] * (len(LAG_BINS_MS) + 1)
+        self.lags = deque(maxlen=WINDOW_LAG)
+        self.msgs = 0
+        self.stale = 0
+
+    def _close_bucket(self):
+        m = self.bucket_min
+        if self.offset is not None and abs(m - self.offset) > TRACE_STEP_SEC:
+            self.steps += 1
+        self.minima.append((self.bucket * self.bucket_sec, m))
+        recent = [v for _, v in list(self.minima)[-OFFSET_BUCKETS:]]
+        self.offset = float(np.median(recent))
+        if len(self.minima) >= DRIFT_MIN_BUCKETS:
+            slope = theil_sen([t for t, _ in self.minima], [v for _, v in self.minima])
+            self.drift_ppm = slope * 1e6 if slope is not None else None
+
+    def observe(self, pi_ts, rx_ts, fresh_sec):
+        """Returns the network lag (sec) of this message."""
+        d = rx_ts - pi_ts
+        b = int(rx_ts // self.bucket_sec)
+        if b != self.bucket:
+            if self.bucket is not None:
+                self._close_bucket()
+            self.bucket = b
+            self.bucket_min = d
+        elif d < self.bucket_min:
+            self.bucket_min = d
+        offset = self.offset if self.offset is not None else self.bucket_min
+        lag = max(0.0, d - offset)
+        ms = lag * 1000.0
+        i = 0
+        while i < len(LAG_BINS_MS) and ms > LAG_BINS_MS[i]:
+            i += 1
+        self.hist[i] += 1
+        self.lags.append(lag)
+        self.msgs += 1
+        if lag > fresh_sec:
+            self.stale += 1
+        return lag
+
+    def capture_time(self, pi_ts):
+        """pi_ts on the laptop clock (None before the first estimate)."""
+        if self.offset is not None:
+            return pi_ts + self.offset
+        return pi_ts + self.bucket_min if self.bucket is not None else None
+
+    def reset_interval(self):
+        self.steps = 0
+        self.hist = [0] * len(self.hist)
+        self.msgs = 0
+        self.stale = 0
+
+def percentiles(values):
+    if not values:
+        return None
+    p = np.percentile(np.fromiter(values, dtype=np.float64, count=len(values)), (50, 90, 99)) * 1000.0
+    return {"p50": round(float(p[0]), 1), "p90": round(float(p[1]), 1), "p99": round(float(p[2]), 1)}
+
+class LatencyTracer:
+    """Per-store tracer; emit(rec) receives each interval record."""
+
+    def __init__(self, emit=None, report_sec=LATENCY_TRACE_SEC, fresh_sec=PER_PI_FRESH_SEC, tag=""):
+        self.emit = emit
+        self.report_sec = report_sec
+        self.fresh_sec = fresh_sec
+        self.tag = tag
+        self.clocks = {}
+        self.stages = {s: deque(maxlen=WINDOW_ASSIGN) for s in STAGES}
+        self.next_report = None
+
+    def observe(self, rpi_id, pi_ts, rx_ts):
+        clock = self.clocks.get(rpi_id)
+        if clock is None:
+            clock = self.clocks[rpi_id] = PiClock()
+        return clock.observe(pi_ts, rx_ts, self.fresh_sec)
+
+    def assignment(self, rpi_id, pi_ts, rx_ts, start_ts, done_ts):
+        """Stage latencies of one assignment triggered by this Pi's message."""
+        clock = self.clocks.get(rpi_id)
+        capture = clock.capture_time(pi_ts) if clock is not None else None
+        if capture is None:
+            return
+        self.stages["network"].append(max(0.0, rx_ts - capture))
+        self.stages["queue"].append(max(0.0, start_ts - rx_ts))
+        self.stages["score"].append(done_ts - start_ts)
+        self.stages["total"].append(max(0.0, done_ts - capture))
+
+    def maybe_report(self, now_ts):
+        if self.next_report is None:
+            self.next_report = now_ts + self.report_sec
+        elif now_ts >= self.next_report:
+            self.next_report = now_ts + self.report_sec
+            self.report(now_ts)
+
+    def report(self, now_ts):
+        pis = {}
+        for pi in sorted(self.clocks):
+            c = self.clocks[pi]
+            lag = percentiles(c.lags)
+            flags = []
+            if lag is not None and lag["p90"] > TRACE_LAG_WARN_SEC * 1000.0:
+                flags.append("lagging")
+            if c.drift_ppm is not None and abs(c.drift_ppm) > TRACE_DRIFT_WARN_PPM:
+                flags.append("drifting")
+            if c.steps:
+                flags.append("stepped")
+            pis[pi] = {
+                "offset_sec": round(c.offset, 4) if c.offset is not None else None,
+                "drift_ppm": round(c.drift_ppm, 1) if c.drift_ppm is not None else None,
+                "lag_ms": lag,
+                "lag_hist": c.hist,
+                "msgs": c.msgs,
+                "stale_on_arrival": round(c.stale / c.msgs, 4) if c.msgs else 0.0,
+                "flags": flags,
+            }
+            c.reset_interval()
+        rec = {
+            "ts": now_ts,
+            "lag_bins_ms": list(LAG_BINS_MS),
+            "pis": pis,
+            "assign_latency_ms": {s: percentiles(v) for s, v in self.stages.items()},
+        }
+        total = rec["assign_latency_ms"]["total"]
+        print(self.tag + "[TRACE] capture->assignment {} | ".format(
+            "p50={p50}ms p90={p90}ms p99={p99}ms".format(**total) if total else "n/a") + " ".join(
+            "{}:{}{}".format(pi, "-" if p["lag_ms"] is None else "{:.0f}ms".format(p["lag_ms"]["p90"]),
+                             "(" + ",".join(p["flags"]) + ")" if p["flags"] else "")
+            for pi, p in pis.items()))
+        if self.emit is not None:
+            self.emit(rec)
+        return rec
@@ -0,0 +1,207 @@
+# live_checkpoint.py
+#
+# Crash-consistent snapshots of run_live_geometry tracking state.
+#
+# - Snapshot = one pickle blob of typed-array columns (fast to load for
+#   hundreds of thousands of MACs), written to <path>.tmp, fsynced, then
+#   os.replace()d over <path>. A crash mid-write leaves the previous snapshot.
+# - Session IDs are handed out under a lease: before next_sid passes the
+#   leased limit, a new limit is persisted. On restart next_sid resumes at
+#   max(snapshot next_sid, lease), so IDs never collide even if the last
+#   snapshot is older than the crash.
+
+import gc
+import os
+import pickle
+import threading
+import time
+from array import array
+
+SNAPSHOT_VERSION = 2
+SID_LEASE_BLOCK = 1000
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return  # not supported (e.g. Windows)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def atomic_write_bytes(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+def _arr(typecode, data):
+    a = array(typecode)
+    a.frombytes(data)
+    return a
+
+def copy_tables(saved_ts, next_sid, state, pending, sessions, buf):
+    """Shallow copy of the live tables, taken between messages so the snapshot
+    is consistent. `sessions` is already a copy (SessionTable.columns()), so
+    only the containers and deques are copied."""
+    return (saved_ts, next_sid, dict(state), dict(pending), sessions,
+            {key: list(d) for key, d in buf.items() if d})
+
+def snapshot_bytes(saved_ts, next_sid, state, pending, sessions, buf):
+    """Serialize the live tables (or a copy_tables() result) to bytes.
+
+    Per-MAC and per-session columns are packed into typed arrays (struct of
+    arrays) so loading does not allocate one Python object per field; the
+    session table columns (device_table.SessionTable) are stored as is.
+    """
+    sids = sessions["sids"]
+    sid_index = {sid: i for i, sid in enumerate(sids)}
+    state_zone = array("i")
+    state_enter = array("d")
+    for sid in sids:
+        zone, enter_ts = state.get(sid, (-1, 0.0))
+        state_zone.append(int(zone))
+        state_enter.append(float(enter_ts))
+
+    blob = {
+        "version": SNAPSHOT_VERSION,
+        "saved_ts": saved_ts,
+        "next_sid": next_sid,
+        "pis": sessions["pis"],
+        "sids": sids,
+        "sid_ts": sessions["sess_ts"].tobytes(),
+        "ranks": sessions["ranks"].tobytes(),
+        "state_zone": state_zone.tobytes(),
+        "state_enter": state_enter.tobytes(),
+        "pending": {sid: p for sid, p in pending.items() if sid in sid_index},
+        "macs": sessions["keys"],
+        "mac_sid": sessions["mac_row"].astype("int32").tobytes(),
+        "mac_ts": sessions["mac_ts"].tobytes(),
+        "buf": {key: list(d) for key, d in buf.items() if d},
+    }
+    return pickle.dumps(blob, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_snapshot(path, now_ts, session_max_age_sec, window_sec):
+    """Load a snapshot and drop everything too old to matter at now_ts.
+    Returns None when there is no usable snapshot (missing, or written by an
+    older version: those restart cold, session IDs still come from the lease)."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()  # bulk allocation of acyclic containers; GC passes only cost time here
+    try:
+        blob = pickle.loads(data)
+        if not isinstance(blob, dict) or blob.get("version") != SNAPSHOT_VERSION:
+            return None
+
+        session_cutoff = now_ts - session_max_age_sec
+        sids = blob["sids"]
+        sid_ts = _arr("d", blob["sid_ts"])
+        width = len(blob["pis"])
+        ranks = blob["ranks"]
+        state_zone = _arr("i", blob["state_zone"])
+        state_enter = _arr("d", blob["state_enter"])
+
+        new_row = [-1] * len(sids)
+        kept_sids = []
+        kept_ts = array("d")
+        kept_ranks = bytearray()
+        state = {}
+        for i, sid in enumerate(sids):
+            if sid_ts[i] >= session_cutoff:
+                new_row[i] = len(kept_sids)
+                kept_sids.append(sid)
+                kept_ts.append(sid_ts[i])
+                kept_ranks += ranks[i * width:(i + 1) * width]
+                if state_zone[i] >= 0:
+                    state[sid] = (state_zone[i], state_enter[i])
+
+        keys = []
+        mac_row = array("i")
+        mac_ts = array("d")
+        for key, i, ts in zip(blob["macs"], _arr("i", blob["mac_sid"]), _arr("d", blob["mac_ts"])):
+            if new_row[i] >= 0:
+                keys.append(key)
+                mac_row.append(new_row[i])
+                mac_ts.append(ts)
+        kept = set(kept_sids)
+        pending = {sid: p for sid, p in blob["pending"].items() if sid in kept}
+
+        window_cutoff = now_ts - window_sec
+        buf = {}
+        for key, events in blob["buf"].items():
+            if events and events[-1][0] >= window_cutoff:
+                buf[key] = [e for e in events if e[0] >= window_cutoff]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    return {
+        "saved_ts": blob["saved_ts"],
+        "next_sid": int(blob["next_sid"]),
+        "state": state,
+        "pending": pending,
+        "sessions": {"pis": blob["pis"], "keys": keys, "mac_row": mac_row, "mac_ts": mac_ts,
+                     "sids": kept_sids, "sess_ts": kept_ts, "ranks": bytes(kept_ranks)},
+        "buf": buf,
+        "dropped_sessions": len(sids) - len(kept_sids),
+    }
+
+def read_sid_lease(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def write_sid_lease(path, value):
+    atomic_write_bytes(path, str(int(value)).encode("ascii"))
+
+class SnapshotWriter:
+    """Encodes and writes copy_tables() snapshots on a background thread; at
+    most one write in flight (a tick that finds the writer busy is skipped)."""
+
+    def __init__(self, path, on_error=None):
+        self.path = path
+        self.on_error = on_error
+        self._thread = None
+        self.last_write_sec = 0.0
+        self.last_size = 0
+
+    def busy(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, tables):
+        if self.busy():
+            return False
+        self._thread = threading.Thread(target=self._write, args=(tables,), daemon=True)
+        self._thread.start()
+        return True
+
+    def flush(self, tables):
+        """Synchronous write (shutdown path)."""
+        if self._thread is not None:
+            self._thread.join()
+        self._write(tables)
+
+    def _write(self, tables):
+        t0 = time.perf_counter()
+        try:
+            data = snapshot_bytes(*tables)
+            atomic_write_bytes(self.path, data)
+        except Exception as e:
+            if self.on_error is not None:
+                self.on_error("checkpoint_write", e)
+            return
+        self.last_write_sec = time.perf_counter() - t0
+        self.last_size = len(data)
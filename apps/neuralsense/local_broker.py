@@ -0,0 +1,230 @@
+# local_broker.py
+#
+# Minimal MQTT 3.1.1 broker for offline runs (soak_test.py, bench setups
+# without mosquitto). Enough of the protocol for paho publishers and
+# subscribers: CONNECT, PUBLISH (QoS 0/1/2 in, always QoS 0 out), SUBSCRIBE
+# with +/# filters, UNSUBSCRIBE, PINGREQ, DISCONNECT. No retained messages,
+# sessions, auth or will.
+#
+# - One reader thread per connection; each subscriber has its own bounded
+#   outbound queue and writer thread, so a slow subscriber drops messages
+#   (counted, like mosquitto's queue limit) instead of stalling publishers.
+# - stats() returns received / forwarded / dropped counts.
+#
+# Usage:
+#   python local_broker.py                  # 127.0.0.1:1883
+#   python local_broker.py --port 18830 --host 0.0.0.0
+
+import argparse
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+from config import LOCAL_BROKER_QUEUE_MAX
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+def encode_length(n):
+    out = bytearray()
+    while True:
+        b, n = n % 128, n // 128
+        out.append(b | 0x80 if n else b)
+        if not n:
+            return bytes(out)
+
+def read_exact(f, n):
+    data = f.read(n)
+    if data is None or len(data) < n:
+        raise EOFError
+    return data
+
+def read_packet(f):
+    """(type, flags, body) of the next packet; EOFError when the peer is gone."""
+    b = read_exact(f, 1)[0]
+    length, mult = 0, 1
+    while True:
+        d = read_exact(f, 1)[0]
+        length += (d & 0x7F) * mult
+        if not d & 0x80:
+            break
+        mult *= 128
+    return b >> 4, b & 0x0F, read_exact(f, length) if length else b""
+
+def utf8_field(body, i):
+    n = struct.unpack_from("!H", body, i)[0]
+    return body[i + 2:i + 2 + n].decode("utf-8"), i + 2 + n
+
+class Subscriber:
+    """Outbound side of one connection: bounded queue + writer thread."""
+
+    def __init__(self, sock, max_queue):
+        self.sock = sock
+        self.filters = set()
+        self.queue = deque()
+        self.max_queue = max_queue
+        self.cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+        self.forwarded = 0
+        self.thread = threading.Thread(target=self._run, name="broker-out", daemon=True)
+        self.thread.start()
+
+    def send(self, packet, control=False):
+        """Queue one packet; PUBLISH copies are dropped when the queue is full."""
+        with self.cond:
+            if self.closed:
+                return
+            if not control:
+                if len(self.queue) >= self.max_queue:
+                    self.dropped += 1
+                    return
+                self.forwarded += 1
+            self.queue.append(packet)
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                batch = b"".join(self.queue)
+                self.queue.clear()
+            try:
+                self.sock.sendall(batch)
+            except OSError:
+                self.close()
+                return
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+class LocalBroker:
+    def __init__(self, host="127.0.0.1", port=0, max_queue=LOCAL_BROKER_QUEUE_MAX):
+        self.server = socket.create_server((host, port))
+        self.host = host
+        self.port = self.server.getsockname()[1]
+        self.max_queue = max_queue
+        self.lock = threading.Lock()
+        self.subs = []
+        self.received = 0
+        self.gone = {"forwarded": 0, "dropped": 0}   # totals of closed connections
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._accept, name="broker-accept", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+        try:
+            self.server.close()
+        except OSError:
+            pass
+
+    def stats(self):
+        with self.lock:
+            live = list(self.subs)
+            fwd = self.gone["forwarded"] + sum(s.forwarded for s in live)
+            drop = self.gone["dropped"] + sum(s.dropped for s in live)
+            return {"received": self.received, "forwarded": fwd, "dropped": drop, "clients": len(live)}
+
+    def _accept(self):
+        while self.running:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(sock,), name="broker-in", daemon=True).start()
+
+    def _route(self, topic, payload):
+        packet = None
+        with self.lock:
+            self.received += 1
+            targets = [s for s in self.subs if any(mqtt.topic_matches_sub(f, topic) for f in s.filters)]
+        for s in targets:
+            if packet is None:
+                t = topic.encode("utf-8")
+                body = struct.pack("!H", len(t)) + t + payload
+                packet = bytes([PUBLISH << 4]) + encode_length(len(body)) + body
+            s.send(packet)
+
+    def _serve(self, sock):
+        sub = Subscriber(sock, self.max_queue)
+        with self.lock:
+            self.subs.append(sub)
+        f = sock.makefile("rb")
+        try:
+            while True:
+                ptype, flags, body = read_packet(f)
+                if ptype == PUBLISH:
+                    qos = (flags >> 1) & 3
+                    topic, i = utf8_field(body, 0)
+                    if qos:
+                        pid = body[i:i + 2]
+                        i += 2
+                        sub.send(bytes([(PUBACK if qos == 1 else PUBREC) << 4, 2]) + pid, control=True)
+                    self._route(topic, body[i:])
+                elif ptype == CONNECT:
+                    sub.send(bytes([CONNACK << 4, 2, 0, 0]), control=True)
+                elif ptype == SUBSCRIBE:
+                    pid, i, granted = body[:2], 2, bytearray()
+                    while i < len(body):
+                        flt, i = utf8_field(body, i)
+                        i += 1      # requested QoS; everything is delivered at 0
+                        sub.filters.add(flt)
+                        granted.append(0)
+                    sub.send(bytes([SUBACK << 4, 2 + len(granted)]) + pid + bytes(granted), control=True)
+                elif ptype == UNSUBSCRIBE:
+                    i = 2
+                    while i < len(body):
+                        flt, i = utf8_field(body, i)
+                        sub.filters.discard(flt)
+                    sub.send(bytes([UNSUBACK << 4, 2]) + body[:2], control=True)
+                elif ptype == PUBREL:
+                    sub.send(bytes([PUBCOMP << 4, 2]) + body[:2], control=True)
+                elif ptype == PINGREQ:
+                    sub.send(bytes([PINGRESP << 4, 0]), control=True)
+                elif ptype == DISCONNECT:
+                    break
+        except (EOFError, OSError, ValueError, struct.error):
+            pass
+        finally:
+            sub.close()
+            with self.lock:
+                self.subs.remove(sub)
+                self.gone["forwarded"] += sub.forwarded
+                self.gone["dropped"] += sub.dropped
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=1883)
+    ap.add_argument("--stats-sec", type=float, default=10.0)
+    args = ap.parse_args()
+    broker = LocalBroker(args.host, args.port).start()
+    print("[BROKER] listening on {}:{}".format(args.host, broker.port))
+    try:
+        while True:
+            time.sleep(args.stats_sec)
+            print("[BROKER] received={received} forwarded={forwarded} dropped={dropped} clients={clients}".format(
+                **broker.stats()))
+    except KeyboardInterrupt:
+        broker.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# mac_filter.py
+#
+# Early classifier for non-shopper MACs, used on the Pi (sniff_and_send_unified)
+# and centrally (run_live_geometry) before anything is buffered or scored.
+#
+# - Group addresses: the I/G bit of the first octet marks broadcast and
+#   multicast (IPv4 01:00:5e, IPv6 33:33, locally administered multicast).
+#   They never transmit, they only appear as addr1/addr3. Randomized phone MACs
+#   are locally administered *unicast* and are kept.
+# - PiFilter: BSSIDs learned from beacon / probe-response frames are not
+#   published; [FILTER] prints the share of addresses removed.
+# - MacFilter: rolling denylist checked per message. A device whose confident
+#   assignments stay in one zone (MACFILTER_STATIC_SHARE of them) for
+#   MACFILTER_STATIC_DAYS with no gap over MACFILTER_GAP_SEC (printers, POS
+#   terminals, APs heard in data frames) is added with reason "static";
+#   entries expire MACFILTER_DENY_TTL_SEC after their last message.
+#   MACFILTER_DENY entries are permanent, TRACK_MACS are never denied. Denylist
+#   and long-running candidates persist in mac_denylist.json, so detection
+#   spans restarts.
+
+import json
+import os
+
+import live_checkpoint
+from config import (MACFILTER_STATIC_DAYS, MACFILTER_STATIC_SHARE, MACFILTER_GAP_SEC, MACFILTER_DENY_TTL_SEC,
+                    MACFILTER_DENY, MACFILTER_MAX_BSSIDS, TRACK_MACS)
+
+STATE_VERSION = 1
+SHORT_SPAN_SEC = 3600.0     # candidates seen for less than this are dropped after this much idle
+PRUNE_SEC = 600.0
+SAVE_SEC = 300.0
+BEACON_SUBTYPES = (5, 8)    # management: probe response, beacon
+
+def is_group(mac):
+    """True for broadcast/multicast MACs ("aa:bb:..." form; hashed IDs never are)."""
+    if len(mac) != 17 or mac[2] != ":":
+        return False
+    try:
+        return bool(int(mac[:2], 16) & 1)
+    except ValueError:
+        return False
+
+class PiFilter:
+    """Sniffer-side filter: group addresses and learned BSSIDs."""
+
+    def __init__(self, max_bssids=MACFILTER_MAX_BSSIDS):
+        self.bssids = set()
+        self.max_bssids = max_bssids
+        self.counts = {"seen": 0, "group": 0, "bssid": 0}
+
+    def learn_frame(self, ftype, subtype, bssid):
+        if ftype == 0 and subtype in BEACON_SUBTYPES and bssid and len(self.bssids) < self.max_bssids:
+            self.bssids.add(bssid.lower())
+
+    def keep(self, mac):
+        self.counts["seen"] += 1
+        if is_group(mac):
+            self.counts["group"] += 1
+            return False
+        if mac in self.bssids:
+            self.counts["bssid"] += 1
+            return False
+        return True
+
+    def summary(self):
+        c = self.counts
+        removed = c["group"] + c["bssid"]
+        return "seen={} group={} bssid={} removed={:.1%} | {} BSSIDs learned".format(
+            c["seen"], c["group"], c["bssid"], removed / c["seen"] if c["seen"] else 0.0, len(self.bssids))
+
+class MacFilter:
+    """Central filter: group addresses + rolling denylist of static devices."""
+
+    def __init__(self, path=None, static_days=MACFILTER_STATIC_DAYS, static_share=MACFILTER_STATIC_SHARE,
+                 gap_sec=MACFILTER_GAP_SEC, deny_ttl_sec=MACFILTER_DENY_TTL_SEC, manual=MACFILTER_DENY,
+                 exempt=TRACK_MACS, tag=""):
+        self.path = path
+        self.static_sec = static_days * 86400.0
+        self.static_share = static_share
+        self.gap_sec = gap_sec
+        self.deny_ttl_sec = deny_ttl_sec
+        self.exempt = set(exempt)
+        self.tag = tag
+        self.deny = {}          # mac -> [reason, since, last_seen, zone]
+        self.candidates = {}    # mac -> [first_ts, last_ts, {zone: confident assignments}]
+        for mac in manual:
+            if mac in self.exempt:
+                print(self.tag + "[FILTER] {} is in TRACK_MACS, ignoring its MACFILTER_DENY entry".format(mac))
+                continue
+            self.deny[mac] = ["manual", 0.0, 0.0, None]
+        self.counts = {"seen": 0, "group": 0, "denylist": 0}
+        self.next_prune = None
+        self.next_save = None
+        if path is not None:
+            self.load(path)
+
+    def check(self, mac, ts):
+        """Reason to drop this message, or None to score it."""
+        self.counts["seen"] += 1
+        if is_group(mac):
+            self.counts["group"] += 1
+            return "group"
+        entry = self.deny.get(mac)
+        if entry is not None:
+            entry[2] = ts
+            self.counts["denylist"] += 1
+            return entry[0]
+        return None
+
+    def observe_assignment(self, mac, zone_id, ts):
+        """Feed one confident assignment; denylists the device once static."""
+        if mac in self.exempt or mac in self.deny:
+            return
+        c = self.candidates.get(mac)
+        if c is None or ts - c[1] > self.gap_sec:
+            c = self.candidates[mac] = [ts, ts, {}]
+        c[1] = ts
+        zones = c[2]
+        zones[zone_id] = zones.get(zone_id, 0) + 1
+        if ts - c[0] < self.static_sec:
+            return
+        n = sum(zones.values())
+        zone, top = max(zones.items(), key=lambda kv: kv[1])
+        if top >= self.static_share * n:
+            del self.candidates[mac]
+            self.deny[mac] = ["static", ts, ts, zone]
+            print(self.tag + "[FILTER] {} static in zone {} for {:.1f} days ({} assignments) -> denylist".format(
+                mac, zone, (ts - c[0]) / 86400.0, n))
+
+    def tick(self, now_ts):
+        """Prune idle candidates / expired entries and save, at most every PRUNE_SEC / SAVE_SEC."""
+        if self.next_prune is None:
+            self.next_prune = now_ts + PRUNE_SEC
+            self.next_save = now_ts + SAVE_SEC
+        if now_ts >= self.next_prune:
+            self.next_prune = now_ts + PRUNE_SEC
+            self.prune(now_ts)
+        if self.path is not None and now_ts >= self.next_save:
+            self.next_save = now_ts + SAVE_SEC
+            self.save()
+
+    def prune(self, now_ts):
+        for mac in [m for m, (first, last, _) in self.candidates.items()
+                    if now_ts - last > self.gap_sec or (last - first < SHORT_SPAN_SEC and now_ts - last > SHORT_SPAN_SEC)]:
+            del self.candidates[mac]
+        for mac in [m for m, e in self.deny.items() if e[0] != "manual" and now_ts - e[2] > self.deny_ttl_sec]:
+            del self.deny[mac]
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                st = json.load(f)
+        except Exception as e:
+            print(self.tag + "[FILTER] cannot read {}: {}".format(path, e))
+            return
+        if st.get("version") != STATE_VERSION:
+            return
+        for mac, e in st.get("deny", {}).items():
+            if mac not in self.exempt:      # tracked since the file was saved
+                self.deny.setdefault(mac, e)
+        for mac, (first, last, zones) in st.get("candidates", {}).items():
+            self.candidates[mac] = [first, last, {int(z): n for z, n in zones.items()}]
+        print(self.tag + "[FILTER] {} denylisted, {} static candidates from {}".format(
+            len(self.deny), len(self.candidates), path))
+
+    def save(self):
+        """Denylist and candidates seen for at least SHORT_SPAN_SEC (others are shoppers)."""
+        st = {
+            "version": STATE_VERSION,
+            "deny": {mac: e for mac, e in self.deny.items() if e[0] != "manual"},
+            "candidates": {mac: c for mac, c in self.candidates.items() if c[1] - c[0] >= SHORT_SPAN_SEC},
+        }
+        try:
+            live_checkpoint.atomic_write_bytes(self.path, json.dumps(st, separators=(",", ":")).encode("utf-8"))
+        except OSError as e:
+            print(self.tag + "[FILTER] cannot write {}: {}".format(self.path, e))
+
+    def removed(self):
+        return self.counts["group"] + self.counts["denylist"]
+
+    def summary(self):
+        c = self.counts
+        return "group={} denylist={} removed={:.1%} | {} denylisted, {} candidates".format(
+            c["group"], c["denylist"], self.removed() / c["seen"] if c["seen"] else 0.0,
+            len(self.deny), len(self.candidates))
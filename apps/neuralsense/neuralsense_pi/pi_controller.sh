@@ -7,10 +7,15 @@
 #   bash pi_controller.sh start-test           Start sniffers in TEST mode
 #   bash pi_controller.sh stop                 Stop all sniffers
 #   bash pi_controller.sh status               Check which Pis are reachable + sniffer running
+#   bash pi_controller.sh mode <mode>          Switch running sniffers (production|calibration|test) over MQTT
+#   bash pi_controller.sh health               Mode, counters and spool of running sniffers (MQTT status)
+#   bash pi_controller.sh deploy               Copy neuralsense_pi/ + the shared modules it imports to all Pis
 
 # ── Config ──────────────────────────────────────────────────
 CHANNEL="${2:-6}"
-CAL_MAC="a8:76:50:e9:28:20"
+MODE="${2:-}"
+# Calibration phone(s); comma-separated to calibrate several zones at once
+CAL_MAC="${CAL_MAC:-a8:76:50:e9:28:20}"
 TRACK_MACS="b0:54:76:5c:99:d5,24:24:b7:19:30:0a,a8:76:50:e9:28:20"
 
 PI_IDS=(pi10 pi5 pi7 pi8 pi9 pi11 pi12 pi13)
@@ -44,6 +49,40 @@ detect_realtek() {
 
 # ── Commands ────────────────────────────────────────────────
 
+# The sniffer imports these from one level up (the Pi's home directory);
+# same list as PI_SHARED in fleet_controller.py
+PI_SHARED="config.py mac_filter.py live_checkpoint.py sniffer_control.py stack_sampler.py"
+
+cmd_deploy() {
+    echo "============================================"
+    echo "  Deploying sniffer code"
+    echo "============================================"
+    echo ""
+
+    local root
+    root="$(cd "$(dirname "$0")/.." && pwd)"
+
+    for pi in "${PI_IDS[@]}"; do
+        local target="${PI_SSH[$pi]}"
+        echo -n "$pi: "
+
+        # Unpack into ~ and import the sniffer (not started) to catch a missing module
+        local output
+        output=$(tar -czf - -C "$root" --exclude=__pycache__ neuralsense_pi $PI_SHARED | run_ssh "$target" \
+            "tar -xzf - -C ~ && cd ~/neuralsense_pi && python3 -c 'import sniff_and_send_unified' 2>&1")
+
+        if [ $? -eq 0 ]; then
+            echo "OK"
+        else
+            echo "FAIL"
+            echo "$output" | tail -3
+        fi
+    done
+
+    echo ""
+    echo "Restart the sniffers (start-cal / start-test) to run the new code."
+}
+
 cmd_monitor() {
     echo "============================================"
     echo "  Setting monitor mode — channel $CHANNEL"
@@ -119,7 +158,7 @@ cmd_start_cal() {
 
     echo ""
     echo "All calibration sniffers started."
-    echo "Now run: python calibrate_interactive_geometry.py"
+    echo "Now run: python calibrate_interactive_geometry.py --phones $CAL_MAC"
 }
 
 cmd_start_test() {
@@ -184,8 +223,8 @@ cmd_status() {
     echo "============================================"
     echo ""
 
-    printf "%-6s  %-20s  %-8s  %-10s  %s\n" "PI" "SSH" "PING" "IFACE" "SNIFFER"
-    printf "%-6s  %-20s  %-8s  %-10s  %s\n" "------" "--------------------" "--------" "----------" "----------"
+    printf "%-6s  %-20s  %-8s  %-10s  %-10s  %s\n" "PI" "SSH" "PING" "IFACE" "SNIFFER" "SPOOLED"
+    printf "%-6s  %-20s  %-8s  %-10s  %-10s  %s\n" "------" "--------------------" "--------" "----------" "----------" "-------"
 
     for pi in "${PI_IDS[@]}"; do
         local target="${PI_SSH[$pi]}"
@@ -200,6 +239,7 @@ cmd_status() {
 
         local iface="-"
         local sniffer="-"
+        local spooled="-"
 
         if [ "$reachable" = "YES" ]; then
             iface=$(detect_realtek "$target" 2>/dev/null)
@@ -218,12 +258,34 @@ cmd_status() {
             else
                 sniffer="stopped"
             fi
+
+            # Messages waiting in the outage spool (sniffer runs as root)
+            spooled=$(run_ssh "$target" "sudo cat /root/.neuralsense_spool/stats.json 2>/dev/null" 2>/dev/null \
+                | grep -o '"pending": [0-9]*' | grep -o '[0-9]*')
+            [ -z "$spooled" ] && spooled="-"
         fi
 
-        printf "%-6s  %-20s  %-8s  %-10s  %s\n" "$pi" "$target" "$reachable" "$iface" "$sniffer"
+        printf "%-6s  %-20s  %-8s  %-10s  %-10s  %s\n" "$pi" "$target" "$reachable" "$iface" "$sniffer" "$spooled"
     done
 }
 
+# Runtime switches go through the resident sniffers' control topic (no restart);
+# sniffer_control.py lives next to config.py, one level up
+SNIFFER_CONTROL="$(dirname "$0")/../sniffer_control.py"
+
+cmd_mode() {
+    case "$MODE" in
+        production)  python3 "$SNIFFER_CONTROL" set --mode production ;;
+        calibration) python3 "$SNIFFER_CONTROL" set --mode calibration --target-macs "$CAL_MAC" ;;
+        test)        python3 "$SNIFFER_CONTROL" set --mode test --track-macs "$TRACK_MACS" ;;
+        *)           echo "Usage: bash pi_controller.sh mode <production|calibration|test>"; return 1 ;;
+    esac
+}
+
+cmd_health() {
+    python3 "$SNIFFER_CONTROL" status
+}
+
 cmd_help() {
     echo "pi_controller.sh — NeuralSense Pi Fleet Controller"
     echo ""
@@ -233,8 +295,12 @@ cmd_help() {
     echo "  bash pi_controller.sh start-test           Start test sniffers"
     echo "  bash pi_controller.sh stop                 Stop all sniffers"
     echo "  bash pi_controller.sh status               Check fleet status"
+    echo "  bash pi_controller.sh mode <mode>          Switch running sniffers: production|calibration|test"
+    echo "  bash pi_controller.sh health               Live mode/counters reported by the sniffers"
+    echo "  bash pi_controller.sh deploy               Copy the sniffer code to all Pis"
     echo ""
     echo "Typical workflow:"
+    echo "  0. bash pi_controller.sh deploy            (after pulling new code)"
     echo "  1. bash pi_controller.sh monitor"
     echo "  2. bash pi_controller.sh start-cal"
     echo "     python calibrate_interactive_geometry.py"
@@ -242,6 +308,12 @@ cmd_help() {
     echo "     python run_live_geometry.py"
     echo "     python accuracy_test_from_zone_assignments.py"
     echo "  4. bash pi_controller.sh stop"
+    echo ""
+    echo "All Pis in parallel (per-Pi timeouts, cached interfaces):"
+    echo "  python ../fleet_controller.py monitor|start-cal|start-test|start-prod|stop|status|deploy"
+    echo ""
+    echo "Sniffers keep running between steps: once started, 'mode calibration' /"
+    echo "'mode test' / 'mode production' switch them in milliseconds."
 }
 
 # ── Main ────────────────────────────────────────────────────
@@ -255,5 +327,8 @@ case "${1:-help}" in
     start-test) cmd_start_test ;;
     stop)       cmd_stop ;;
     status)     cmd_status ;;
+    mode)       cmd_mode ;;
+    health)     cmd_health ;;
+    deploy)     cmd_deploy ;;
     help|*)     cmd_help ;;
 esac
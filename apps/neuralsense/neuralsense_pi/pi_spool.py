@@ -0,0 +1,235 @@
+# pi_spool.py
+#
+# Bounded on-disk ring spool for the Pi sniffer (broker / network outages).
+#
+# - Lines are buffered in memory and appended to numbered segment files in
+#   batches (flush_lines or flush_sec), so the SD card sees sequential writes
+#   and no per-message fsync.
+# - Segments roll at segment_bytes; when the spool exceeds max_bytes the oldest
+#   segment is deleted and its unread lines count as dropped.
+# - The reader keeps a cursor (segment, byte offset) persisted to "cursor"
+#   at most once per CURSOR_SAVE_SEC, so a restart resends at most a few
+#   seconds of already drained lines (at-least-once).
+#
+# Thread-safe: the capture thread appends, the drain thread reads/commits.
+#
+# Usage (inspect a spool directory on the Pi):
+#   python3 pi_spool.py ~/.neuralsense_spool
+
+import json
+import os
+import sys
+import threading
+import time
+
+SEGMENT_SUFFIX = ".spool"
+CURSOR_FILE = "cursor"
+STATS_FILE = "stats.json"
+CURSOR_SAVE_SEC = 2.0
+
+def _seg_name(seg_id):
+    return "{:012d}{}".format(seg_id, SEGMENT_SUFFIX)
+
+def _count_lines(path):
+    n = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            n += chunk.count(b"\n")
+    return n
+
+def _write_json_atomic(path, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+class DiskSpool:
+    def __init__(self, spool_dir, max_bytes, segment_bytes, flush_lines=500, flush_sec=1.0):
+        self.dir = spool_dir
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.flush_lines = flush_lines
+        self.flush_sec = flush_sec
+        self.lock = threading.Lock()
+        self.buf = []
+        self.buf_since = 0.0
+        self.segs = {}          # seg_id -> [bytes, lines] on disk
+        self.cursor = [0, 0, 0]  # seg_id, byte offset, lines read in that segment
+        self.cursor_saved = 0.0
+        self.counters = {"spooled": 0, "drained": 0, "dropped": 0}
+        os.makedirs(spool_dir, exist_ok=True)
+        self._recover()
+
+    def _path(self, seg_id):
+        return os.path.join(self.dir, _seg_name(seg_id))
+
+    def _recover(self):
+        for name in os.listdir(self.dir):
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit():
+                p = os.path.join(self.dir, name)
+                self.segs[int(name[:-len(SEGMENT_SUFFIX)])] = [os.path.getsize(p), _count_lines(p)]
+        try:
+            with open(os.path.join(self.dir, CURSOR_FILE), "r", encoding="utf-8") as f:
+                c = json.load(f)
+            self.cursor = [int(c["seg"]), int(c["offset"]), int(c["lines"])]
+        except (OSError, ValueError, KeyError):
+            pass
+        if self.segs and self.cursor[0] not in self.segs:
+            self.cursor = [min(self.segs), 0, 0]     # cursor segment is gone: oldest left
+        if not self.segs:
+            self.cursor = [self.cursor[0] + 1, 0, 0]
+
+    def _active(self):
+        return max(self.segs) if self.segs else self.cursor[0]
+
+    # --- writer ---
+
+    def append(self, line):
+        with self.lock:
+            if not self.buf:
+                self.buf_since = time.time()
+            self.buf.append(line)
+            self.counters["spooled"] += 1
+            if len(self.buf) >= self.flush_lines:
+                self._flush()
+
+    def maybe_flush(self):
+        """Write out a partial batch older than flush_sec (call periodically)."""
+        with self.lock:
+            if self.buf and time.time() - self.buf_since >= self.flush_sec:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.buf:
+            return
+        data = ("\n".join(self.buf) + "\n").encode("utf-8")
+        n = len(self.buf)
+        self.buf = []
+        seg_id = self._active()
+        info = self.segs.get(seg_id)
+        if info is not None and info[0] >= self.segment_bytes:
+            seg_id += 1
+            info = None
+        if info is None:
+            info = self.segs[seg_id] = [0, 0]
+        with open(self._path(seg_id), "ab") as f:
+            f.write(data)
+        info[0] += len(data)
+        info[1] += n
+        self._enforce_bound()
+
+    def _enforce_bound(self):
+        total = sum(b for b, _ in self.segs.values())
+        while total > self.max_bytes and len(self.segs) > 1:
+            oldest = min(self.segs)
+            nbytes, nlines = self.segs.pop(oldest)
+            unread = nlines - self.cursor[2] if oldest == self.cursor[0] else nlines
+            if oldest >= self.cursor[0]:
+                self.counters["dropped"] += unread
+            if oldest == self.cursor[0]:
+                self.cursor = [min(self.segs), 0, 0]
+            try:
+                os.remove(self._path(oldest))
+            except OSError:
+                pass
+            total -= nbytes
+
+    # --- reader ---
+
+    def pending(self):
+        with self.lock:
+            on_disk = sum(lines for seg_id, (_, lines) in self.segs.items() if seg_id >= self.cursor[0])
+            return on_disk - self.cursor[2] + len(self.buf)
+
+    def read_batch(self, max_lines):
+        """Up to max_lines spooled lines (bytes, with newline) from the cursor,
+        oldest first. Only flushed lines are visible (see maybe_flush). Does
+        not advance the cursor: pass the sent prefix to commit()."""
+        with self.lock:
+            while True:
+                seg_id, offset, _ = self.cursor
+                if seg_id not in self.segs:
+                    return []
+                out = []
+                with open(self._path(seg_id), "rb") as f:
+                    f.seek(offset)
+                    for raw in f:
+                        if not raw.endswith(b"\n"):
+                            break       # torn tail after a crash
+                        out.append(raw)
+                        if len(out) >= max_lines:
+                            break
+                if out:
+                    return out
+                if seg_id == self._active():
+                    return []
+                self._finish_segment(seg_id)
+
+    def commit(self, lines):
+        """Advance past `lines`, a prefix of the last read_batch() result."""
+        if not lines:
+            return
+        with self.lock:
+            self.cursor[1] += sum(len(raw) for raw in lines)
+            self.cursor[2] += len(lines)
+            self.counters["drained"] += len(lines)
+            seg_id = self.cursor[0]
+            info = self.segs.get(seg_id)
+            if info is not None and self.cursor[1] >= info[0] and seg_id != self._active():
+                self._finish_segment(seg_id)
+            elif time.time() - self.cursor_saved >= CURSOR_SAVE_SEC:
+                self._save_cursor()
+
+    def _finish_segment(self, seg_id):
+        self.segs.pop(seg_id, None)
+        try:
+            os.remove(self._path(seg_id))
+        except OSError:
+            pass
+        later = [s for s in self.segs if s > seg_id]
+        self.cursor = [min(later) if later else seg_id + 1, 0, 0]
+        self._save_cursor()
+
+    def _save_cursor(self):
+        self.cursor_saved = time.time()
+        try:
+            _write_json_atomic(os.path.join(self.dir, CURSOR_FILE),
+                               {"seg": self.cursor[0], "offset": self.cursor[1], "lines": self.cursor[2]})
+        except OSError as e:
+            sys.stderr.write("[SPOOL] cursor save failed: {}\n".format(e))
+
+    def stats(self):
+        with self.lock:
+            out = dict(self.counters)
+            out["segments"] = len(self.segs)
+            out["bytes"] = sum(b for b, _ in self.segs.values())
+        out["pending"] = self.pending()
+        return out
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self._save_cursor()
+
+def write_stats(spool_dir, stats):
+    """Counters for monitoring (pi_controller.sh status reads stats.json)."""
+    try:
+        _write_json_atomic(os.path.join(spool_dir, STATS_FILE), stats)
+    except OSError as e:
+        sys.stderr.write("[SPOOL] stats write failed: {}\n".format(e))
+
+def main():
+    spool_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.expanduser("~/.neuralsense_spool")
+    if not os.path.isdir(spool_dir):
+        raise SystemExit("No spool directory: " + spool_dir)
+    s = DiskSpool(spool_dir, max_bytes=float("inf"), segment_bytes=float("inf"))
+    st = s.stats()
+    print("{}: {} pending lines in {} segments ({:.1f} MB)".format(
+        spool_dir, st["pending"], st["segments"], st["bytes"] / 1e6))
+
+if __name__ == "__main__":
+    main()
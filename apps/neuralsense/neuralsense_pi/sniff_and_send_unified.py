@@ -2,13 +2,38 @@
 #
 # Unified sniffer for:
 # 1) Production: publish ALL observed MACs (default)
-# 2) Calibration: publish ONLY one MAC (--target-mac)
+# 2) Calibration: publish ONLY the calibration phone(s) (--target-mac, comma-separated
+#    for several phones calibrating different zones at once)
 # 3) Test mode: publish ONLY a list of MACs (--track-macs "mac1,mac2,...")
 #
+# Resident daemon: the flags only set the starting mode. Mode, target/track
+# MACs, hashing and batching change at runtime through
+# <prefix>/control/<rpi_id> (or .../control/all), e.g.
+# `python sniffer_control.py set --mode calibration --target-macs ...`; the new
+# settings apply from the next frame, without restarting the capture. Health
+# (mode, counters, spool, capture threads, last command) is published retained
+# on <prefix>/status/<rpi_id> every SNIFFER_STATUS_SEC and after each command.
+# scapy's capture stack is imported once, after MQTT is up, and only the
+# RadioTap / 802.11 headers are dissected.
+#
 # Extras:
 # - rpi_id normalization (lowercase)
 # - RSSI sanity filtering
 # - optional MAC hashing for privacy in production logs (--hash-macs --hash-salt "secret")
+# - optional batching (--batch-ms): one message {"rpi_id", "batch": [[ts, mac, rssi(, ch)], ...]}
+#   per batch_ms or batch_max observations instead of one per observation
+# - broker outages: messages go to a bounded disk spool (pi_spool.py) and are
+#   drained at PI_SPOOL_DRAIN_RATE after reconnect, flagged "spool":1 with the
+#   original ts (--no-spool disables; calibration mode never spools)
+# - several monitor interfaces (--iface wlan1,wlan2), one capture thread each,
+#   and an optional channel-hop schedule (--channels 1,6,11 --dwell-sec 0.25):
+#   slots follow wall-clock time, so NTP-synced Pis with the same schedule sit
+#   on the same channel at the same moment. Messages carry "ch".
+# - production mode drops broadcast/multicast MACs and BSSIDs learned from
+#   beacons / probe responses (mac_filter.PiFilter, MACFILTER=0 disables);
+#   [FILTER] prints the share of addresses removed every MACFILTER_REPORT_SEC
+# - on-demand profiling: kill -USR1 <pid> (or `python3 ../stack_sampler.py
+#   sniffer start 30`) writes output/profile_sniffer_*.collapsed
 #
 # Notes:
 # - Use a MONITOR mode interface (often wlan1mon), not managed mode wlan1.
@@ -19,12 +44,25 @@ import os
 import time
 import json
 import hashlib
+import signal
+import subprocess
+import threading
 import paho.mqtt.client as mqtt
-from scapy.all import sniff
-from scapy.layers.dot11 import Dot11
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 from config import MQTT_BROKER_IP, MQTT_BROKER_PORT, MQTT_TOPIC_PREFIX
+from config import OUTPUT_DIR
+from config import MACFILTER, MACFILTER_REPORT_SEC
+from config import SNIFFER_STATUS_SEC, SNIFFER_BATCH_MS, SNIFFER_BATCH_MAX
+from config import PI_SPOOL_DIR, PI_SPOOL_MAX_MB, PI_SPOOL_SEGMENT_MB, PI_SPOOL_INFLIGHT_MAX, PI_SPOOL_DRAIN_RATE
+import mac_filter
+import pi_spool
+import sniffer_control
+import stack_sampler
+
+# Bound by load_scapy() once the daemon is up
+sniff = None
+Dot11 = None
 
 MQTT_HOST = MQTT_BROKER_IP
 MQTT_PORT = MQTT_BROKER_PORT
@@ -33,6 +71,27 @@ MQTT_TOPIC = MQTT_TOPIC_PREFIX + "/rssi"
 RSSI_MIN_DBM = -95
 RSSI_MAX_DBM = -20
 
+CHANNEL_DWELL_SEC = 0.25    # default hop slot length (--dwell-sec)
+
+SPOOL_TICK_SEC = 0.1        # drain loop period
+SPOOL_REPORT_SEC = 60.0     # [SPOOL] counters print / stats.json refresh
+
+def load_scapy():
+    """Import the capture side of scapy (not scapy.all and its hundreds of
+    layers) and restrict dissection to RadioTap / 802.11 headers. Returns
+    the import time in seconds."""
+    global sniff, Dot11
+    t0 = time.time()
+    from scapy.config import conf
+    from scapy.layers.dot11 import Dot11 as dot11, Dot11FCS, RadioTap
+    from scapy.sendrecv import sniff as scapy_sniff
+    try:
+        conf.layers.filter([RadioTap, dot11, Dot11FCS])
+    except AttributeError:
+        pass    # scapy < 2.4.3: full dissection
+    sniff, Dot11 = scapy_sniff, dot11
+    return time.time() - t0
+
 def normalize_rssi(val):
     if val is None:
         return None
@@ -63,6 +122,55 @@ def get_rssi(pkt):
         return None
     return None
 
+def freq_to_channel(mhz):
+    try:
+        f = int(mhz)
+    except Exception:
+        return None
+    if f == 2484:
+        return 14
+    if 2412 <= f <= 2472:
+        return (f - 2407) // 5
+    if 5000 <= f <= 5900:
+        return (f - 5000) // 5
+    return None
+
+def get_channel(pkt):
+    """Channel from the RadioTap header, None if the driver does not report it."""
+    try:
+        if hasattr(pkt, "ChannelFrequency"):
+            return freq_to_channel(pkt.ChannelFrequency)
+    except Exception:
+        return None
+    return None
+
+def set_channel(iface, channel):
+    # Same tool as set_channel.sh; the interface is already in monitor mode
+    r = subprocess.run(["iwconfig", iface, "channel", str(channel)], capture_output=True)
+    if r.returncode != 0:
+        sys.stderr.write("[HOP] {} channel {} failed: {}\n".format(
+            iface, channel, r.stderr.decode("utf-8", "replace").strip()))
+        return False
+    return True
+
+def hop_slot_channels(slot, ifaces, channels):
+    """Channel of each interface in hop slot `slot`: k interfaces cover k
+    consecutive entries of the schedule, so they never share a channel
+    (as long as there are at least as many channels as interfaces)."""
+    k = len(ifaces)
+    return {iface: channels[(slot * k + j) % len(channels)] for j, iface in enumerate(ifaces)}
+
+def hop_loop(ifaces, channels, dwell_sec, current):
+    """Retune every interface at each wall-clock slot boundary; `current`
+    (iface -> channel) is read by the capture threads for tagging."""
+    while True:
+        now = time.time()
+        slot = int(now // dwell_sec)
+        for iface, ch in hop_slot_channels(slot, ifaces, channels).items():
+            if current.get(iface) != ch and set_channel(iface, ch):
+                current[iface] = ch
+        time.sleep(max(0.0, (slot + 1) * dwell_sec - time.time()))
+
 def extract_macs(pkt):
     if not pkt.haslayer(Dot11):
         return []
@@ -82,13 +190,6 @@ def extract_macs(pkt):
             out.append(m)
     return out
 
-def parse_mac_list(s: str):
-    s = (s or "").strip()
-    if not s:
-        return set()
-    parts = [p.strip().lower() for p in s.split(",")]
-    return set([p for p in parts if p])
-
 def hash_mac(mac: str, salt: str):
     """
     Stable pseudonym for MAC: sha256(salt + mac) -> short hex.
@@ -97,61 +198,266 @@ def hash_mac(mac: str, salt: str):
     h = hashlib.sha256((salt + mac).encode("utf-8")).hexdigest()
     return h[:16]  # short id is enough
 
+def print_mode(s):
+    print("[MODE]", {"calibration": "CALIBRATION(target_macs)", "test": "TEST(track_macs)",
+                     "production": "PRODUCTION(all_macs)"}[s["mode"]])
+    if s["mode"] == "calibration":
+        print("[INFO] Publishing ONLY target MACs:", sorted(s["target_macs"]))
+    elif s["mode"] == "test":
+        print("[INFO] Publishing ONLY these track MACs:", sorted(s["track_macs"]))
+    else:
+        print("[INFO] Publishing ALL observed MACs.")
+        if s["hash_macs"]:
+            print("[INFO] MAC hashing ENABLED (salted sha256 -> 16 hex chars).")
+        else:
+            print("[INFO] MAC hashing DISABLED (publishing raw MACs).")
+    if s["batch_ms"] > 0:
+        print("[INFO] Batching: every {} ms or {} observations".format(s["batch_ms"], s["batch_max"]))
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--rpi-id", required=True, help="pi10, pi5, pi7 ...")
-    ap.add_argument("--iface", required=True, help="monitor interface (e.g. wlan1mon)")
-    ap.add_argument("--target-mac", default="", help="CALIBRATION: publish only this MAC")
+    ap.add_argument("--iface", required=True, help="monitor interface(s), comma-separated (e.g. wlan1mon,wlan2mon)")
+    ap.add_argument("--channels", default="", help="channel-hop schedule, e.g. 1,6,11 (default: stay on the set channel)")
+    ap.add_argument("--dwell-sec", type=float, default=CHANNEL_DWELL_SEC, help="time per hop slot")
+    ap.add_argument("--target-mac", default="", help="CALIBRATION: publish only these MACs (comma-separated)")
     ap.add_argument("--track-macs", default="", help="TEST: publish only these MACs (comma-separated)")
     ap.add_argument("--hash-macs", action="store_true", help="PRODUCTION: hash mac addresses before publishing")
     ap.add_argument("--hash-salt", default="", help="salt used for hashing (required if --hash-macs)")
+    ap.add_argument("--batch-ms", type=int, default=SNIFFER_BATCH_MS, help="batch observations per message (0: off)")
+    ap.add_argument("--batch-max", type=int, default=SNIFFER_BATCH_MAX, help="observations per batch message")
+    ap.add_argument("--store", default="", help="store id: publish to <prefix>/<store>/rssi (multi-store laptop)")
+    ap.add_argument("--no-spool", action="store_true", help="drop messages during broker outages instead of spooling")
     args = ap.parse_args()
 
+    store = str(args.store).strip()
+    topic = "{}/{}/rssi".format(MQTT_TOPIC_PREFIX, store) if store else MQTT_TOPIC
+
     rpi_id = str(args.rpi_id).strip().lower()
-    iface = str(args.iface).strip()
-    target_mac = str(args.target_mac).strip().lower()
-    track_macs = parse_mac_list(args.track_macs)
-
-    hash_macs = bool(args.hash_macs)
-    hash_salt = str(args.hash_salt or "").strip()
-
-    # Safety: hashing requires salt
-    if hash_macs and not hash_salt:
-        raise SystemExit("ERROR: --hash-macs requires --hash-salt 'some_secret_salt'")
-
-    # Mode priority:
-    # 1) target_mac (calibration) overrides everything
-    # 2) track_macs (test mode)
-    # 3) production (all macs)
-    if target_mac:
-        mode = "CALIBRATION(target_mac)"
-    elif track_macs:
-        mode = "TEST(track_macs)"
-    else:
-        mode = "PRODUCTION(all_macs)"
-
-    print("[MODE]", mode)
-    print("[INFO] rpi_id:", rpi_id, "| iface:", iface)
-    if target_mac:
-        print("[INFO] Publishing ONLY target MAC:", target_mac)
-    elif track_macs:
-        print("[INFO] Publishing ONLY these track MACs:", sorted(track_macs))
-    else:
-        print("[INFO] Publishing ALL observed MACs.")
-        if hash_macs:
-            print("[INFO] MAC hashing ENABLED (salted sha256 -> 16 hex chars).")
-        else:
-            print("[INFO] MAC hashing DISABLED (publishing raw MACs).")
+    ifaces = [i.strip() for i in str(args.iface).split(",") if i.strip()]
+    if not ifaces:
+        raise SystemExit("ERROR: --iface is empty")
+    try:
+        channels = [int(c) for c in str(args.channels).split(",") if c.strip()]
+    except ValueError:
+        raise SystemExit("ERROR: --channels must be comma-separated channel numbers")
+    if channels and args.dwell_sec <= 0:
+        raise SystemExit("ERROR: --dwell-sec must be > 0")
+
+    # Mode priority: target MACs (calibration) > track MACs (test) > production.
+    # The whole dict is replaced on a control command; handlers read settings[0] once per frame.
+    try:
+        settings = [sniffer_control.initial_settings(args.target_mac, args.track_macs, args.hash_macs,
+                                                     args.hash_salt, args.batch_ms, args.batch_max)]
+    except ValueError as e:
+        raise SystemExit("ERROR: {}".format(e))
+
+    print_mode(settings[0])
+    print("[INFO] rpi_id:", rpi_id, "| iface:", ",".join(ifaces))
+    if channels:
+        print("[INFO] Channel hopping:", channels, "| {:.2f}s per slot".format(args.dwell_sec))
+
+    # Calibration messages are never spooled (checked per message: modes switch at runtime)
+    spool = None
+    if not args.no_spool:
+        spool = pi_spool.DiskSpool(PI_SPOOL_DIR, int(PI_SPOOL_MAX_MB * 1e6), int(PI_SPOOL_SEGMENT_MB * 1e6))
+        print("[SPOOL]", PI_SPOOL_DIR, "| max {} MB | {} pending from last run".format(
+            PI_SPOOL_MAX_MB, spool.pending()))
+
+    # Publishes handed to paho minus those written to the socket (approximate:
+    # plain ints shared by the capture, drain and network threads)
+    sent = [0]
+    written = [0]
+    health = {"state": "starting", "started": time.time(), "captured": 0, "published": 0,
+              "last_packet": None, "scapy_import_sec": None, "last_cmd": None}
+    threads = []
+    status_t = sniffer_control.status_topic(rpi_id, store)
+    control_topics = [sniffer_control.control_topic(rpi_id, store), sniffer_control.control_topic("all", store)]
+    # Broadcast/multicast MACs and learned BSSIDs; BSSIDs are learned in every
+    # mode so the filter is warm when production starts
+    pi_filter = mac_filter.PiFilter() if MACFILTER else None
+    next_filter_report = [time.time() + MACFILTER_REPORT_SEC]
+
+    def status_payload():
+        now = time.time()
+        st = {
+            "rpi_id": rpi_id,
+            "state": health["state"],
+            "ts": now,
+            "uptime_sec": round(now - health["started"], 1),
+            "settings": sniffer_control.describe(settings[0]),
+            "ifaces": ifaces,
+            "capture_alive": [t.name[len("capture-"):] for t in threads if t.is_alive()],
+            "captured": health["captured"],
+            "published": health["published"],
+            "mqtt_sent": sent[0],
+            "spool_pending": spool.pending() if spool is not None else None,
+            "last_packet_age_sec": round(now - health["last_packet"], 1) if health["last_packet"] else None,
+            "scapy_import_sec": health["scapy_import_sec"],
+            "last_cmd": health["last_cmd"],
+        }
+        if store:
+            st["store"] = store
+        if pi_filter is not None:
+            st["filter"] = dict(pi_filter.counts, bssids=len(pi_filter.bssids))
+        return json.dumps(st, separators=(",", ":"))
+
+    def publish_status():
+        client.publish(status_t, status_payload(), qos=1, retain=True)
+
+    def handle_command(payload):
+        t0 = time.perf_counter()
+        cmd, kind, error = {}, "set", None
+        try:
+            cmd = json.loads(payload.decode("utf-8"))
+            if not isinstance(cmd, dict):
+                raise ValueError("command must be a JSON object")
+            kind = cmd.get("cmd", "set")
+            if kind == "set":
+                old = settings[0]
+                settings[0] = sniffer_control.apply_command(old, cmd)
+            elif kind != "status":
+                raise ValueError("unknown cmd: {}".format(kind))
+        except (ValueError, TypeError) as e:
+            error = str(e)
+        applied_ms = (time.perf_counter() - t0) * 1000.0
+        if kind == "status" and not error:
+            publish_status()    # last_cmd keeps the last change
+            return
+        health["last_cmd"] = {"id": cmd.get("id") if isinstance(cmd, dict) else None, "cmd": kind,
+                              "ts": time.time(), "applied_ms": round(applied_ms, 3), "error": error}
+        if error:
+            print("[CONTROL] rejected:", error)
+        elif kind == "set":
+            print("[CONTROL] {} -> {} in {:.2f} ms".format(old["mode"], settings[0]["mode"], applied_ms))
+            print_mode(settings[0])
+        publish_status()
+
+    def on_connect(client, userdata, flags, rc):
+        print("[MQTT] Connected rc=", rc)
+        written[0] = sent[0]    # paho's queue does not survive a disconnect
+        for t in control_topics:
+            client.subscribe(t, qos=1)
+        publish_status()
+
+    def on_publish(client, userdata, mid):
+        written[0] += 1
+
+    def on_message(client, userdata, msg):
+        handle_command(msg.payload)
 
     client = mqtt.Client(client_id="sniffer-" + rpi_id)
-    client.connect(MQTT_HOST, MQTT_PORT, keepalive=30)
+    client.on_connect = on_connect
+    client.on_publish = on_publish
+    client.on_message = on_message
+    client.will_set(status_t, json.dumps({"rpi_id": rpi_id, "state": "offline"}), qos=1, retain=True)
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
+    # Async connect: the sniffer starts (and spools) even while the broker is down
+    client.connect_async(MQTT_HOST, MQTT_PORT, keepalive=30)
     client.loop_start()
 
-    def publish(mac_out: str, rssi: int, ts: float):
+    def send(payload, spoolable):
+        if spool is not None and spoolable and (not client.is_connected() or sent[0] - written[0] > PI_SPOOL_INFLIGHT_MAX):
+            spool.append(payload[:-1] + ',"spool":1}')
+            return
+        if client.publish(topic, payload, qos=0, retain=False).rc == mqtt.MQTT_ERR_SUCCESS:
+            sent[0] += 1
+        elif spool is not None and spoolable:
+            spool.append(payload[:-1] + ',"spool":1}')
+
+    batch = []      # rows waiting for the next batch message
+    batch_lock = threading.Lock()
+
+    def flush_batch():
+        with batch_lock:
+            rows = batch[:]
+            del batch[:]
+        if rows:
+            send(sniffer_control.encode_batch(rpi_id, rows), settings[0]["mode"] != "calibration")
+
+    def batch_loop():
+        """Send partial batches every batch_ms (and leftovers once batching is switched off)."""
+        while True:
+            ms = settings[0]["batch_ms"]
+            time.sleep(ms / 1000.0 if ms > 0 else 0.1)
+            try:
+                flush_batch()
+            except Exception as e:
+                sys.stderr.write("[BATCH] flush error: {}\n".format(e))
+
+    def publish(mac_out: str, rssi: int, ts: float, ch, cfg):
+        health["published"] += 1
+        spoolable = cfg["mode"] != "calibration"
+        if cfg["batch_ms"] > 0:
+            row = [ts, mac_out, int(rssi)] if ch is None else [ts, mac_out, int(rssi), ch]
+            with batch_lock:
+                batch.append(row)
+                if len(batch) < cfg["batch_max"]:
+                    return
+                rows = batch[:]
+                del batch[:]
+            send(sniffer_control.encode_batch(rpi_id, rows), spoolable)
+            return
         msg = {"ts": ts, "rpi_id": rpi_id, "mac": mac_out, "rssi": int(rssi)}
-        client.publish(MQTT_TOPIC, json.dumps(msg, separators=(",", ":")), qos=0, retain=False)
+        if ch is not None:
+            msg["ch"] = ch
+        send(json.dumps(msg, separators=(",", ":")), spoolable)
+
+    def report_spool():
+        st = spool.stats()
+        print("[SPOOL] spooled={spooled} drained={drained} dropped={dropped} pending={pending} "
+              "({segments} segments, {bytes} bytes)".format(**st))
+        st["ts"] = time.time()
+        st["rpi_id"] = rpi_id
+        pi_spool.write_stats(PI_SPOOL_DIR, st)
+
+    def drain_loop():
+        """Resend spooled messages (oldest first) at PI_SPOOL_DRAIN_RATE while
+        connected, leaving room for live traffic in paho's queue."""
+        per_tick = max(1, int(PI_SPOOL_DRAIN_RATE * SPOOL_TICK_SEC))
+        next_report = time.time() + SPOOL_REPORT_SEC
+        last = None
+        while True:
+            time.sleep(SPOOL_TICK_SEC)
+            try:
+                spool.maybe_flush()
+                if client.is_connected() and sent[0] - written[0] < PI_SPOOL_INFLIGHT_MAX // 2:
+                    done = []
+                    for raw in spool.read_batch(per_tick):
+                        if client.publish(topic, raw[:-1], qos=0, retain=False).rc != mqtt.MQTT_ERR_SUCCESS:
+                            break
+                        sent[0] += 1
+                        done.append(raw)
+                    spool.commit(done)
+                if time.time() >= next_report:
+                    next_report = time.time() + SPOOL_REPORT_SEC
+                    counters = dict(spool.counters)
+                    if counters != last:    # no SD writes while nothing changes
+                        last = counters
+                        report_spool()
+            except Exception as e:
+                sys.stderr.write("[SPOOL] drain error: {}\n".format(e))
 
-    def handle(pkt):
+    def status_loop():
+        while True:
+            time.sleep(SNIFFER_STATUS_SEC)
+            try:
+                publish_status()
+            except Exception as e:
+                sys.stderr.write("[STATUS] publish error: {}\n".format(e))
+
+    if spool is not None:
+        threading.Thread(target=drain_loop, name="spool-drain", daemon=True).start()
+    threading.Thread(target=batch_loop, name="batch-flush", daemon=True).start()
+    threading.Thread(target=status_loop, name="status", daemon=True).start()
+
+    current_channel = {}    # iface -> channel it was last tuned to (hop thread)
+
+    def handle(pkt, iface):
+        cfg = settings[0]
+        if pi_filter is not None and pkt.haslayer(Dot11):
+            d = pkt.getlayer(Dot11)
+            pi_filter.learn_frame(d.type, d.subtype, d.addr3)
         rssi = get_rssi(pkt)
         if rssi is None:
             return
@@ -161,30 +467,77 @@ def main():
             return
 
         ts = time.time()
+        health["captured"] += 1
+        health["last_packet"] = ts
+        ch = get_channel(pkt)
+        if ch is None:
+            ch = current_channel.get(iface)
 
-        # --- Calibration: publish only the specified MAC (raw) ---
-        if target_mac:
-            if target_mac in macs:
-                publish(target_mac, rssi, ts)
+        # --- Calibration: publish only the calibration phones (raw) ---
+        if cfg["mode"] == "calibration":
+            for mac in macs:
+                if mac in cfg["target_macs"]:
+                    publish(mac, rssi, ts, ch, cfg)
             return
 
         # --- Test: publish only track list (raw) ---
-        if track_macs:
+        if cfg["mode"] == "test":
             for mac in macs:
-                if mac in track_macs:
-                    publish(mac, rssi, ts)
+                if mac in cfg["track_macs"]:
+                    publish(mac, rssi, ts, ch, cfg)
             return
 
         # --- Production: publish all macs (optionally hashed) ---
-        if hash_macs:
+        if pi_filter is not None:
+            macs = [m for m in macs if pi_filter.keep(m)]
+            if ts >= next_filter_report[0]:
+                next_filter_report[0] = ts + MACFILTER_REPORT_SEC
+                print("[FILTER]", pi_filter.summary())
+        if cfg["hash_macs"]:
             for mac in macs:
-                publish(hash_mac(mac, hash_salt), rssi, ts)
+                publish(hash_mac(mac, cfg["hash_salt"]), rssi, ts, ch, cfg)
         else:
             for mac in macs:
-                publish(mac, rssi, ts)
+                publish(mac, rssi, ts, ch, cfg)
 
-    print("[OK]", rpi_id, "sniffing on", iface, "-> MQTT", MQTT_HOST, "topic", MQTT_TOPIC)
-    sniff(iface=iface, prn=handle, store=False)
+    def capture(iface):
+        try:
+            sniff(iface=iface, prn=lambda pkt: handle(pkt, iface), store=False)
+        except Exception as e:
+            sys.stderr.write("[CAPTURE] {} stopped: {}\n".format(iface, e))
+
+    if channels:
+        threading.Thread(target=hop_loop, args=(ifaces, channels, args.dwell_sec, current_channel),
+                         name="channel-hop", daemon=True).start()
+
+    # pkill (SIGTERM) still flushes the spool buffer and cursor
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    stack_sampler.install("sniffer", OUTPUT_DIR)
+    try:
+        # MQTT, control and status are already up while scapy loads
+        health["scapy_import_sec"] = round(load_scapy(), 3)
+        print("[SCAPY] capture stack loaded in {:.2f}s".format(health["scapy_import_sec"]))
+        print("[OK]", rpi_id, "sniffing on", ",".join(ifaces), "-> MQTT", MQTT_HOST, "topic", topic,
+              "| control", control_topics[0])
+        # One capture thread per interface, all feeding the same publisher
+        threads.extend(threading.Thread(target=capture, args=(i,), name="capture-" + i, daemon=True) for i in ifaces)
+        for t in threads:
+            t.start()
+        health["state"] = "running"
+        publish_status()
+        while any(t.is_alive() for t in threads):
+            time.sleep(1.0)
+    finally:
+        flush_batch()
+        health["state"] = "stopped"
+        try:
+            client.publish(status_t, status_payload(), qos=1, retain=True).wait_for_publish(timeout=2.0)
+            client.disconnect()     # clean disconnect: the "stopped" status stays, no last will
+        except Exception:
+            pass
+        if spool is not None:
+            spool.close()
+            report_spool()
 
 if __name__ == "__main__":
     main()
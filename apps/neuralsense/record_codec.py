@@ -0,0 +1,198 @@
+# record_codec.py
+#
+# Fast serialization for run_live output records.
+#
+# - kst_str(ts): KST timestamp string with the "YYYY-mm-dd HH:MM:SS" prefix
+#   cached per second; identical to the datetime/strftime formatting.
+# - Line templates for the per-message records (raw, assignment, uncertain):
+#   keys are literal text and only values are encoded. The sources/vector
+#   tail is built from Pi names encoded once per process. Templates produce
+#   exactly the bytes json.dumps(rec, separators=(",", ":")) would.
+# - dumps() for all other records: orjson when installed
+#   (JSON_BACKEND=auto|orjson), else the stdlib encoder. orjson output is
+#   only used when it is the same bytes: non-ASCII text, exponent floats,
+#   NaN/inf and types orjson rejects (numpy scalars, huge ints) go through
+#   the stdlib encoder.
+#
+# Usage:
+#   python record_codec.py                      # benchmark
+#   python record_codec.py check [file.jsonl ...]  # dumps() == stdlib, per record
+
+import json
+import math
+import re
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is always available
+    orjson = None
+
+from config import JSON_BACKEND
+
+KST = timezone(timedelta(hours=9))
+
+_enc_str = json.encoder.encode_basestring_ascii
+_std_dumps = json.JSONEncoder(separators=(",", ":")).encode
+
+def _nonfinite(obj):
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(_nonfinite(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(_nonfinite(v) for v in obj)
+    return False
+
+if orjson is not None and JSON_BACKEND in ("auto", "orjson"):
+    _ORJSON_OPTS = orjson.OPT_NON_STR_KEYS
+    _DIFFERS = re.compile(rb"[\x80-\xff]|[0-9]e")     # stdlib escapes non-ASCII, writes 1e-07 / 1e+16
+
+    def dumps(obj):
+        try:
+            b = orjson.dumps(obj, option=_ORJSON_OPTS)
+        except TypeError:
+            return _std_dumps(obj)
+        if _DIFFERS.search(b) or (b"null" in b and _nonfinite(obj)):    # orjson writes NaN/inf as null
+            return _std_dumps(obj)
+        return b.decode("ascii")
+    BACKEND = "orjson"
+else:
+    dumps = _std_dumps
+    BACKEND = "json"
+
+# --- KST timestamps ---
+
+_kst_cache = (None, "")     # (second, "YYYY-mm-dd HH:MM:SS"); swapped as one tuple
+
+def kst_str(ts):
+    """Same output as datetime.fromtimestamp(ts, KST).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] + " KST"."""
+    global _kst_cache
+    frac, sec = math.modf(ts)
+    us = round(frac * 1e6)          # datetime.fromtimestamp rounding
+    if us >= 1000000:
+        sec += 1
+        us -= 1000000
+    elif us < 0:
+        sec -= 1
+        us += 1000000
+    cached_sec, prefix = _kst_cache
+    if sec != cached_sec:
+        prefix = datetime.fromtimestamp(sec, KST).strftime("%Y-%m-%d %H:%M:%S")
+        _kst_cache = (sec, prefix)
+    return "%s.%03d KST" % (prefix, us // 1000)
+
+# --- value encoders (stdlib-identical) ---
+
+def _f(v):
+    return "null" if v is None else float.__repr__(float(v))
+
+def _i(v):
+    return "null" if v is None else int.__repr__(int(v))
+
+# --- record templates ---
+
+def raw_line(ts, kst, phone, rpi_id, rssi, ch=None):
+    if ch is None:
+        return '{"ts":%s,"ts_kst":"%s","phone_id":%s,"rpi_id":%s,"rssi":%d}' % (
+            float.__repr__(ts), kst, _enc_str(phone), _enc_str(rpi_id), rssi)
+    return '{"ts":%s,"ts_kst":"%s","phone_id":%s,"rpi_id":%s,"rssi":%d,"ch":%d}' % (
+        float.__repr__(ts), kst, _enc_str(phone), _enc_str(rpi_id), rssi, ch)
+
+_pi_keys = {}     # rpi_id -> its encoded JSON string (a handful of Pis)
+
+def _pi_key(pi):
+    k = _pi_keys.get(pi)
+    if k is None:
+        k = _pi_keys[pi] = _enc_str(pi)
+    return k
+
+def vector_fragment(sources, raw_vec):
+    """Encoded '"sources":[...],"vector":{...},"timebase":...}' tail of the
+    assignment / uncertain record; Pi names are encoded once per process."""
+    return '"sources":[%s],"vector":{%s},"timebase":"rx_time_laptop"}' % (
+        ",".join([_pi_key(p) for p in sources]),
+        ",".join(["%s:%r" % (_pi_key(p), v) for p, v in raw_vec.items()]))   # int, or float when fused
+
+def assignment_line(ts, kst, phone, sid, zone, x, y, conf, second_zone, second_conf, margin, frag):
+    return ('{"ts":%s,"ts_kst":"%s","phone_id":%s,"session_id":%s,"zone_id":%d,"x":%s,"y":%s,'
+            '"confidence":%s,"second_zone_id":%s,"second_confidence":%s,"margin":%s,%s') % (
+        float.__repr__(ts), kst, _enc_str(phone), _enc_str(sid), zone, _i(x), _i(y),
+        _f(conf), _i(second_zone), _f(second_conf), _f(margin), frag)
+
+def uncertain_line(ts, kst, phone, sid, zone, conf, second_zone, second_conf, margin, frag):
+    return ('{"ts":%s,"ts_kst":"%s","phone_id":%s,"session_id":%s,"zone_id":%d,'
+            '"confidence":%s,"second_zone_id":%s,"second_confidence":%s,"margin":%s,%s') % (
+        float.__repr__(ts), kst, _enc_str(phone), _enc_str(sid), zone,
+        _f(conf), _i(second_zone), _f(second_conf), _f(margin), frag)
+
+# --- benchmark ---
+
+def _bench(n=200000):
+    def old_kst(ts):
+        return datetime.fromtimestamp(ts, KST).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] + " KST"
+
+    vec = {"pi5": -61, "pi7": -70, "pi8": -55, "pi9": -80, "pi10": -66, "pi11": -59, "pi12": -72, "pi13": -68}
+    sources = sorted(vec)
+    base = time.time()
+    tss = [base + i * 0.013 for i in range(n)]
+
+    t0 = time.perf_counter()
+    for ts in tss:
+        k = old_kst(ts)
+        json.dumps({"ts": ts, "ts_kst": k, "phone_id": "aa:bb:cc:dd:ee:ff", "rpi_id": "pi5", "rssi": -61},
+                   separators=(",", ":"))
+        json.dumps({"ts": ts, "ts_kst": k, "phone_id": "aa:bb:cc:dd:ee:ff", "session_id": "S0042", "zone_id": 5,
+                    "x": 3, "y": -2, "confidence": 0.8125, "second_zone_id": 6, "second_confidence": 0.55,
+                    "margin": 0.2625, "sources": sources, "vector": vec, "timebase": "rx_time_laptop"},
+                   separators=(",", ":"))
+    old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for ts in tss:
+        k = kst_str(ts)
+        raw_line(ts, k, "aa:bb:cc:dd:ee:ff", "pi5", -61)
+        frag = vector_fragment(sources, vec)
+        assignment_line(ts, k, "aa:bb:cc:dd:ee:ff", "S0042", 5, 3, -2, 0.8125, 6, 0.55, 0.2625, frag)
+    new = time.perf_counter() - t0
+    print("backend={}  {} messages (raw + assignment record each)".format(BACKEND, n))
+    print("json.dumps + strftime: {:.2f} us/msg".format(1e6 * old / n))
+    print("record_codec:          {:.2f} us/msg  ({:.1f}x)".format(1e6 * new / n, old / new))
+
+def _check(paths=()):
+    """dumps() must give the stdlib bytes: edge-case records, then every
+    line of the given JSONL outputs (written by the stdlib encoder)."""
+    samples = [
+        {"ts": 1740000000.123, "phone_id": "aa:bb:cc:dd:ee:ff", "session_id": "S0001", "from_zone": None,
+         "to_zone": 5, "confidence": 0.8125},
+        {"exit_ts": 1740000100.5, "zone_id": 3, "enter_ts": 1740000000.25, "dwell_sec": 100.25},
+        {"ts": 1.0, "drift_ppm": 1e-07, "big": 1e+16, "tiny": 5e-324, "neg": -0.0, "offset_sec": None},
+        {"ts": 1.0, "error": "파일 없음: café", "nan": float("nan"), "inf": float("inf")},
+        {"ts": 1.0, "zones": {1: 2, 2: [0.5, None, True]}, "huge": 2 ** 70},
+        {"ts": 1.0, "lag_ms": {"p50": 0.0, "p99": 123.456}, "flags": [], "hash": "3e5a9f0012ab77cd"},
+    ]
+    try:
+        import numpy as np
+        samples.append({"ts": 1.0, "p50": np.float64(12.5)})
+    except ImportError:
+        pass
+    bad = sum(dumps(rec) != _std_dumps(rec) for rec in samples)
+    n = len(samples)
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line:
+                    n += 1
+                    if dumps(json.loads(line)) != line:
+                        bad += 1
+                        print("[CHECK] differs:", line[:200])
+    print("[CHECK] backend={} records={} differing={}".format(BACKEND, n, bad))
+    return bad == 0
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["check"]:
+        sys.exit(0 if _check(sys.argv[2:]) else 1)
+    _bench()
@@ -0,0 +1,258 @@
+# replay_raw_rssi.py
+#
+# Offline replay of a recorded raw_rssi.jsonl through the live vector/scoring
+# path. Reports how many confident assignments each scoring policy yields per
+# thousand ingested messages, so MIN_SOURCES changes can be judged on real data.
+# --fusion adds rows for the multi-sample per-Pi fusion methods (FUSION).
+#
+# With --truth it instead compares the transition trackers (TRANSITION_CONFIRM_COUNT
+# debounce vs the HMM tracker) against ground-truth windows: confirmation
+# latency, share of time in the true zone, and transitions per true move.
+#
+# Usage:
+#   python replay_raw_rssi.py output_02252026/raw_rssi.jsonl
+#   python replay_raw_rssi.py raw_rssi.jsonl --cal output/calibration.jsonl --min-sources 5,6,7
+#   python replay_raw_rssi.py raw_rssi.jsonl --fusion median,trimmed,ewma
+#   python replay_raw_rssi.py output/raw_rssi.jsonl --start "2026-02-25 14:00" --end "2026-02-25 15:00"
+#   python replay_raw_rssi.py output/raw_rssi.jsonl --truth truth.csv --zones zones.csv
+
+import argparse
+import heapq
+import os
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+import evaluate_accuracy_tests as evaluator
+import rolling_jsonl
+import rssi_window
+import run_live_geometry as live
+import zone_tracker
+from config import MIN_SOURCES
+
+# run_live's companion raw files: raw_rssi_deferred.jsonl (lines written back
+# after load shedding, in time order on its own) and raw_rssi_spool.jsonl (Pi
+# outage spools under their capture time, interleaved across Pis)
+LATE_SUFFIXES = ("_deferred", "_spool")
+
+def late_paths(path):
+    root, ext = os.path.splitext(path)
+    return [root + suffix + ext for suffix in LATE_SUFFIXES]
+
+def iter_raw_rssi(path, start_ts=None, end_ts=None, channels=None):
+    """Yield (ts, phone_id, rpi_id, rssi) from a raw_rssi.jsonl file, including
+    its rotated segments, seeking to start_ts through the sidecar index, merged
+    in time order with its late_paths() companions.
+    `channels` keeps only records tagged with one of them (untagged pass)."""
+    deferred, spool = late_paths(path)
+    # Spool records are only ordered per drain: no early stop at end_ts, sorted here
+    spooled = sorted((e for e in _iter_one(spool, start_ts, None, channels) if end_ts is None or e[0] <= end_ts),
+                     key=lambda e: e[0])
+    return heapq.merge(_iter_one(path, start_ts, end_ts, channels), _iter_one(deferred, start_ts, end_ts, channels),
+                       spooled, key=lambda e: e[0])
+
+def _iter_one(path, start_ts, end_ts, channels):
+    for rec in rolling_jsonl.iter_range(path, start_ts, end_ts):
+        if channels and "ch" in rec and rec["ch"] not in channels:
+            continue
+        try:
+            yield (float(rec["ts"]), str(rec["phone_id"]).lower().strip(),
+                   str(rec["rpi_id"]).strip().lower(), int(rec["rssi"]))
+        except Exception:
+            continue
+
+def parse_channels(s):
+    return {int(c) for c in s.split(",") if c.strip()} if s else None
+
+def replay_yield(events, cal, pi_weights, model, min_sources, masked, fusion=None):
+    """Count ingested / scored / assigned / uncertain for one policy
+    (`fusion`: a FUSION method instead of the newest sample per Pi)."""
+    fuser = rssi_window.Fusion(fusion, model["pis"]) if fusion else None
+    buf = defaultdict(fuser.new_window if fuser is not None else deque)
+    counts = {"ingested": 0, "scored": 0, "assigned": 0, "uncertain": 0}
+    t0 = time.perf_counter()
+    for ts, phone, rpi_id, rssi in events:
+        counts["ingested"] += 1
+        d = buf[phone]
+        if fuser is None:
+            live.push_event(d, ts, rpi_id, rssi)
+            raw_vec = live.build_fresh_vector(d, ts)
+        else:
+            d.push(ts, rpi_id, rssi)
+            raw_vec = fuser.vector(d, ts, live.PER_PI_FRESH_SEC)
+        if len(raw_vec) < min_sources:
+            continue
+        if masked:
+            best_zone, best_conf, _, second_conf = live.score_top_two_zones_masked(raw_vec, model)
+        else:
+            live_norm = live.normalize_live_vector(raw_vec)
+            best_zone, best_conf, _, second_conf = live.score_top_two_zones(live_norm, cal, pi_weights)
+        if best_zone is None:
+            continue
+        counts["scored"] += 1
+        if best_conf - second_conf < live.MARGIN_GATE:
+            counts["uncertain"] += 1
+        else:
+            counts["assigned"] += 1
+    counts["elapsed_sec"] = round(time.perf_counter() - t0, 3)
+    n = counts["ingested"]
+    counts["assigned_per_1k"] = round(1000.0 * counts["assigned"] / n, 2) if n else 0.0
+    return counts
+
+def replay_trackers(events, model, zones, min_sources):
+    """Confirmed-zone timelines {phone: [(confirm_ts, zone)]} of the debounce
+    and the HMM tracker over the same scored vectors (phones stand in for
+    sessions), plus HMM per-tick cost in ms."""
+    buf = defaultdict(deque)
+    state = {}
+    pending = {}
+    debounce = defaultdict(list)
+    hmm = defaultdict(list)
+    tracker = zone_tracker.HmmTracker(model["zone_ids"], zones)
+    tick_ms = []
+    for ts, phone, rpi_id, rssi in events:
+        d = buf[phone]
+        live.push_event(d, ts, rpi_id, rssi)
+        if tracker.due(ts):
+            t0 = time.perf_counter()
+            for sid, _, _, to_zone, _, _ in tracker.step(ts):
+                hmm[sid].append((ts, to_zone))
+            tick_ms.append(1e3 * (time.perf_counter() - t0))
+        raw_vec = live.build_fresh_vector(d, ts)
+        if len(raw_vec) < min_sources:
+            continue
+        l1, rd = live.masked_distances(raw_vec, model)
+        conf = live.zone_confidences(l1, rd, model)
+        best_zone, best_conf, _, second_conf = live.top_two(conf, model)
+        if best_zone is None:
+            continue
+        tracker.observe(phone, phone, conf, ts)
+        if best_conf - second_conf < live.MARGIN_GATE:
+            continue
+        # Same rule as the live debounce
+        if phone not in state:
+            state[phone] = best_zone
+            debounce[phone].append((ts, best_zone))
+        elif best_zone == state[phone]:
+            pending.pop(phone, None)
+        else:
+            p = pending.get(phone)
+            count = p[1] + 1 if p is not None and p[0] == best_zone else 1
+            if count >= live.TRANSITION_CONFIRM_COUNT:
+                state[phone] = best_zone
+                pending.pop(phone, None)
+                debounce[phone].append((ts, best_zone))
+            else:
+                pending[phone] = (best_zone, count)
+    return debounce, hmm, np.asarray(tick_ms)
+
+def score_timeline(timeline, windows):
+    """Latency / time-in-true-zone / transitions per true move over truth windows."""
+    latency = []
+    in_zone = 0.0
+    total = 0.0
+    moves = 0
+    changes = 0
+    prev_true = {}
+    for w in sorted(windows, key=lambda w: (w["phone_id"], w["start"])):
+        tl = timeline.get(w["phone_id"], [])
+        start, end, true = w["start"], w["end"], w["true_zone_id"]
+        if prev_true.get(w["phone_id"]) not in (None, true):
+            moves += 1
+        prev_true[w["phone_id"]] = true
+        # zone held at the window start, then every change inside the window
+        cur = None
+        for ts, z in tl:
+            if ts > start:
+                break
+            cur = z
+        t = start
+        reached = 0.0 if cur == true else None
+        for ts, z in tl:
+            if ts <= start or ts > end:
+                continue
+            changes += 1
+            if cur == true:
+                in_zone += ts - t
+            cur, t = z, ts
+            if z == true and reached is None:
+                reached = ts - start
+        if cur == true:
+            in_zone += end - t
+        total += end - start
+        if reached is not None:
+            latency.append(reached)
+    return {
+        "latency_median_sec": round(float(np.median(latency)), 2) if latency else None,
+        "latency_p90_sec": round(float(np.percentile(latency, 90)), 2) if latency else None,
+        "windows_reached": "{}/{}".format(len(latency), len(windows)),
+        "time_in_true_zone": round(in_zone / total, 4) if total else 0.0,
+        "changes_per_move": round(changes / moves, 2) if moves else None,
+    }
+
+def compare_trackers(events, model, zones, windows, min_sources):
+    debounce, hmm, tick_ms = replay_trackers(events, model, zones, min_sources)
+    rows = [("debounce, TRANSITION_CONFIRM_COUNT={}".format(live.TRANSITION_CONFIRM_COUNT), score_timeline(debounce, windows)),
+            ("hmm, tick={}s switch={}".format(zone_tracker.TRACKER_TICK_SEC, zone_tracker.TRACKER_SWITCH_PROB),
+             score_timeline(hmm, windows))]
+    print("{:<38} {:>10} {:>10} {:>9} {:>11} {:>13}".format(
+        "tracker", "lat_med_s", "lat_p90_s", "reached", "in_true_z", "changes/move"))
+    for name, r in rows:
+        print("{:<38} {:>10} {:>10} {:>9} {:>11.4f} {:>13}".format(
+            name, "-" if r["latency_median_sec"] is None else r["latency_median_sec"],
+            "-" if r["latency_p90_sec"] is None else r["latency_p90_sec"],
+            r["windows_reached"], r["time_in_true_zone"],
+            "-" if r["changes_per_move"] is None else r["changes_per_move"]))
+    if len(tick_ms):
+        print("hmm step: {} ticks, mean {:.3f} ms, max {:.3f} ms".format(len(tick_ms), tick_ms.mean(), tick_ms.max()))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("raw_rssi", help="recorded raw_rssi.jsonl")
+    ap.add_argument("--cal", default=live.CAL_JSONL, help="calibration.jsonl")
+    ap.add_argument("--min-sources", default=str(MIN_SOURCES),
+                    help="comma-separated MIN_SOURCES values for the masked path")
+    ap.add_argument("--start", help="epoch or 'YYYY-mm-dd HH:MM[:SS]' KST")
+    ap.add_argument("--end", help="epoch or 'YYYY-mm-dd HH:MM[:SS]' KST")
+    ap.add_argument("--channels", help="replay only these channels, e.g. 1,6,11 (multi-channel Pis)")
+    ap.add_argument("--truth", help="ground-truth CSV (phone_id,true_zone_id,start,end): compare trackers")
+    ap.add_argument("--zones", default=live.ZONES_CSV, help="zones.csv for the HMM transition matrix")
+    ap.add_argument("--fusion", default="", help="also replay these FUSION methods, e.g. median,trimmed,ewma")
+    args = ap.parse_args()
+
+    live.CAL_JSONL = args.cal
+    cal = live.load_calibration()
+    if not cal:
+        raise SystemExit("ERROR: {} missing or has no vectors.".format(args.cal))
+    pi_weights = live.compute_pi_weights(cal)
+    model = live.compile_calibration(cal, pi_weights)
+    events = list(iter_raw_rssi(args.raw_rssi, rolling_jsonl.parse_time_arg(args.start),
+                                rolling_jsonl.parse_time_arg(args.end), parse_channels(args.channels)))
+    events.sort(key=lambda e: e[0])     # files from before raw_rssi_spool.jsonl hold spooled lines out of order
+    print("Replaying {} messages, {} calibrated zones".format(len(events), len(model["zone_ids"])))
+
+    if args.truth:
+        compare_trackers(events, model, live.load_zones(args.zones), evaluator.load_truth_csv(args.truth),
+                         min((int(x) for x in args.min_sources.split(",") if x.strip()), default=MIN_SOURCES))
+        return
+
+    full = len(model["pis"])
+    rows = [("before: legacy, MIN_SOURCES={}".format(full),
+             replay_yield(events, cal, pi_weights, model, full, masked=False))]
+    for m in sorted({int(x) for x in args.min_sources.split(",") if x.strip()}, reverse=True):
+        rows.append(("after:  masked, MIN_SOURCES={}".format(m),
+                     replay_yield(events, cal, pi_weights, model, m, masked=True)))
+        for method in [f.strip() for f in args.fusion.split(",") if f.strip()]:
+            rows.append(("fusion: {}, MIN_SOURCES={}".format(method, m),
+                         replay_yield(events, cal, pi_weights, model, m, masked=True, fusion=method)))
+
+    print("{:<34} {:>9} {:>8} {:>9} {:>9} {:>10} {:>9}".format(
+        "policy", "ingested", "scored", "assigned", "uncertain", "assign/1k", "sec"))
+    for name, c in rows:
+        print("{:<34} {:>9} {:>8} {:>9} {:>9} {:>10.2f} {:>9.3f}".format(
+            name, c["ingested"], c["scored"], c["assigned"], c["uncertain"],
+            c["assigned_per_1k"], c["elapsed_sec"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,450 @@
+# rolling_jsonl.py
+#
+# Rolling JSONL output with background compression and a sparse time index.
+#
+# Layout for output/zone_assignments.jsonl (rotate="hourly", compress="gzip"):
+#   zone_assignments.jsonl                        active segment (tail -f friendly)
+#   zone_assignments.jsonl.idx                    its index
+#   zone_assignments.2026-02-25T14.jsonl.gz       closed, compressed segments
+#   zone_assignments.2026-02-25T14.jsonl.gz.idx
+#
+# Index = packed little-endian (ts: f64, offset: u64) entries, one at segment
+# start and then every INDEX_EVERY_BYTES of output. ts is the running max of
+# record times, so entries are monotonic and can be bisected. Compressed
+# segments are written as one gzip member / zstd frame per index block and
+# their index holds compressed offsets, so a reader can seek into the middle
+# of a closed segment without decompressing from the start.
+# Record time is the first of TS_FIELDS present ("ts", or "exit_ts" for
+# dwells), the same field writers pass to write_line().
+#
+# Usage (reader):
+#   python rolling_jsonl.py cat output/raw_rssi.jsonl --start "2026-02-25 14:00" --end "2026-02-25 14:10"
+
+import argparse
+import bisect
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import struct
+import sys
+import threading
+from datetime import datetime, timezone, timedelta
+
+try:
+    import zstandard
+except ImportError:  # optional: gzip is always available
+    zstandard = None
+
+KST = timezone(timedelta(hours=9))
+
+INDEX_EVERY_BYTES = 1 << 20
+INDEX_ENTRY = struct.Struct("<dQ")
+STOP_SLACK_SEC = 60.0   # readers stop this far past end_ts (records are only roughly ordered)
+TS_FIELDS = ("ts", "exit_ts")
+
+BUCKET_FORMATS = {"hourly": "%Y-%m-%dT%H", "daily": "%Y-%m-%d"}
+COMPRESS_EXT = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+def bucket_key(ts, rotate):
+    fmt = BUCKET_FORMATS.get(rotate)
+    if fmt is None:
+        return None
+    return datetime.fromtimestamp(ts, KST).strftime(fmt)
+
+def bucket_end(ts, rotate):
+    """Epoch where the bucket holding ts ends (inf without rotation)."""
+    if rotate not in BUCKET_FORMATS:
+        return float("inf")
+    dt = datetime.fromtimestamp(ts, KST).replace(minute=0, second=0, microsecond=0)
+    if rotate == "hourly":
+        return (dt + timedelta(hours=1)).timestamp()
+    return (dt.replace(hour=0) + timedelta(days=1)).timestamp()
+
+def resolve_compress(compress):
+    if compress == "zstd" and zstandard is None:
+        sys.stderr.write("[ROLLING] zstandard not installed, falling back to gzip\n")
+        return "gzip"
+    return compress if compress in COMPRESS_EXT else "none"
+
+def read_index(idx_path):
+    """Return (ts_list, offset_list) for an index file ([] if missing)."""
+    try:
+        with open(idx_path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return [], []
+    n = len(data) // INDEX_ENTRY.size  # ignore a torn trailing entry
+    entries = [INDEX_ENTRY.unpack_from(data, i * INDEX_ENTRY.size) for i in range(n)]
+    return [e[0] for e in entries], [e[1] for e in entries]
+
+def _compress_block(data, compress):
+    if compress == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+def compress_segment(src, compress):
+    """Compress a closed segment block-by-block along its index, write the
+    compressed index, then remove the plain segment and its index."""
+    dst = src + COMPRESS_EXT[compress]
+    ts_list, offsets = read_index(src + ".idx")
+    size = os.path.getsize(src)
+    if not offsets or offsets[0] != 0:
+        ts_list, offsets = [0.0] + ts_list, [0] + offsets
+    bounds = offsets[1:] + [size]
+
+    tmp = dst + ".tmp"
+    out_index = []
+    with open(src, "rb") as fin, open(tmp, "wb") as fout:
+        for ts, start, end in zip(ts_list, offsets, bounds):
+            if end <= start:
+                continue
+            fin.seek(start)
+            out_index.append((ts, fout.tell()))
+            fout.write(_compress_block(fin.read(end - start), compress))
+        fout.flush()
+        os.fsync(fout.fileno())
+    with open(dst + ".idx", "wb") as f:
+        f.write(b"".join(INDEX_ENTRY.pack(ts, off) for ts, off in out_index))
+    os.replace(tmp, dst)
+    os.remove(src)
+    try:
+        os.remove(src + ".idx")
+    except FileNotFoundError:
+        pass
+    return dst
+
+class _Compressor:
+    """Single background thread compressing closed segments in order."""
+
+    def __init__(self):
+        self.q = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, path, compress):
+        self.q.put((path, compress))
+
+    def _run(self):
+        while True:
+            path, compress = self.q.get()
+            try:
+                compress_segment(path, compress)
+            except Exception as e:
+                sys.stderr.write("[ROLLING] compress failed {}: {}\n".format(path, e))
+                sys.stderr.flush()
+            finally:
+                self.q.task_done()
+
+_compressor = None
+_compressor_lock = threading.Lock()
+
+def _background_compress(path, compress):
+    global _compressor
+    with _compressor_lock:
+        if _compressor is None:
+            _compressor = _Compressor()
+    _compressor.submit(path, compress)
+
+def wait_for_compression():
+    if _compressor is not None:
+        _compressor.q.join()
+
+def _split_name(path):
+    d, name = os.path.split(path)
+    stem = name[:-len(".jsonl")] if name.endswith(".jsonl") else name
+    return d or ".", stem
+
+def list_segments(path):
+    """All segments of a rolling output, oldest first, active file last."""
+    d, stem = _split_name(path)
+    pat = re.compile(r"^" + re.escape(stem) + r"\.(\d{4}-\d{2}-\d{2}(?:T\d{2})?)(?:-(\d+))?\.jsonl(\.gz|\.zst)?$")
+    found = []
+    try:
+        names = os.listdir(d)
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        m = pat.match(name)
+        if m:
+            found.append(((m.group(1), int(m.group(2) or 0)), os.path.join(d, name)))
+    segs = [p for _, p in sorted(found)]
+    if os.path.exists(path):
+        segs.append(path)
+    return segs
+
+class RollingJsonl:
+    """Append-only JSONL writer with time-bucket rotation.
+
+    The active segment keeps its plain name so existing tail readers keep
+    working; closed segments are renamed with their bucket and compressed on
+    a background thread.
+    """
+
+    def __init__(self, path, rotate="daily", compress="gzip", index_every_bytes=INDEX_EVERY_BYTES):
+        self.path = path
+        self.idx_path = path + ".idx"
+        self.rotate = rotate if rotate in BUCKET_FORMATS else "none"
+        self.compress = resolve_compress(compress)
+        self.index_every_bytes = index_every_bytes
+        self.lock = threading.Lock()
+        self.f = None
+        self.fidx = None
+        self.bucket = None
+        self.bucket_end = None      # records before this epoch stay in self.bucket
+        self.last_index_off = None
+        self.max_ts = 0.0
+        self._recover()
+
+    def _recover(self):
+        # Plain rotated segments left behind by a crash: compress them now.
+        if self.compress != "none":
+            for seg in list_segments(self.path):
+                if seg != self.path and seg.endswith(".jsonl"):
+                    _background_compress(seg, self.compress)
+        ts_list, offsets = read_index(self.idx_path)
+        if ts_list and os.path.exists(self.path):
+            self.bucket = bucket_key(ts_list[0], self.rotate)
+            self.max_ts = ts_list[-1]
+            self.last_index_off = offsets[-1]
+        elif os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            # Pre-existing unindexed file (written before rotation existed):
+            # treat it as its own segment starting at its mtime.
+            self.bucket = bucket_key(os.path.getmtime(self.path), self.rotate)
+            with open(self.idx_path, "ab") as f:
+                f.write(INDEX_ENTRY.pack(0.0, 0))
+            self.last_index_off = 0
+
+    def _open(self):
+        self.f = open(self.path, "ab")
+        self.fidx = open(self.idx_path, "ab")
+
+    def _close(self):
+        if self.f is not None:
+            self.f.close()
+            self.fidx.close()
+        self.f = None
+        self.fidx = None
+
+    def _rotate(self):
+        self._close()
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0 and self.bucket is not None:
+            d, stem = _split_name(self.path)
+            dst = os.path.join(d, "{}.{}.jsonl".format(stem, self.bucket))
+            n = 0
+            while any(os.path.exists(dst + ext) for ext in ("", ".gz", ".zst")):
+                n += 1
+                dst = os.path.join(d, "{}.{}-{}.jsonl".format(stem, self.bucket, n))
+            if os.path.exists(self.idx_path):
+                os.replace(self.idx_path, dst + ".idx")
+            try:
+                os.replace(self.path, dst)
+            except PermissionError:
+                # Windows: a reader holds the file open. Copy, then truncate in
+                # place; followers treat the size drop as a rotation.
+                shutil.copyfile(self.path, dst)
+                open(self.path, "wb").close()
+            if self.compress != "none":
+                _background_compress(dst, self.compress)
+        else:
+            for p in (self.path, self.idx_path):
+                if os.path.exists(p):
+                    os.remove(p)
+        self.last_index_off = None
+        self.max_ts = 0.0
+
+    def write_line(self, line, ts):
+        """Append one already-encoded JSON line (no trailing newline)."""
+        data = line.encode("utf-8") + b"\n"
+        with self.lock:
+            # The key is only formatted past the cached bucket boundary
+            if self.bucket_end is None or ts >= self.bucket_end:
+                key = bucket_key(ts, self.rotate)
+                # Only roll forward: a late record from the previous bucket stays
+                # in the current segment instead of bouncing between files.
+                if key is not None and self.bucket is not None and key > self.bucket:
+                    self._rotate()
+                if key is not None and (self.bucket is None or key > self.bucket):
+                    self.bucket = key
+                if key == self.bucket:
+                    self.bucket_end = bucket_end(ts, self.rotate)
+            if self.f is None:
+                self._open()
+            off = self.f.tell()
+            if ts > self.max_ts:
+                self.max_ts = ts
+            if self.last_index_off is None or off - self.last_index_off >= self.index_every_bytes:
+                self.fidx.write(INDEX_ENTRY.pack(self.max_ts, off))
+                self.fidx.flush()
+                self.last_index_off = off
+            self.f.write(data)
+            self.f.flush()
+
+    def write(self, obj, ts):
+        self.write_line(json.dumps(obj, separators=(",", ":")), ts)
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+def _decompressing(f, path):
+    """Stream of decompressed bytes from the current position of f."""
+    if path.endswith(".gz"):
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read " + path)
+        return zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True, closefd=False)
+    return f
+
+def iter_lines(stream, chunk_size=1 << 16):
+    """Bulk-read a byte stream and yield complete lines (bytes, no newline)."""
+    tail = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    if tail:
+        yield tail
+
+def iter_segment_lines(seg, offset=0, chunk_size=1 << 16):
+    """Yield (line, end_offset) for complete lines of one segment, starting at
+    `offset` in uncompressed bytes. Offsets stay valid when the segment is
+    rotated or compressed, so they can be stored as resume points."""
+    with open(seg, "rb") as f:
+        compressed = seg.endswith((".gz", ".zst"))
+        if compressed:
+            stream = _decompressing(f, seg)
+            skip = offset
+            while skip > 0:
+                got = len(stream.read(min(skip, chunk_size)))
+                if not got:
+                    return
+                skip -= got
+        else:
+            f.seek(offset)
+            stream = f
+        pos = offset
+        tail = b""
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                pos += len(line) + 1
+                yield line, pos
+        # A trailing partial line is only complete in a closed segment
+        if tail and compressed:
+            yield tail, pos + len(tail)
+
+def record_ts(rec, ts_field=None):
+    """Time of a record: rec[ts_field], or the first of TS_FIELDS present."""
+    if ts_field is not None:
+        return rec.get(ts_field)
+    for field in TS_FIELDS:
+        ts = rec.get(field)
+        if ts is not None:
+            return ts
+    return None
+
+def iter_range(path, start_ts=None, end_ts=None, ts_field=None):
+    """Yield records of a rolling output with start_ts <= record time <= end_ts,
+    seeking through the sidecar indexes instead of scanning whole files.
+    Raises ValueError when a segment has records but none with the time field."""
+    segs = list_segments(path)
+    indexes = [read_index(seg + ".idx") for seg in segs]
+    starts = [ts_list[0] if ts_list else None for ts_list, _ in indexes]
+
+    for i, seg in enumerate(segs):
+        ts_list, offsets = indexes[i]
+        # Skip segments that end before start_ts (the next one starts earlier)
+        nxt = next((s for s in starts[i + 1:] if s is not None), None)
+        if start_ts is not None and nxt is not None and nxt < start_ts:
+            continue
+        if end_ts is not None and ts_list and ts_list[0] > end_ts + STOP_SLACK_SEC:
+            break
+        offset = 0
+        if start_ts is not None and ts_list:
+            # Entries hold the running max ts, so every record before the last
+            # entry strictly below start_ts is itself below start_ts.
+            j = bisect.bisect_left(ts_list, start_ts) - 1
+            offset = offsets[j] if j >= 0 else 0
+        stop = False
+        parsed = timed = 0
+        with open(seg, "rb") as f:
+            f.seek(offset)
+            for line in iter_lines(_decompressing(f, seg)):
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                parsed += 1
+                try:
+                    ts = float(record_ts(rec, ts_field))
+                except (TypeError, ValueError):
+                    continue
+                timed += 1
+                if end_ts is not None and ts > end_ts + STOP_SLACK_SEC:
+                    stop = True
+                    break
+                if start_ts is not None and ts < start_ts:
+                    continue
+                if end_ts is not None and ts > end_ts:
+                    continue
+                yield rec
+        if parsed and not timed:
+            raise ValueError("{}: no record has {}".format(seg, ts_field or " or ".join(TS_FIELDS)))
+        if stop:
+            break
+
+def parse_time_arg(s):
+    """Epoch seconds, or 'YYYY-mm-dd HH:MM[:SS]' in KST."""
+    if s is None:
+        return None
+    try:
+        return float(s)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(s, fmt).replace(tzinfo=KST).timestamp()
+        except ValueError:
+            continue
+    raise SystemExit("ERROR: cannot parse time {!r}".format(s))
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("cat", help="print records in a time range")
+    c.add_argument("path", help="active file name, e.g. output/raw_rssi.jsonl")
+    c.add_argument("--start")
+    c.add_argument("--end")
+    c.add_argument("--ts-field", help="record time field (default: " + " or ".join(TS_FIELDS) + ")")
+    s = sub.add_parser("segments", help="list segments and their index start times")
+    s.add_argument("path")
+    args = ap.parse_args()
+
+    if args.cmd == "segments":
+        for seg in list_segments(args.path):
+            ts_list, _ = read_index(seg + ".idx")
+            print("{}\t{}\t{} index entries".format(
+                seg, datetime.fromtimestamp(ts_list[0], KST).isoformat() if ts_list else "-", len(ts_list)))
+        return
+
+    out = sys.stdout
+    try:
+        for rec in iter_range(args.path, parse_time_arg(args.start), parse_time_arg(args.end), args.ts_field):
+            out.write(json.dumps(rec, separators=(",", ":")) + "\n")
+    except ValueError as e:
+        raise SystemExit("ERROR: {}".format(e))
+
+if __name__ == "__main__":
+    main()
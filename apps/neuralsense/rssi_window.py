@@ -0,0 +1,177 @@
+# rssi_window.py
+#
+# Per-device, per-Pi RSSI ring buffers and robust sample fusion for
+# run_live_geometry (FUSION=median|trimmed|ewma).
+#
+# - RingWindow: the last FUSION_SAMPLES samples of each Pi for one device, in
+#   two (pis, FUSION_SAMPLES) NumPy arrays (timestamps, RSSI). A push is two
+#   array writes; the Pi rows come from a PiIndex shared by all devices of a
+#   scorer and grow when an unknown Pi shows up.
+# - Fusion.vector(): one vectorized pass over the whole (pis, samples) block.
+#   A Pi is in the vector when it has a sample within PER_PI_FRESH_SEC (same
+#   rule as build_fresh_vector); its value is the median, the trimmed mean
+#   (FUSION_TRIM cut from each end) or a recency-weighted mean (weight halves
+#   every FUSION_HALF_LIFE_SEC) of those samples, so a single multipath spike
+#   no longer moves the whole normalized vector.
+# - Iterating a RingWindow yields (ts, rpi_id, rssi) oldest first, the form
+#   live_checkpoint stores; extend() restores it.
+#
+# Usage (benchmark: cost per message and error against the true vector):
+#   python rssi_window.py
+
+import time
+
+import numpy as np
+
+from config import FUSION_SAMPLES, FUSION_TRIM, FUSION_HALF_LIFE_SEC
+
+METHODS = ("median", "trimmed", "ewma")
+
+class PiIndex:
+    """rpi_id -> buffer row, shared by every RingWindow of one scorer."""
+
+    def __init__(self, pis=()):
+        self.row = {}
+        self.pis = []
+        for pi in pis:
+            self.add(pi)
+
+    def add(self, pi):
+        r = self.row.get(pi)
+        if r is None:
+            r = self.row[pi] = len(self.pis)
+            self.pis.append(pi)
+        return r
+
+class RingWindow:
+    """Last `size` samples of each Pi for one device; empty slots have ts=-inf."""
+
+    __slots__ = ("index", "ts", "rssi", "pos")
+
+    def __init__(self, index, size=FUSION_SAMPLES):
+        n = max(1, len(index.pis))
+        self.index = index
+        self.ts = np.full((n, size), -np.inf)
+        self.rssi = np.zeros((n, size))
+        self.pos = [0] * n
+
+    def push(self, ts, pi, rssi):
+        r = self.index.add(pi)
+        if r >= len(self.pos):
+            self._grow(len(self.index.pis))
+        k = self.pos[r]
+        self.ts[r, k] = ts
+        self.rssi[r, k] = rssi
+        self.pos[r] = (k + 1) % self.ts.shape[1]
+
+    def _grow(self, n):
+        extra = n - len(self.pos)
+        size = self.ts.shape[1]
+        self.ts = np.vstack([self.ts, np.full((extra, size), -np.inf)])
+        self.rssi = np.vstack([self.rssi, np.zeros((extra, size))])
+        self.pos.extend([0] * extra)
+
+    def extend(self, events):
+        for ts, pi, rssi in events:
+            self.push(ts, pi, rssi)
+
+    def __iter__(self):
+        rows, cols = np.nonzero(np.isfinite(self.ts))
+        ts = self.ts[rows, cols]
+        rssi = self.rssi[rows, cols]
+        pis = self.index.pis
+        return iter([(float(ts[i]), pis[rows[i]], int(rssi[i])) for i in np.argsort(ts, kind="stable")])
+
+    def __len__(self):
+        return int(np.isfinite(self.ts).sum())
+
+class Fusion:
+    """Builds fused raw vectors {rpi_id: dBm} from RingWindows."""
+
+    def __init__(self, method, pis=(), size=FUSION_SAMPLES, trim=FUSION_TRIM, half_life_sec=FUSION_HALF_LIFE_SEC):
+        if method not in METHODS:
+            raise ValueError("FUSION must be latest or one of " + ", ".join(METHODS))
+        if not 0.0 <= trim < 0.5:
+            raise ValueError("FUSION_TRIM must be in [0, 0.5)")
+        if size < 1 or half_life_sec <= 0:
+            raise ValueError("FUSION_SAMPLES must be >= 1 and FUSION_HALF_LIFE_SEC > 0")
+        self.method = method
+        self.index = PiIndex(pis)
+        self.size = size
+        self.trim = trim
+        self.half_life_sec = half_life_sec
+
+    def new_window(self):
+        return RingWindow(self.index, self.size)
+
+    def vector(self, w, now_ts, fresh_sec):
+        age = now_ts - w.ts                 # inf for empty slots
+        mask = age <= fresh_sec
+        n = mask.sum(axis=1)
+        rows = np.flatnonzero(n)
+        if not len(rows):
+            return {}
+        mask = mask[rows]
+        n = n[rows]
+        x = w.rssi[rows]
+        if self.method == "ewma":
+            wt = np.where(mask, np.exp2(-age[rows] / self.half_life_sec), 0.0)
+            val = (wt * x).sum(axis=1) / wt.sum(axis=1)
+        else:
+            # Fresh samples first in each row, stale ones pushed to the end as +inf
+            s = np.sort(np.where(mask, x, np.inf), axis=1)
+            r = np.arange(len(rows))
+            if self.method == "median":
+                val = (s[r, (n - 1) // 2] + s[r, n // 2]) / 2.0
+            else:
+                k = (n * self.trim).astype(np.int64)
+                cs = np.zeros((len(rows), s.shape[1] + 1))
+                np.cumsum(np.where(np.isfinite(s), s, 0.0), axis=1, out=cs[:, 1:])
+                val = (cs[r, n - k] - cs[r, k]) / (n - 2 * k)
+        pis = self.index.pis
+        return {pis[i]: v for i, v in zip(rows.tolist(), np.round(val, 1).tolist())}
+
+def _bench(devices=200, pis=8, seconds=30.0, rate=2.0, spike_prob=0.1, seed=0):
+    """Synthetic devices heard by every Pi at `rate` Hz with 3 dB noise and
+    multipath spikes (-15 dB, spike_prob); error of the normalized vector."""
+    rng = np.random.default_rng(seed)
+    names = ["pi{}".format(i) for i in range(pis)]
+    true = rng.uniform(-85, -45, (devices, pis))
+    n = int(seconds * rate * pis)     # messages per device
+    events = []
+    for d in range(devices):
+        ts = np.sort(rng.uniform(0, seconds, n))
+        p = rng.integers(0, pis, n)
+        v = true[d, p] + rng.normal(0, 3, n) - 15.0 * (rng.random(n) < spike_prob)
+        events.extend(zip(ts.tolist(), [d] * n, p.tolist(), np.round(v).astype(int).tolist()))
+    events.sort()
+
+    def norm_err(vec, d):
+        if len(vec) < pis:
+            return None
+        v = np.array([vec[name] for name in names], dtype=np.float64)
+        return float(np.abs((v - np.median(v)) - (true[d] - np.median(true[d]))).mean())
+
+    print("{} messages, {} devices x {} Pis, spikes {:.0%}".format(len(events), devices, pis, spike_prob))
+    for method in ("latest",) + METHODS:
+        fusion = Fusion(method if method != "latest" else "median", names)
+        windows = [fusion.new_window() for _ in range(devices)]
+        latest = [{} for _ in range(devices)]
+        errs = []
+        t0 = time.perf_counter()
+        for ts, d, p, rssi in events:
+            if method == "latest":
+                latest[d][names[p]] = (ts, rssi)
+                vec = {pi: r for pi, (t, r) in latest[d].items() if ts - t <= 3.0}
+            else:
+                windows[d].push(ts, names[p], rssi)
+                vec = fusion.vector(windows[d], ts, 3.0)
+            e = norm_err(vec, d)
+            if e is not None:
+                errs.append(e)
+        dt = time.perf_counter() - t0
+        print("{:>8}: {:6.1f} us/msg, mean |error| {:.2f} dB, p90 {:.2f} dB".format(
+            method, 1e6 * dt / len(events), np.mean(errs), np.percentile(errs, 90)))
+
+if __name__ == "__main__":
+    _bench()
@@ -3,29 +3,47 @@ import os
 import json
 import time
 import csv
+import re
 import sys
-from collections import defaultdict, deque
+from collections import OrderedDict, deque
 from statistics import median
-from datetime import datetime, timezone, timedelta
+from datetime import timezone, timedelta
+import numpy as np
 import paho.mqtt.client as mqtt
 
-MQTT_HOST = "100.87.27.7"
-MQTT_PORT = 1883
+import admission as admission_control
+import device_table
+import jsonl_follow
+import latency_trace
+import live_checkpoint
+import mac_filter
+import record_codec
+import rolling_jsonl
+import rssi_window
+import sniffer_control
+import sqlite_sink
+import stack_sampler
+import zone_aggregates
+import zone_tracker
+from config import MIN_SOURCES, CHECKPOINT_INTERVAL_SEC, OUTPUT_ROTATE, OUTPUT_COMPRESS, ASSIGN_FEED_ADDR
+from config import OCCUPANCY_IDLE_SEC, OCCUPANCY_HISTORY_MIN, OCCUPANCY_HTTP_ADDR, SQLITE_PATH
+from config import MQTT_TOPIC_PREFIX, MULTI_STORE, STORE_ROOT, STORE_IDLE_SEC
+from config import SCORE_CHANNELS, TRACKER, ADMISSION_SHED_LAG_SEC, LATENCY_TRACE_SEC
+from config import MQTT_BROKER_IP, MQTT_BROKER_PORT, MACFILTER, FUSION
+
+MQTT_HOST = MQTT_BROKER_IP
+MQTT_PORT = MQTT_BROKER_PORT
 MQTT_TOPIC = "neuralsense/rssi"
 
 ZONES_CSV = "zones.csv"
 CAL_JSONL = os.path.join("output", "calibration.jsonl")
 
 OUT_DIR = "output"
-OUT_RAW = os.path.join(OUT_DIR, "raw_rssi.jsonl")
-OUT_ASSIGN = os.path.join(OUT_DIR, "zone_assignments.jsonl")
-OUT_TRANS = os.path.join(OUT_DIR, "transitions.jsonl")
-OUT_DWELL = os.path.join(OUT_DIR, "dwells.jsonl")
 OUT_ERR = os.path.join(OUT_DIR, "run_live_errors.jsonl")
-OUT_UNCERTAIN = os.path.join(OUT_DIR, "uncertain_assignments.jsonl")
 
 WINDOW_SEC = 5
-MIN_SOURCES = 8
+# MIN_SOURCES is a per-deployment policy (config.py / env MIN_SOURCES).
+# Vectors with fewer Pis than the full set are scored with the masked path.
 MATCH_DIFF_DBM = 7.0
 
 # Per-Pi freshness gating
@@ -49,18 +67,84 @@ SESSION_RANK_THRESHOLD = 1.5    # max avg rank distance to link sessions
 SESSION_CLEANUP_INTERVAL = 100  # cleanup old sessions every N assignments
 SESSION_MAX_AGE_SEC = 3600.0    # remove sessions not seen in 1 hour
 
+STATS_INTERVAL = 10000          # print yield counters every N ingested messages
+
+# Multi-store mode (MULTI_STORE=1)
+STORE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+STORE_EVICT_CHECK_SEC = 30.0    # how often idle stores are looked for
+STORE_RETRY_SEC = 60.0          # retry a store without calibration after this long
+
 KST = timezone(timedelta(hours=9))
 
-def ts_kst(ts_float):
-    return datetime.fromtimestamp(ts_float, KST).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] + " KST"
+# Cached per-second prefix; same text as strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] + " KST"
+ts_kst = record_codec.kst_str
+
+def store_paths(out_dir):
+    """Output and state paths of one store (single-store mode: OUT_DIR)."""
+    return {
+        "raw": os.path.join(out_dir, "raw_rssi.jsonl"),
+        "raw_deferred": os.path.join(out_dir, "raw_rssi_deferred.jsonl"),
+        "raw_spool": os.path.join(out_dir, "raw_rssi_spool.jsonl"),
+        "assign": os.path.join(out_dir, "zone_assignments.jsonl"),
+        "uncertain": os.path.join(out_dir, "uncertain_assignments.jsonl"),
+        "trans": os.path.join(out_dir, "transitions.jsonl"),
+        "dwell": os.path.join(out_dir, "dwells.jsonl"),
+        "occ": os.path.join(out_dir, "zone_occupancy.jsonl"),
+        "trace": os.path.join(out_dir, "latency_trace.jsonl"),
+        "ckpt": os.path.join(out_dir, "live_state.ckpt"),
+        "lease": os.path.join(out_dir, "session_sid.lease"),
+        "denylist": os.path.join(out_dir, "mac_denylist.json"),
+    }
+
+ROLLING_KEYS = ("raw", "raw_deferred", "raw_spool", "assign", "uncertain", "trans", "dwell", "occ", "trace", "err")   # "err": OUT_ERR, process-wide
+
+# Rolling writers per output path (opened in main); other paths append directly
+OUTPUTS = {}
+
+def open_outputs(paths):
+    for key in ROLLING_KEYS:
+        path = paths.get(key)
+        if path is not None and path not in OUTPUTS:
+            OUTPUTS[path] = rolling_jsonl.RollingJsonl(path, rotate=OUTPUT_ROTATE, compress=OUTPUT_COMPRESS)
+
+# Callables receiving each confident assignment record (in-process feed,
+# UDP feed when ASSIGN_FEED_ADDR is set)
+ASSIGNMENT_LISTENERS = []
+
+def notify_assignment(listeners, rec):
+    for fn in listeners:
+        try:
+            fn(rec)
+        except Exception as e:
+            log_error("assignment_listener", e)
 
-def safe_append_jsonl(path, obj):
+def close_outputs(paths=None):
+    """Close the rolling writers of `paths` (all of them when None)."""
+    keys = list(OUTPUTS) if paths is None else [p for p in paths.values() if p in OUTPUTS]
+    for path in keys:
+        OUTPUTS.pop(path).close()
+
+def safe_append_line(path, line, ts):
+    """Append one already-encoded JSON record."""
     try:
+        w = OUTPUTS.get(path)
+        if w is not None:
+            w.write_line(line, ts)
+            return
         with open(path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(obj, separators=(",", ":")) + "\n")
+            f.write(line + "\n")
+    except Exception as e:
+        sys.stderr.write("[FILE_WRITE_ERROR] {} -> {}\n".format(path, str(e)))
+        sys.stderr.flush()
+
+def safe_append_jsonl(path, obj):
+    try:
+        line = record_codec.dumps(obj)
     except Exception as e:
         sys.stderr.write("[FILE_WRITE_ERROR] {} -> {}\n".format(path, str(e)))
         sys.stderr.flush()
+        return
+    safe_append_line(path, line, rolling_jsonl.record_ts(obj) or time.time())
 
 def log_error(where, exc, extra=None):
     now = time.time()
@@ -71,22 +155,23 @@ def log_error(where, exc, extra=None):
     sys.stderr.write("[ERROR] {}: {}\n".format(where, str(exc)))
     sys.stderr.flush()
 
-def load_zones():
+def load_zones(path=None):
     zones = {}
     try:
-        with open(ZONES_CSV, "r", encoding="utf-8") as f:
+        with open(path or ZONES_CSV, "r", encoding="utf-8") as f:
             for r in csv.DictReader(f):
                 zones[int(r["zone_id"])] = (int(r["x"]), int(r["y"]))
     except Exception as e:
         log_error("load_zones", e)
     return zones
 
-def load_calibration():
+def load_calibration(path=None):
+    path = path or CAL_JSONL
     latest = {}
-    if not os.path.exists(CAL_JSONL):
+    if not os.path.exists(path):
         return latest
     try:
-        with open(CAL_JSONL, "r", encoding="utf-8") as f:
+        with open(path, "r", encoding="utf-8") as f:
             for line in f:
                 try:
                     rec = json.loads(line)
@@ -110,8 +195,8 @@ def median_list(nums):
     return float(s[mid]) if n % 2 else (s[mid - 1] + s[mid]) / 2.0
 
 def normalize_live_vector(vec):
-    m = median_list([int(v) for v in vec.values()])
-    return {pi: round(int(rssi) - m, 1) for pi, rssi in vec.items()}
+    m = median_list([float(v) for v in vec.values()])
+    return {pi: round(float(rssi) - m, 1) for pi, rssi in vec.items()}
 
 def avg_diff_norm(live_norm, cal_norm):
     common = [p for p in live_norm if p in cal_norm]
@@ -228,7 +313,157 @@ def score_top_two_zones(live_norm, cal, pi_weights=None):
 
     return best_zone, float(best_conf), second_zone, float(second_conf)
 
-def build_fresh_vector(events_deque, now_ts):
+# --- Masked partial-vector scoring (vectorized) ---
+
+def compile_calibration(cal, pi_weights=None):
+    """Pack calibration vectors into dense arrays for masked scoring.
+    Missing Pis are NaN in "vals"; row weights follow compute_pi_weights
+    (uniform when pi_weights is None). "ranks" orders each row's Pis like
+    rank_vector (ties in the vector's own key order, missing Pis last).
+    """
+    pis = sorted({p for rec in cal.values() for v in rec.get("vectors", []) for p in v})
+    col = {p: i for i, p in enumerate(pis)}
+    zone_ids = []
+    rows = []
+    row_order = []
+    row_zone = []
+    row_w = []
+    for zid, rec in cal.items():
+        vectors = rec.get("vectors", [])
+        if not vectors:
+            continue
+        zid_int = int(zid)
+        w = pi_weights.get(zid_int) if pi_weights else None
+        wrow = [float(w.get(p, 0.5)) if w is not None else 1.0 for p in pis]
+        zi = len(zone_ids)
+        zone_ids.append(zid_int)
+        for v in vectors:
+            row = [float("nan")] * len(pis)
+            order = [len(pis)] * len(pis)
+            for i, (p, val) in enumerate(v.items()):
+                row[col[p]] = float(val)
+                order[col[p]] = i
+            rows.append(row)
+            row_order.append(order)
+            row_zone.append(zi)
+            row_w.append(wrow)
+
+    vals = np.array(rows, dtype=np.float64).reshape(len(rows), len(pis))
+    order = np.array(row_order, dtype=np.int64).reshape(len(rows), len(pis))
+    present = ~np.isnan(vals)
+    row_zone = np.array(row_zone, dtype=np.int64)
+    return {
+        "pis": pis,
+        "col": col,
+        "zone_ids": zone_ids,
+        "vals": vals,
+        "present": present,
+        "ranks": _ranks(vals, order),
+        "complete": bool(present.all()),
+        "weights": np.array(row_w, dtype=np.float64).reshape(len(rows), len(pis)),
+        "row_zone": row_zone,
+        "zone_counts": np.bincount(row_zone, minlength=len(zone_ids)).astype(np.float64),
+    }
+
+def _ranks(vals, order):
+    """Row-wise rank (0 = strongest). Equal values rank by `order` (the Pi's
+    position in its source dict, as rank_vector's stable sort); NaN entries
+    rank after all present Pis."""
+    keyed = np.where(np.isnan(vals), np.inf, -vals)
+    idx = np.lexsort((order, keyed))
+    ranks = np.empty_like(idx)
+    np.put_along_axis(ranks, idx, np.arange(idx.shape[-1]), axis=-1)
+    return ranks
+
+def _rerank(ranks, mask=None):
+    """Ranks over the Pis in `mask` only, renumbered from 0 (same order)."""
+    if mask is not None:
+        ranks = np.where(mask, ranks, ranks.shape[-1])
+    return np.argsort(np.argsort(ranks, axis=-1, kind="stable"), axis=-1, kind="stable")
+
+def masked_distances(raw_vec, model):
+    """Weighted L1 and rank distance from a (possibly partial) raw vector to
+    every calibration row. Missing Pis are excluded per row; both sides are
+    re-centred on the median of the common set and ranks are recomputed over
+    it, so a 6-of-8 vector is compared like-for-like.
+    Returns (l1, rank_dist), inf where a row shares no Pis with the vector.
+    """
+    live = np.full(len(model["pis"]), np.nan)
+    live_order = np.full(len(model["pis"]), len(raw_vec))
+    for i, (pi, rssi) in enumerate(raw_vec.items()):
+        c = model["col"].get(pi)
+        if c is not None:
+            live[c] = float(rssi)
+            live_order[c] = i
+    present = ~np.isnan(live)
+    vals = model["vals"]
+    weights = model["weights"]
+
+    if model["complete"]:
+        # Every calibration row has every Pi: the common set is the live set.
+        if not present.any():
+            inf = np.full(len(vals), np.inf)
+            return inf, inf
+        live_s = live[present]
+        live_c = np.round(live_s - np.median(live_s), 1)
+        cal_s = vals[:, present]
+        if not present.all():
+            cal_s = cal_s - np.median(cal_s, axis=1)[:, None]
+        w = weights[:, present]
+        l1 = (w * np.abs(live_c[None, :] - cal_s)).sum(axis=1) / w.sum(axis=1)
+        live_r = _ranks(live_c[None, :], live_order[present][None, :])
+        # Calibration ranks are precomputed; a subset only renumbers them
+        cal_r = model["ranks"] if present.all() else _rerank(model["ranks"][:, present])
+        rd = np.abs(live_r - cal_r).mean(axis=1)
+        return l1, rd
+
+    mask = model["present"] & present[None, :]
+    n = mask.sum(axis=1)
+    with np.errstate(all="ignore"):
+        live_m = np.where(mask, live[None, :], np.nan)
+        cal_m = np.where(mask, vals, np.nan)
+        live_m = np.round(live_m - np.nanmedian(live_m, axis=1)[:, None], 1)
+        cal_m = cal_m - np.nanmedian(cal_m, axis=1)[:, None]
+        w = np.where(mask, weights, 0.0)
+        l1 = np.nansum(w * np.abs(live_m - cal_m), axis=1) / w.sum(axis=1)
+        live_r = _ranks(live_m, np.broadcast_to(live_order, live_m.shape))
+        rd = np.where(mask, np.abs(live_r - _rerank(model["ranks"], mask)), 0).sum(axis=1) / n
+    empty = n == 0
+    l1[empty] = np.inf
+    rd[empty] = np.inf
+    return l1, rd
+
+def zone_confidences(l1, rd, model, match_diff=MATCH_DIFF_DBM, rank_threshold=RANK_MATCH_THRESHOLD,
+                     l1_weight=L1_WEIGHT, rank_weight=RANK_WEIGHT):
+    """Per-zone confidence (mean composite score), ordered as model["zone_ids"]."""
+    score = l1_weight * (l1 <= match_diff) + rank_weight * (rd <= rank_threshold)
+    return np.bincount(model["row_zone"], weights=score,
+                       minlength=len(model["zone_ids"])) / model["zone_counts"]
+
+def top_two(conf, model):
+    """(best_zone, best_conf, second_zone, second_conf) from a confidence array."""
+    if len(conf) == 0:
+        return None, 0.0, None, 0.0
+    order = np.argsort(-conf, kind="stable")
+    best = order[0]
+    if len(order) > 1:
+        second = order[1]
+        return (model["zone_ids"][best], float(conf[best]),
+                model["zone_ids"][second], float(conf[second]))
+    return model["zone_ids"][best], float(conf[best]), None, 0.0
+
+def score_top_two_zones_masked(raw_vec, model):
+    """Masked equivalent of score_top_two_zones; takes the raw (un-normalized) vector."""
+    l1, rd = masked_distances(raw_vec, model)
+    return top_two(zone_confidences(l1, rd, model), model)
+
+def push_event(events_deque, rx_ts, rpi_id, rssi, window_sec=WINDOW_SEC):
+    events_deque.append((rx_ts, rpi_id, rssi))
+    cutoff = rx_ts - window_sec
+    while events_deque and events_deque[0][0] < cutoff:
+        events_deque.popleft()
+
+def build_fresh_vector(events_deque, now_ts, fresh_sec=PER_PI_FRESH_SEC):
     # latest_by_pi[pi] = (ts, rssi)
     latest_by_pi = {}
     for ts, pi, rssi in events_deque:
@@ -238,228 +473,430 @@ def build_fresh_vector(events_deque, now_ts):
 
     vec = {}
     for pi, (ts, rssi) in latest_by_pi.items():
-        if (now_ts - ts) <= PER_PI_FRESH_SEC:
+        if (now_ts - ts) <= fresh_sec:
             vec[pi] = int(rssi)
     return vec
 
-def main():
-    os.makedirs(OUT_DIR, exist_ok=True)
-    zones = load_zones()
-    cal = load_calibration()
-    if not cal:
-        print("ERROR: output/calibration.jsonl missing or has no vectors. Run calibration first.")
-        return
+def make_scorer(store, zones, model, paths, listeners, admission=None):
+    """Tracking state and per-message handler for one store.
 
-    # Improvement B: precompute per-zone per-Pi weights from calibration variance
-    pi_weights = compute_pi_weights(cal)
-
-    print("LIVE MODE STARTED (rx-time, normalized matching, NO hysteresis)")
-    print("MIN_SOURCES =", MIN_SOURCES)
-    print("WINDOW_SEC  =", WINDOW_SEC)
-    print("PER_PI_FRESH_SEC =", PER_PI_FRESH_SEC)
-    print("MATCH_DIFF_DBM (normalized) =", MATCH_DIFF_DBM)
-    print("MARGIN_GATE =", MARGIN_GATE)
-    print("RANK_WEIGHT =", RANK_WEIGHT, "| L1_WEIGHT =", L1_WEIGHT)
-    print("TRANSITION_CONFIRM_COUNT =", TRANSITION_CONFIRM_COUNT)
-    print("STALE_MAC_SEC =", STALE_MAC_SEC)
-    print("Broker:", MQTT_HOST, "Topic:", MQTT_TOPIC)
-    print("Zones loaded:", len(zones), "| Cal zones:", len(cal))
-
-    buf = defaultdict(lambda: deque())
+    Returns {"handle": fn(evt, rx_ts), "close": fn(), "occ": ZoneAggregator,
+    "last_rx": [ts]}. Sessions, checkpoints and outputs live under `paths`.
+    With an AdmissionController, unestablished devices are shed under load.
+    """
+    tag = "[{}] ".format(store) if store else ""
+    sink = None
+    if SQLITE_PATH:
+        db = SQLITE_PATH
+        if store:   # one database per store, next to its outputs
+            db = os.path.join(os.path.dirname(paths["assign"]), os.path.basename(SQLITE_PATH))
+        sink = sqlite_sink.SqliteSink(db, on_error=log_error)
+        listeners = listeners + [sink.assignment]
+
+    # FUSION=latest: deque of (ts, pi, rssi) over WINDOW_SEC, newest sample per Pi;
+    # otherwise per-Pi ring buffers fused by rssi_window
+    fusion = rssi_window.Fusion(FUSION, model["pis"]) if FUSION != "latest" else None
+    new_window = fusion.new_window if fusion is not None else deque
+    # Keyed by packed MAC, least recently heard first; a buffer silent for
+    # WINDOW_SEC holds nothing fresh and is dropped (prune_buffers)
+    buf = OrderedDict()
+    buf_ts = {}     # packed MAC -> last event ts
 
     # Transition state — keyed by session_id
     state = {}      # session_id -> (zone_id, enter_ts)
     pending = {}    # session_id -> (candidate_zone, count, first_ts)
+    # TRACKER=hmm: transitions come from the HMM tracker instead of the debounce
+    tracker = zone_tracker.HmmTracker(model["zone_ids"], zones) if TRACKER == "hmm" else None
 
     # Session linking for randomized MACs
     next_sid = [1]          # mutable counter for closure
-    mac_to_sid = {}         # MAC -> session_id
-    sid_last_seen = {}      # session_id -> (ts, norm_vector)
-    mac_last_seen_ts = {}   # MAC -> last seen timestamp
+    sessions = device_table.SessionTable()  # packed MAC -> session_id, last seen ts, rank vectors
     assign_count = [0]      # periodic cleanup counter
 
-    def resolve_session(phone, live_norm, now_ts):
-        """Resolve a MAC address to a stable session_id.
+    # Restore tracking state from the last checkpoint (sessions, open dwells, buffers)
+    t0 = time.perf_counter()
+    snap = live_checkpoint.load_snapshot(paths["ckpt"], time.time(), SESSION_MAX_AGE_SEC, WINDOW_SEC)
+    if snap is not None:
+        state.update(snap["state"])
+        pending.update(snap["pending"])
+        sessions.restore(snap["sessions"])
+        restored = [(max(e[0] for e in events), key, events) for key, events in snap["buf"].items() if events]
+        for last_ts, key, events in sorted(restored, key=lambda r: r[0]):
+            buf[key] = new_window()
+            buf[key].extend(events)
+            buf_ts[key] = last_ts
+        next_sid[0] = snap["next_sid"]
+        print(tag + "[CHECKPOINT] Restored {} sessions, {} MACs, {} buffers from {} in {:.3f}s (pruned {} old sessions)".format(
+            sessions.sessions(), len(sessions), len(snap["buf"]), ts_kst(snap["saved_ts"]),
+            time.perf_counter() - t0, snap["dropped_sessions"]))
+    # The lease covers every ID handed out since the last snapshot
+    sid_lease = [live_checkpoint.read_sid_lease(paths["lease"])]
+    next_sid[0] = max(next_sid[0], sid_lease[0])
+
+    ckpt_writer = live_checkpoint.SnapshotWriter(paths["ckpt"], on_error=log_error)
+
+    # Per-zone occupancy / entries / exits / dwell sketches, one record per minute
+    def emit_occupancy(rec):
+        rec["ts_kst"] = ts_kst(rec["ts"])
+        safe_append_jsonl(paths["occ"], rec)
+
+    occ = zone_aggregates.ZoneAggregator(OCCUPANCY_IDLE_SEC, OCCUPANCY_HISTORY_MIN, emit=emit_occupancy)
+
+    # Per-Pi clock offset / network lag and capture->assignment latency
+    def emit_trace(rec):
+        rec["ts_kst"] = ts_kst(rec["ts"])
+        safe_append_jsonl(paths["trace"], rec)
+
+    tracer = latency_trace.LatencyTracer(emit_trace, tag=tag) if LATENCY_TRACE_SEC > 0 else None
+    # Broadcast/multicast and denylisted static devices are archived, not scored
+    macfilter = mac_filter.MacFilter(paths["denylist"], tag=tag) if MACFILTER else None
+    last_ckpt_ts = [time.time()]
+    last_rx = [time.time()]
+
+    def allocate_sid():
+        if next_sid[0] >= sid_lease[0]:
+            sid_lease[0] = next_sid[0] + live_checkpoint.SID_LEASE_BLOCK
+            live_checkpoint.write_sid_lease(paths["lease"], sid_lease[0])
+        sid = "S{:04d}".format(next_sid[0])
+        next_sid[0] += 1
+        return sid
+
+    def prune_buffers(now_ts):
+        """Drop the buffers with no event in WINDOW_SEC (oldest first, stops at
+        the first fresh one)."""
+        cutoff = now_ts - WINDOW_SEC
+        while buf:
+            key = next(iter(buf))
+            if buf_ts[key] >= cutoff:
+                return
+            del buf[key], buf_ts[key]
+
+    def snapshot(now_ts):
+        prune_buffers(now_ts)       # only fresh buffers are copied
+        return live_checkpoint.copy_tables(
+            now_ts, next_sid[0], state, pending, sessions.columns(), buf)
+
+    def maybe_checkpoint(now_ts):
+        if CHECKPOINT_INTERVAL_SEC <= 0 or now_ts - last_ckpt_ts[0] < CHECKPOINT_INTERVAL_SEC:
+            return
+        if ckpt_writer.busy():
+            return
+        last_ckpt_ts[0] = now_ts
+        try:
+            ckpt_writer.submit(snapshot(now_ts))
+        except Exception as e:
+            log_error("checkpoint", e)
+
+    # Yield counters: how much of the input turns into assignments
+    counts = {"ingested": 0, "scored": 0, "assigned": 0, "uncertain": 0, "spooled": 0, "shed": 0, "filtered": 0}
+    by_channel = {}     # channel -> ingested messages tagged with it
+
+    def report_counts():
+        n = counts["ingested"]
+        per_1k = 1000.0 * counts["assigned"] / n if n else 0.0
+        print(tag + "[STATS] ingested={} scored={} assigned={} uncertain={} spooled={} shed={} filtered={} | assignments/1k msgs={:.1f}".format(
+            n, counts["scored"], counts["assigned"], counts["uncertain"], counts["spooled"], counts["shed"],
+            counts["filtered"], per_1k))
+        if macfilter is not None and counts["filtered"]:
+            print(tag + "[STATS] filter:", macfilter.summary())
+        if admission is not None and counts["shed"]:
+            print(tag + "[STATS] admission: level={} lag={:.2f}s {}".format(
+                admission.level, admission.lag, admission.summary()))
+        if by_channel:
+            print(tag + "[STATS] per channel: " + " ".join(
+                "ch{}={}".format(c, by_channel[c]) for c in sorted(by_channel)))
+
+    def resolve_session(key, phone, live_norm, now_ts):
+        """Resolve a MAC address (packed `key`) to a stable session_id.
         If the MAC is new and a recently-stale session has a matching RSSI
         signature, link them (handles MAC randomization).
         """
-        mac_last_seen_ts[phone] = now_ts
-
         # Known MAC — return existing session
-        if phone in mac_to_sid:
-            sid = mac_to_sid[phone]
-            sid_last_seen[sid] = (now_ts, live_norm)
+        sid = sessions.touch(key, now_ts, live_norm)
+        if sid is not None:
             return sid
 
-        # New MAC — try to match against stale sessions
-        best_sid = None
-        best_dist = float("inf")
-        stale_cutoff = now_ts - STALE_MAC_SEC
-        checked_sids = set()
-
-        for old_mac, old_sid in mac_to_sid.items():
-            if old_sid in checked_sids:
-                continue
-            old_ts = mac_last_seen_ts.get(old_mac, 0)
-            if old_ts > stale_cutoff:
-                continue  # still active, skip
-            checked_sids.add(old_sid)
-            old_info = sid_last_seen.get(old_sid)
-            if old_info is None:
-                continue
-            old_vec = old_info[1]
-            live_ranks = rank_vector(live_norm)
-            old_ranks = rank_vector(old_vec)
-            dist = rank_distance(live_ranks, old_ranks)
-            if dist < best_dist:
-                best_dist = dist
-                best_sid = old_sid
-
+        # New MAC — try to match against the rank vectors of stale sessions
+        best_sid, best_dist = sessions.match(live_norm, now_ts - STALE_MAC_SEC)
         if best_sid is not None and best_dist <= SESSION_RANK_THRESHOLD:
-            mac_to_sid[phone] = best_sid
-            sid_last_seen[best_sid] = (now_ts, live_norm)
-            print("[SESSION] Linked MAC {} -> {} (rank_dist={:.2f})".format(
+            sessions.assign(key, best_sid, now_ts, live_norm)
+            print(tag + "[SESSION] Linked MAC {} -> {} (rank_dist={:.2f})".format(
                 phone[:8] + "...", best_sid, best_dist))
             return best_sid
 
         # No match — create new session
-        sid = "S{:04d}".format(next_sid[0])
-        next_sid[0] += 1
-        mac_to_sid[phone] = sid
-        sid_last_seen[sid] = (now_ts, live_norm)
-        print("[SESSION] New MAC {} -> {}".format(phone[:8] + "...", sid))
+        sid = allocate_sid()
+        sessions.assign(key, sid, now_ts, live_norm)
+        print(tag + "[SESSION] New MAC {} -> {}".format(phone[:8] + "...", sid))
         return sid
 
     def cleanup_sessions(now_ts):
         """Remove sessions not seen in SESSION_MAX_AGE_SEC."""
-        cutoff = now_ts - SESSION_MAX_AGE_SEC
-        stale_sids = set()
-        for sid, (ts, _) in list(sid_last_seen.items()):
-            if ts < cutoff:
-                stale_sids.add(sid)
+        stale_sids, stale_keys = sessions.expire(now_ts - SESSION_MAX_AGE_SEC)
         if not stale_sids:
             return
         for sid in stale_sids:
-            sid_last_seen.pop(sid, None)
             state.pop(sid, None)
             pending.pop(sid, None)
-        stale_macs = [m for m, s in mac_to_sid.items() if s in stale_sids]
-        for m in stale_macs:
-            del mac_to_sid[m]
-            mac_last_seen_ts.pop(m, None)
-            buf.pop(m, None)
-        print("[SESSION] Cleaned up {} stale sessions, {} MACs".format(
-            len(stale_sids), len(stale_macs)))
-
-    def on_connect(client, userdata, flags, rc):
-        print("[MQTT] Connected rc=", rc)
-        try:
-            client.subscribe(MQTT_TOPIC)
-            print("[MQTT] Subscribed to", MQTT_TOPIC)
-        except Exception as e:
-            log_error("on_connect/subscribe", e)
-
-    def on_message(client, userdata, msg):
-        rx_ts = time.time()
-
-        try:
-            evt = json.loads(msg.payload.decode("utf-8"))
-        except Exception as e:
-            log_error("json_decode", e)
-            return
-
+            if tracker is not None:
+                tracker.release(sid)
+            occ.leave(sid, now_ts)
+        for key in stale_keys:
+            if buf.pop(key, None) is not None:
+                del buf_ts[key]
+        print(tag + "[SESSION] Cleaned up {} stale sessions, {} MACs".format(
+            len(stale_sids), len(stale_keys)))
+
+    def enter_first(sid, phone, zone_id, enter_ts, now_ts, conf):
+        state[sid] = (zone_id, enter_ts)
+        pending.pop(sid, None)
+        occ.move(sid, zone_id, now_ts)
+        trans_rec = {
+            "ts": now_ts, "ts_kst": ts_kst(now_ts),
+            "phone_id": phone, "session_id": sid,
+            "from_zone": None,
+            "to_zone": zone_id,
+            "confidence": conf
+        }
+        safe_append_jsonl(paths["trans"], trans_rec)
+        if sink is not None:
+            sink.transition(trans_rec)
+
+    def confirm_transition(sid, phone, zone_id, exit_ts, now_ts, conf):
+        prev_zone, enter_ts = state[sid]
+        dwell_rec = {
+            "phone_id": phone, "session_id": sid,
+            "zone_id": int(prev_zone),
+            "enter_ts": float(enter_ts),
+            "enter_ts_kst": ts_kst(float(enter_ts)),
+            "exit_ts": exit_ts,
+            "exit_ts_kst": ts_kst(exit_ts),
+            "dwell_sec": exit_ts - float(enter_ts)
+        }
+        safe_append_jsonl(paths["dwell"], dwell_rec)
+        occ.dwell(int(prev_zone), exit_ts - float(enter_ts), now_ts)
+        trans_rec = {
+            "ts": now_ts, "ts_kst": ts_kst(now_ts),
+            "phone_id": phone, "session_id": sid,
+            "from_zone": int(prev_zone),
+            "to_zone": zone_id,
+            "confidence": conf
+        }
+        safe_append_jsonl(paths["trans"], trans_rec)
+        if sink is not None:
+            sink.dwell(dwell_rec)
+            sink.transition(trans_rec)
+        state[sid] = (zone_id, exit_ts)
+        pending.pop(sid, None)
+        occ.move(sid, zone_id, now_ts)
+
+    def step_tracker(now_ts):
+        for sid, phone, _, to_zone, lead_ts, post in tracker.step(now_ts):
+            if sid not in state:
+                enter_first(sid, phone, to_zone, lead_ts, now_ts, post)
+            elif state[sid][0] != to_zone:
+                confirm_transition(sid, phone, to_zone, lead_ts, now_ts, post)
+
+    def write_raw(line, ts):
+        safe_append_line(paths["raw"], line, ts)
+
+    def write_deferred(line, ts):
+        # Own file: written back late, but in rx order (iter_range stays exact)
+        safe_append_line(paths["raw_deferred"], line, ts)
+
+    def parse(evt):
+        """(phone, rpi_id, rssi, ch) of an event, None if the RSSI is bad."""
         phone = str(evt.get("mac", "")).lower().strip()
         rpi_id = str(evt.get("rpi_id", "")).strip().lower()
         try:
             rssi = int(evt.get("rssi"))
         except Exception as e:
             log_error("parse_rssi", e, extra={"evt": evt})
+            return None
+        ch = evt.get("ch")
+        if ch is not None:
+            try:
+                ch = int(ch)
+            except Exception:
+                ch = None
+        return phone, rpi_id, rssi, ch
+
+    def archive(evt, rx_ts):
+        """Intake item older than ADMISSION_MAX_AGE_SEC: raw line only
+        (TRACK_MACS and spool records take the normal path)."""
+        if evt.get("spool") or str(evt.get("mac", "")).lower().strip() in admission.tracked:
+            handle(evt, rx_ts)
+            return
+        last_rx[0] = rx_ts
+        parsed = parse(evt)
+        if parsed is None:
+            return
+        phone, rpi_id, rssi, ch = parsed
+        write_raw(record_codec.raw_line(rx_ts, ts_kst(rx_ts), phone, rpi_id, rssi, ch), rx_ts)
+        counts["shed"] += 1
+
+    def handle(evt, rx_ts):
+        last_rx[0] = rx_ts
+        start_ts = time.time() if tracer is not None else None
+        parsed = parse(evt)
+        if parsed is None:
+            return
+        phone, rpi_id, rssi, ch = parsed
+
+        if evt.get("spool"):
+            # Drained from a Pi's outage spool: archived under its Pi timestamp
+            # for replay/sweep, but too old for the rx-time live scorer. Own
+            # file, so raw_rssi.jsonl stays in rx order for iter_range.
+            try:
+                pi_ts = float(evt["ts"])
+            except Exception as e:
+                log_error("parse_spool_ts", e, extra={"evt": evt})
+                return
+            safe_append_line(paths["raw_spool"], record_codec.raw_line(pi_ts, ts_kst(pi_ts), phone, rpi_id, rssi, ch), pi_ts)
+            counts["spooled"] += 1
             return
 
-        safe_append_jsonl(OUT_RAW, {
-            "ts": rx_ts, "ts_kst": ts_kst(rx_ts),
-            "phone_id": phone, "rpi_id": rpi_id, "rssi": rssi
-        })
-
-        d = buf[phone]
-        d.append((rx_ts, rpi_id, rssi))
-        cutoff = rx_ts - WINDOW_SEC
-        while d and d[0][0] < cutoff:
-            d.popleft()
-
-        raw_vec = build_fresh_vector(d, rx_ts)
+        pi_ts = None
+        if tracer is not None:
+            try:
+                pi_ts = float(evt["ts"])
+            except Exception:
+                pass
+            else:
+                tracer.observe(rpi_id, pi_ts, rx_ts)
+            tracer.maybe_report(rx_ts)
+
+        kst = ts_kst(rx_ts)
+        raw = record_codec.raw_line(rx_ts, kst, phone, rpi_id, rssi, ch)
+        if macfilter is not None:
+            macfilter.tick(rx_ts)
+            if macfilter.check(phone, rx_ts) is not None:
+                write_raw(raw, rx_ts)
+                counts["filtered"] += 1
+                return
+        key = device_table.pack_mac(phone)     # session table and buffer key
+        if admission is not None:
+            sid = sessions.sid_of(key)
+            if sid is not None and sid in state:
+                priority = admission_control.PRIORITY      # zone confirmed
+            elif sid is not None or key in buf:
+                priority = admission_control.LOW_SAMPLE
+            else:
+                priority = admission_control.NEW_MAC
+            if not admission.admit(phone, priority):
+                admission.defer(write_deferred, raw, rx_ts)     # written back once the lag is gone
+                counts["shed"] += 1
+                return
+            admission.flush_some()
+        write_raw(raw, rx_ts)
+
+        counts["ingested"] += 1
+        if ch is not None:
+            by_channel[ch] = by_channel.get(ch, 0) + 1
+        if counts["ingested"] % STATS_INTERVAL == 0:
+            report_counts()
+        maybe_checkpoint(rx_ts)
+        occ.tick(rx_ts)
+        if tracker is not None and tracker.due(rx_ts):
+            step_tracker(rx_ts)
+        if SCORE_CHANNELS and ch is not None and ch not in SCORE_CHANNELS:
+            return      # archived in raw_rssi, not scored
+
+        d = buf.get(key)
+        if d is None:
+            d = buf[key] = new_window()
+        else:
+            buf.move_to_end(key)
+        buf_ts[key] = rx_ts
+        prune_buffers(rx_ts)
+        if fusion is None:
+            push_event(d, rx_ts, rpi_id, rssi)
+            raw_vec = build_fresh_vector(d, rx_ts)
+        else:
+            d.push(rx_ts, rpi_id, rssi)
+            raw_vec = fusion.vector(d, rx_ts, PER_PI_FRESH_SEC)
         sources = sorted(raw_vec.keys())
         if len(sources) < MIN_SOURCES:
             return
 
         live_norm = normalize_live_vector(raw_vec)
-        best_zone, best_conf, second_zone, second_conf = score_top_two_zones(live_norm, cal, pi_weights)
+        l1, rd = masked_distances(raw_vec, model)
+        conf = zone_confidences(l1, rd, model)
+        best_zone, best_conf, second_zone, second_conf = top_two(conf, model)
+        counts["scored"] += 1
         if best_zone is None:
             return
 
         margin = best_conf - second_conf
         x, y = zones.get(best_zone, (None, None))
+        second_zone = int(second_zone) if second_zone is not None else None
 
         # Resolve session (handles randomized MACs)
-        sid = resolve_session(phone, live_norm, rx_ts)
+        sid = resolve_session(key, phone, live_norm, rx_ts)
 
         # Periodic cleanup of old sessions
         assign_count[0] += 1
         if assign_count[0] % SESSION_CLEANUP_INTERVAL == 0:
             cleanup_sessions(rx_ts)
 
+        if tracker is not None:
+            # Every scored vector, margin-gated or not, is HMM evidence
+            cur = state.get(sid)
+            tracker.observe(sid, phone, conf, rx_ts, cur[0] if cur else None)
+            if cur is not None:
+                occ.touch(sid, cur[0], rx_ts)
+
         # Improvement A: Margin gating — skip ambiguous predictions
         if margin < MARGIN_GATE:
-            safe_append_jsonl(OUT_UNCERTAIN, {
+            counts["uncertain"] += 1
+            safe_append_line(paths["uncertain"], record_codec.uncertain_line(
+                rx_ts, kst, phone, sid, int(best_zone), float(best_conf), second_zone, float(second_conf),
+                round(margin, 4), record_codec.vector_fragment(sources, raw_vec)), rx_ts)
+            return
+
+        # Log assignment (confident prediction)
+        counts["assigned"] += 1
+        safe_append_line(paths["assign"], record_codec.assignment_line(
+            rx_ts, kst, phone, sid, int(best_zone), x, y, float(best_conf), second_zone, float(second_conf),
+            round(margin, 4), record_codec.vector_fragment(sources, raw_vec)), rx_ts)
+        if pi_ts is not None:
+            tracer.assignment(rpi_id, pi_ts, rx_ts, start_ts, time.time())
+        if macfilter is not None:
+            macfilter.observe_assignment(phone, int(best_zone), rx_ts)
+        if listeners:
+            # Dict form only for in-process listeners (feed, SQLite sink)
+            rec = {
                 "ts": rx_ts,
-                "ts_kst": ts_kst(rx_ts),
+                "ts_kst": kst,
                 "phone_id": phone,
                 "session_id": sid,
                 "zone_id": int(best_zone),
+                "x": x,
+                "y": y,
                 "confidence": float(best_conf),
-                "second_zone_id": int(second_zone) if second_zone is not None else None,
+                "second_zone_id": second_zone,
                 "second_confidence": float(second_conf),
                 "margin": round(margin, 4),
                 "sources": sources,
                 "vector": raw_vec,
                 "timebase": "rx_time_laptop"
-            })
-            return
+            }
+            if store:
+                rec["store_id"] = store
+            notify_assignment(listeners, rec)
 
-        # Log assignment (confident prediction)
-        safe_append_jsonl(OUT_ASSIGN, {
-            "ts": rx_ts,
-            "ts_kst": ts_kst(rx_ts),
-            "phone_id": phone,
-            "session_id": sid,
-            "zone_id": int(best_zone),
-            "x": x,
-            "y": y,
-            "confidence": float(best_conf),
-            "second_zone_id": int(second_zone) if second_zone is not None else None,
-            "second_confidence": float(second_conf),
-            "margin": round(margin, 4),
-            "sources": sources,
-            "vector": raw_vec,
-            "timebase": "rx_time_laptop"
-        })
+        if tracker is not None:
+            return
 
         # --- Transitions/dwells with debounce (keyed by session_id) ---
 
         # First time seeing this session
         if sid not in state:
-            state[sid] = (int(best_zone), rx_ts)
-            pending.pop(sid, None)
-            safe_append_jsonl(OUT_TRANS, {
-                "ts": rx_ts, "ts_kst": ts_kst(rx_ts),
-                "phone_id": phone, "session_id": sid,
-                "from_zone": None,
-                "to_zone": int(best_zone),
-                "confidence": float(best_conf)
-            })
+            enter_first(sid, phone, int(best_zone), rx_ts, rx_ts, float(best_conf))
             return
 
         prev_zone, enter_ts = state[sid]
+        occ.touch(sid, prev_zone, rx_ts)
 
         if prev_zone == int(best_zone):
             # Same zone as confirmed — clear any pending transition (spike resolved)
@@ -473,37 +910,245 @@ def main():
             count = p[1] + 1
             if count >= TRANSITION_CONFIRM_COUNT:
                 # Confirmed transition
-                safe_append_jsonl(OUT_DWELL, {
-                    "phone_id": phone, "session_id": sid,
-                    "zone_id": int(prev_zone),
-                    "enter_ts": float(enter_ts),
-                    "enter_ts_kst": ts_kst(float(enter_ts)),
-                    "exit_ts": p[2],
-                    "exit_ts_kst": ts_kst(p[2]),
-                    "dwell_sec": p[2] - float(enter_ts)
-                })
-                safe_append_jsonl(OUT_TRANS, {
-                    "ts": rx_ts, "ts_kst": ts_kst(rx_ts),
-                    "phone_id": phone, "session_id": sid,
-                    "from_zone": int(prev_zone),
-                    "to_zone": int(best_zone),
-                    "confidence": float(best_conf)
-                })
-                state[sid] = (int(best_zone), p[2])
-                del pending[sid]
+                confirm_transition(sid, phone, int(best_zone), p[2], rx_ts, float(best_conf))
             else:
                 pending[sid] = (int(best_zone), count, p[2])
         else:
             # New candidate (or different from current pending) — start counting
             pending[sid] = (int(best_zone), 1, rx_ts)
 
-    client = mqtt.Client(client_id="laptop-live-nohyst")
+    def close():
+        report_counts()
+        if macfilter is not None:
+            macfilter.save()
+        if tracer is not None:
+            tracer.report(time.time())
+        if CHECKPOINT_INTERVAL_SEC > 0:
+            ckpt_writer.flush(snapshot(time.time()))
+            print(tag + "[CHECKPOINT] Saved ->", paths["ckpt"])
+        if sink is not None:
+            sink.close()
+
+    return {"handle": handle, "archive": archive, "close": close, "occ": occ, "last_rx": last_rx}
+
+def parse_event(payload):
+    """MQTT payload -> event dict, or None (logged) when it is not JSON."""
+    try:
+        return json.loads(payload.decode("utf-8"))
+    except Exception as e:
+        log_error("json_decode", e)
+        return None
+
+def print_settings():
+    print("MIN_SOURCES =", MIN_SOURCES, "(masked scoring for partial vectors)")
+    print("WINDOW_SEC  =", WINDOW_SEC)
+    print("PER_PI_FRESH_SEC =", PER_PI_FRESH_SEC)
+    if FUSION != "latest":
+        print("FUSION = {} | {} samples/Pi".format(FUSION, rssi_window.FUSION_SAMPLES))
+    print("MATCH_DIFF_DBM (normalized) =", MATCH_DIFF_DBM)
+    print("MARGIN_GATE =", MARGIN_GATE)
+    print("RANK_WEIGHT =", RANK_WEIGHT, "| L1_WEIGHT =", L1_WEIGHT)
+    if TRACKER == "hmm":
+        print("TRACKER = hmm | tick={}s stay={} switch={}".format(
+            zone_tracker.TRACKER_TICK_SEC, zone_tracker.TRACKER_STAY_PROB, zone_tracker.TRACKER_SWITCH_PROB))
+    else:
+        print("TRANSITION_CONFIRM_COUNT =", TRANSITION_CONFIRM_COUNT)
+    print("STALE_MAC_SEC =", STALE_MAC_SEC)
+    print("OUTPUT_ROTATE =", OUTPUT_ROTATE, "| OUTPUT_COMPRESS =", OUTPUT_COMPRESS)
+    if ASSIGN_FEED_ADDR:
+        print("Assignment feed (UDP):", ASSIGN_FEED_ADDR)
+    print("OCCUPANCY_IDLE_SEC =", OCCUPANCY_IDLE_SEC)
+    if SCORE_CHANNELS:
+        print("SCORE_CHANNELS =", sorted(SCORE_CHANNELS))
+    if SQLITE_PATH:
+        print("SQLite sink:", SQLITE_PATH)
+    if MACFILTER:
+        print("MACFILTER: group MACs + static devices ({} days in one zone) -> denylist".format(
+            mac_filter.MACFILTER_STATIC_DAYS))
+    if ADMISSION_SHED_LAG_SEC > 0:
+        print("ADMISSION: shed at {}s lag, critical at {}s".format(
+            ADMISSION_SHED_LAG_SEC, admission_control.ADMISSION_CRITICAL_LAG_SEC))
+
+def make_on_message(process):
+    """MQTT callback for process(msg, rx_ts, fn="handle"). With
+    ADMISSION_SHED_LAG_SEC > 0 messages are queued to a worker whose queue wait
+    drives load shedding; messages older than ADMISSION_MAX_AGE_SEC are passed
+    to the scorers' "archive" instead. Returns (on_message, admission or None, stop)."""
+    if ADMISSION_SHED_LAG_SEC <= 0:
+        return (lambda client, userdata, msg: process(msg, time.time())), None, lambda: None
+    admission = admission_control.AdmissionController()
+    intake = admission_control.Intake(process, admission, on_error=log_error,
+                                      on_stale=lambda msg, rx_ts: process(msg, rx_ts, "archive"))
+
+    def on_message(client, userdata, msg):
+        intake.put(msg, time.time())
+
+    def stop():
+        intake.close()
+        admission.flush_all()       # deferred raw lines, before the scorers close their outputs
+        print("[ADMISSION]", admission.summary())
+
+    return on_message, admission, stop
+
+def run_client(client_id, topic, on_message, on_exit):
+    def on_connect(client, userdata, flags, rc):
+        print("[MQTT] Connected rc=", rc)
+        try:
+            client.subscribe(topic)
+            print("[MQTT] Subscribed to", topic)
+        except Exception as e:
+            log_error("on_connect/subscribe", e)
+
+    client = mqtt.Client(client_id=client_id)
     client.on_connect = on_connect
     client.on_message = on_message
     client.reconnect_delay_set(min_delay=1, max_delay=10)
     client.enable_logger()
     client.connect(MQTT_HOST, MQTT_PORT, keepalive=30)
-    client.loop_forever(retry_first_connection=True)
+    try:
+        client.loop_forever(retry_first_connection=True)
+    finally:
+        on_exit()
+        close_outputs()
+
+def main():
+    # kill -USR1 <pid> or `python stack_sampler.py run_live start 30` -> output/profile_run_live_*.collapsed
+    stack_sampler.install("run_live", OUT_DIR)
+    if MULTI_STORE:
+        main_multi_store()
+        return
+    os.makedirs(OUT_DIR, exist_ok=True)
+    paths = store_paths(OUT_DIR)
+    open_outputs(dict(paths, err=OUT_ERR))
+    if ASSIGN_FEED_ADDR:
+        ASSIGNMENT_LISTENERS.append(jsonl_follow.UdpPublisher(ASSIGN_FEED_ADDR))
+    zones = load_zones()
+    cal = load_calibration()
+    if not cal:
+        print("ERROR: output/calibration.jsonl missing or has no vectors. Run calibration first.")
+        return
+
+    # Improvement B: precompute per-zone per-Pi weights from calibration variance
+    pi_weights = compute_pi_weights(cal)
+    model = compile_calibration(cal, pi_weights)
+
+    print("LIVE MODE STARTED (rx-time, normalized matching, NO hysteresis)")
+    print_settings()
+    print("Broker:", MQTT_HOST, "Topic:", MQTT_TOPIC)
+    print("Zones loaded:", len(zones), "| Cal zones:", len(cal))
+
+    def process(msg, rx_ts, fn="handle"):
+        evt = parse_event(msg.payload)
+        if evt is not None:
+            for e in sniffer_control.iter_events(evt):
+                scorer[fn](e, rx_ts)
+
+    on_message, admission, stop_intake = make_on_message(process)
+    scorer = make_scorer(None, zones, model, paths, ASSIGNMENT_LISTENERS, admission)
+    if OCCUPANCY_HTTP_ADDR:
+        try:
+            zone_aggregates.serve(scorer["occ"], OCCUPANCY_HTTP_ADDR)
+            print("Occupancy endpoint (HTTP):", OCCUPANCY_HTTP_ADDR)
+        except OSError as e:
+            log_error("occupancy_http", e)
+
+    def on_exit():
+        stop_intake()
+        scorer["close"]()
+
+    run_client("laptop-live-nohyst", MQTT_TOPIC, on_message, on_exit)
+
+def main_multi_store():
+    """One process, many stores: MQTT_TOPIC_PREFIX/<store>/rssi is scored with
+    stores/<store>/{zones.csv,calibration.jsonl} into output/<store>/.
+    Stores load on their first message and are closed after STORE_IDLE_SEC."""
+    topic = "{}/+/rssi".format(MQTT_TOPIC_PREFIX)
+    os.makedirs(OUT_DIR, exist_ok=True)
+    open_outputs({"err": OUT_ERR})
+    if ASSIGN_FEED_ADDR:
+        ASSIGNMENT_LISTENERS.append(jsonl_follow.UdpPublisher(ASSIGN_FEED_ADDR))
+
+    print("LIVE MODE STARTED (multi-store)")
+    print_settings()
+    print("STORE_ROOT =", STORE_ROOT, "| STORE_IDLE_SEC =", STORE_IDLE_SEC)
+    print("Broker:", MQTT_HOST, "Topic:", topic)
+
+    stores = {}         # store_id -> scorer
+    occ_by_store = {}   # store_id -> ZoneAggregator (HTTP: /<store>/occupancy ...)
+    unavailable = {}    # store_id -> ts of the last failed load
+    bad_topics = set()  # topics without a valid store id (logged once)
+    next_evict = [0.0]
+    on_message, admission, stop_intake = make_on_message(lambda *args: process(*args))
+    if OCCUPANCY_HTTP_ADDR:
+        try:
+            zone_aggregates.serve(occ_by_store, OCCUPANCY_HTTP_ADDR)
+            print("Occupancy endpoint (HTTP):", OCCUPANCY_HTTP_ADDR, "(/<store>/occupancy)")
+        except OSError as e:
+            log_error("occupancy_http", e)
+
+    def open_store(store, now_ts):
+        failed_ts = unavailable.get(store)
+        if failed_ts is not None and now_ts - failed_ts < STORE_RETRY_SEC:
+            return None
+        t0 = time.perf_counter()
+        store_dir = os.path.join(STORE_ROOT, store)
+        cal = load_calibration(os.path.join(store_dir, "calibration.jsonl"))
+        if not cal:
+            unavailable[store] = now_ts
+            log_error("store_load", "no calibration in " + store_dir, extra={"store": store})
+            return None
+        unavailable.pop(store, None)
+        zones = load_zones(os.path.join(store_dir, "zones.csv"))
+        model = compile_calibration(cal, compute_pi_weights(cal))
+        out_dir = os.path.join(OUT_DIR, store)
+        os.makedirs(out_dir, exist_ok=True)
+        paths = store_paths(out_dir)
+        open_outputs(paths)
+        scorer = make_scorer(store, zones, model, paths, ASSIGNMENT_LISTENERS, admission)
+        scorer["paths"] = paths
+        stores[store] = scorer
+        occ_by_store[store] = scorer["occ"]
+        print("[STORE] Opened {} ({} zones, {} cal zones) in {:.3f}s | {} open".format(
+            store, len(zones), len(cal), time.perf_counter() - t0, len(stores)))
+        return scorer
+
+    def close_store(store):
+        scorer = stores.pop(store)
+        occ_by_store.pop(store, None)
+        scorer["close"]()
+        close_outputs(scorer["paths"])
+
+    def evict_idle(now_ts):
+        idle = [s for s, sc in stores.items() if now_ts - sc["last_rx"][0] > STORE_IDLE_SEC]
+        for store in idle:
+            close_store(store)
+            print("[STORE] Evicted idle {} | {} open".format(store, len(stores)))
+
+    def process(msg, rx_ts, fn="handle"):
+        if rx_ts >= next_evict[0]:
+            next_evict[0] = rx_ts + STORE_EVICT_CHECK_SEC
+            evict_idle(rx_ts)
+        parts = msg.topic.split("/")
+        store = parts[-2] if len(parts) >= 3 else ""
+        if not STORE_ID_RE.match(store):
+            if msg.topic not in bad_topics:
+                bad_topics.add(msg.topic)
+                log_error("store_topic", "bad store id in topic " + msg.topic)
+            return
+        evt = parse_event(msg.payload)
+        if evt is None:
+            return
+        scorer = stores.get(store) or open_store(store, rx_ts)
+        if scorer is not None:
+            for e in sniffer_control.iter_events(evt):
+                scorer[fn](e, rx_ts)
+
+    def close_all():
+        stop_intake()
+        for store in list(stores):
+            close_store(store)
+
+    run_client("laptop-live-multistore", topic, on_message, close_all)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,212 @@
+# sniffer_control.py
+#
+# Runtime control of resident sniffers (sniff_and_send_unified.py) over MQTT.
+#
+# - Topics: commands on <prefix>[/<store>]/control/<rpi_id> (or .../control/all),
+#   retained health on <prefix>[/<store>]/status/<rpi_id> ("offline" via the
+#   broker's last will when a sniffer dies).
+# - A command is a JSON object: {"cmd": "set", ...settings} changes any of
+#   mode (production|calibration|test), target_macs, track_macs, hash_macs,
+#   hash_salt, batch_ms, batch_max; {"cmd": "status"} asks for a health
+#   report. apply_command() validates against the current settings; the
+#   sniffer swaps the whole settings dict, so a switch takes effect on the
+#   next captured frame.
+# - Batching (batch_ms > 0): one message {"rpi_id", "batch": [[ts, mac, rssi(, ch)], ...]}
+#   per batch_ms / batch_max; iter_events() expands both forms for consumers.
+#
+# Usage (laptop):
+#   python sniffer_control.py status
+#   python sniffer_control.py set --mode calibration --target-macs a8:76:50:e9:28:20
+#   python sniffer_control.py set --pis pi10,pi5 --mode test --track-macs "mac1,mac2"
+#   python sniffer_control.py set --mode production --hash-macs --hash-salt "..." --batch-ms 200
+
+import argparse
+import json
+import time
+
+from config import MQTT_BROKER_IP, MQTT_BROKER_PORT, MQTT_TOPIC_PREFIX, SNIFFER_BATCH_MS, SNIFFER_BATCH_MAX
+
+MODES = ("production", "calibration", "test")
+SETTING_KEYS = ("mode", "target_macs", "track_macs", "hash_macs", "hash_salt", "batch_ms", "batch_max")
+
+def _base(store):
+    return "{}/{}".format(MQTT_TOPIC_PREFIX, store) if store else MQTT_TOPIC_PREFIX
+
+def control_topic(rpi_id, store=""):
+    return "{}/control/{}".format(_base(store), rpi_id)
+
+def status_topic(rpi_id, store=""):
+    return "{}/status/{}".format(_base(store), rpi_id)
+
+def mac_set(value):
+    """Comma-separated string or list -> frozenset of lowercase MACs."""
+    if isinstance(value, str):
+        value = value.split(",")
+    return frozenset(m.strip().lower() for m in value or () if str(m).strip())
+
+def initial_settings(target_macs="", track_macs="", hash_macs=False, hash_salt="",
+                     batch_ms=SNIFFER_BATCH_MS, batch_max=SNIFFER_BATCH_MAX):
+    """Settings from the command-line flags (same mode priority as before:
+    target MACs -> calibration, track MACs -> test, else production)."""
+    s = {"mode": "production", "target_macs": mac_set(target_macs), "track_macs": mac_set(track_macs),
+         "hash_macs": bool(hash_macs), "hash_salt": str(hash_salt or "").strip(),
+         "batch_ms": int(batch_ms), "batch_max": int(batch_max)}
+    s["mode"] = "calibration" if s["target_macs"] else "test" if s["track_macs"] else "production"
+    validate(s)
+    return s
+
+def validate(s):
+    if s["mode"] not in MODES:
+        raise ValueError("mode must be one of " + ", ".join(MODES))
+    if s["mode"] == "calibration" and not s["target_macs"]:
+        raise ValueError("calibration mode needs target_macs")
+    if s["mode"] == "test" and not s["track_macs"]:
+        raise ValueError("test mode needs track_macs")
+    if s["hash_macs"] and not s["hash_salt"]:
+        raise ValueError("hash_macs needs hash_salt")
+    if s["batch_ms"] < 0 or s["batch_max"] < 1:
+        raise ValueError("batch_ms must be >= 0 and batch_max >= 1")
+
+def apply_command(current, cmd):
+    """New settings dict for a "set" command; ValueError leaves `current` in force.
+    Lists without a mode pick it like the flags do."""
+    s = dict(current)
+    unknown = set(cmd) - set(SETTING_KEYS) - {"cmd", "id"}
+    if unknown:
+        raise ValueError("unknown settings: " + ", ".join(sorted(unknown)))
+    for key in ("target_macs", "track_macs"):
+        if key in cmd:
+            s[key] = mac_set(cmd[key])
+    if "hash_macs" in cmd:
+        s["hash_macs"] = bool(cmd["hash_macs"])
+    if "hash_salt" in cmd:
+        s["hash_salt"] = str(cmd["hash_salt"] or "").strip()
+    for key in ("batch_ms", "batch_max"):
+        if key in cmd:
+            s[key] = int(cmd[key])
+    if "mode" in cmd:
+        s["mode"] = str(cmd["mode"]).strip().lower()
+    elif "target_macs" in cmd or "track_macs" in cmd:
+        s["mode"] = "calibration" if s["target_macs"] else "test" if s["track_macs"] else "production"
+    validate(s)
+    return s
+
+def describe(s):
+    """Settings as published in the status (the salt stays on the Pi)."""
+    return {"mode": s["mode"], "target_macs": sorted(s["target_macs"]), "track_macs": sorted(s["track_macs"]),
+            "hash_macs": s["hash_macs"], "batch_ms": s["batch_ms"], "batch_max": s["batch_max"]}
+
+def encode_batch(rpi_id, rows):
+    return json.dumps({"rpi_id": rpi_id, "batch": rows}, separators=(",", ":"))
+
+def iter_events(obj):
+    """Per-observation event dicts of one sniffer message (single or batch)."""
+    rows = obj.get("batch") if isinstance(obj, dict) else None
+    if rows is None:
+        return (obj,)
+    rpi_id, spool = obj.get("rpi_id"), obj.get("spool")
+    events = []
+    for row in rows:
+        evt = {"ts": row[0], "rpi_id": rpi_id, "mac": row[1], "rssi": row[2]}
+        if len(row) > 3 and row[3] is not None:
+            evt["ch"] = row[3]
+        if spool:
+            evt["spool"] = spool
+        events.append(evt)
+    return events
+
+# --- laptop CLI ---
+
+def _client(client_id):
+    import paho.mqtt.client as mqtt
+    client = mqtt.Client(client_id=client_id)
+    client.connect(MQTT_BROKER_IP, MQTT_BROKER_PORT, keepalive=30)
+    client.loop_start()
+    return client
+
+def collect_status(store="", wait_sec=2.0, client=None):
+    """{rpi_id: status} from the retained status topics."""
+    statuses = {}
+    own = client is None
+    client = client or _client("sniffer-control-status")
+    prefix = status_topic("", store)
+
+    def on_message(c, userdata, msg):
+        try:
+            statuses[msg.topic[len(prefix):]] = json.loads(msg.payload.decode("utf-8"))
+        except ValueError:
+            pass
+
+    client.on_message = on_message
+    client.subscribe(status_topic("+", store))
+    time.sleep(wait_sec)
+    client.unsubscribe(status_topic("+", store))
+    if own:
+        client.loop_stop()
+        client.disconnect()
+    return statuses
+
+def send_command(cmd, pis=None, store="", wait_sec=2.0, acked_only=True):
+    """Publish cmd to each Pi (or .../control/all) and return the statuses
+    that acknowledge it (matching "last_cmd.id"), or all of them, including
+    retained "offline" ones."""
+    cmd = dict(cmd, id=cmd.get("id") or "{:.6f}".format(time.time()))
+    client = _client("sniffer-control")
+    for pi in pis or ["all"]:
+        client.publish(control_topic(pi, store), json.dumps(cmd, separators=(",", ":")), qos=1)
+    statuses = collect_status(store, wait_sec, client)
+    client.loop_stop()
+    client.disconnect()
+    if not acked_only:
+        return statuses
+    return {pi: st for pi, st in statuses.items() if (st.get("last_cmd") or {}).get("id") == cmd["id"]}
+
+def print_status(statuses):
+    print("{:<6} {:<8} {:<12} {:>8} {:>10} {:>9} {:>8} {:>9}  {}".format(
+        "PI", "STATE", "MODE", "UPTIME", "PUBLISHED", "PENDING", "BATCH", "PKT_AGE", "LAST_CMD"))
+    for pi in sorted(statuses):
+        st = statuses[pi]
+        s = st.get("settings") or {}
+        last = st.get("last_cmd") or {}
+        age = st.get("last_packet_age_sec")
+        print("{:<6} {:<8} {:<12} {:>8} {:>10} {:>9} {:>8} {:>9}  {}".format(
+            pi, st.get("state", "-"), s.get("mode", "-"), "{:.0f}s".format(st.get("uptime_sec", 0)),
+            st.get("published", "-"), st.get("spool_pending", "-"), "{}ms".format(s.get("batch_ms", 0)),
+            "-" if age is None else "{:.1f}s".format(age),
+            "" if not last else "{} {}".format(last.get("error") or "ok", "({:.2f} ms)".format(last["applied_ms"])
+                                               if last.get("applied_ms") is not None else "")))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("action", choices=("status", "set"))
+    ap.add_argument("--pis", default="", help="comma-separated Pi IDs (default: all)")
+    ap.add_argument("--store", default="", help="store id of multi-store sniffers")
+    ap.add_argument("--mode", choices=MODES)
+    ap.add_argument("--target-macs")
+    ap.add_argument("--track-macs")
+    ap.add_argument("--hash-macs", action="store_true", default=None)
+    ap.add_argument("--no-hash-macs", dest="hash_macs", action="store_false")
+    ap.add_argument("--hash-salt")
+    ap.add_argument("--batch-ms", type=int)
+    ap.add_argument("--batch-max", type=int)
+    ap.add_argument("--wait-sec", type=float, default=2.0)
+    args = ap.parse_args()
+
+    pis = [p.strip().lower() for p in args.pis.split(",") if p.strip()]
+    if args.action == "status":
+        # Fresh reports from running sniffers on top of the retained ones
+        print_status(send_command({"cmd": "status"}, pis, args.store, args.wait_sec, acked_only=False))
+        return
+    cmd = {"cmd": "set"}
+    for key in SETTING_KEYS:
+        value = getattr(args, key)
+        if value is not None:
+            cmd[key] = value
+    acks = send_command(cmd, pis, args.store, args.wait_sec)
+    print_status(acks)
+    missing = sorted(set(pis) - set(acks)) if pis else []
+    if missing or not acks:
+        print("No acknowledgement from:", ", ".join(missing) if missing else "any sniffer")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+# soak_test.py
+#
+# Closed-loop soak test of run_live_geometry.py without Pis or a network.
+#
+# - One emulated sniffer process per Pi publishes the sniffer's MQTT message
+#   ({"ts","rpi_id","mac","rssi"}, as sniff_and_send_unified.publish) either
+#   replayed from a raw_rssi.jsonl at --speed x, or from a synthetic model:
+#   --phones walking between neighbouring zones, each probe heard by a Pi with
+#   SOAK_HEAR_PROB and an RSSI of the zone's calibrated fingerprint plus
+#   SOAK_NOISE_DB noise (optionally rotating MACs every SOAK_MAC_ROTATE_SEC).
+# - Messages go through local_broker.LocalBroker in this process (or an
+#   external broker with --broker host:port) to a run_live_geometry.py
+#   subprocess working in a scratch directory with a copy of the calibration.
+#   --workdir must be new, empty, or a previous soak workdir (marked with
+#   .soak_workdir); only then is its output/ replaced.
+# - After --duration the sniffers stop, run_live drains and is interrupted,
+#   and the harness reports throughput, drops (broker, intake queue, lost),
+#   shed messages, RSS growth of run_live and capture->assignment latency
+#   from its latency_trace.jsonl; soak_report.json is written to the workdir.
+#
+# Usage:
+#   python soak_test.py --duration 300 --phones 200
+#   python soak_test.py --replay output/raw_rssi.jsonl --speed 10 --duration 600
+#   TRACKER=hmm python soak_test.py --phones 500 --workdir /tmp/soak_hmm
+
+import argparse
+import bisect
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+import multiprocessing as mp
+
+import numpy as np
+import paho.mqtt.client as mqtt
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+import local_broker
+import replay_raw_rssi
+import run_live_geometry as live
+from config import (SOAK_DURATION_SEC, SOAK_PROBE_RATE, SOAK_HEAR_PROB, SOAK_NOISE_DB, SOAK_DWELL_SEC,
+                    SOAK_MAC_ROTATE_SEC, TRACKER_ADJ_DIST)
+
+BASE_RSSI = -65         # fingerprints are median-normalized; any base works
+RSSI_RANGE = (-100, -20)
+TICK_SEC = 0.02
+PROGRESS_SEC = 10.0
+WORKDIR_MARKER = ".soak_workdir"
+STATS_RE = re.compile(r"\[STATS\] ingested=(\d+) scored=(\d+) assigned=(\d+) uncertain=(\d+) "
+                      r"spooled=(\d+) shed=(\d+) filtered=(\d+)")
+
+def phone_mac(i, epoch):
+    """Locally administered MAC of phone i in MAC rotation epoch `epoch`."""
+    b = [0xDA, (i >> 8) & 0xFF, i & 0xFF, (epoch >> 16) & 0xFF, (epoch >> 8) & 0xFF, epoch & 0xFF]
+    return ":".join("{:02x}".format(x) for x in b)
+
+# --- sniffer plans (built in the parent, one per Pi) ---
+
+def zone_fingerprints(cal):
+    """{zone_id: {pi: mean normalized RSSI}} from the calibration vectors."""
+    fps = {}
+    for zid, rec in cal.items():
+        sums = {}
+        for v in rec["vectors"]:
+            for pi, x in v.items():
+                s = sums.setdefault(pi, [0.0, 0])
+                s[0] += float(x)
+                s[1] += 1
+        fps[zid] = {pi: s[0] / s[1] for pi, s in sums.items()}
+    return fps
+
+def walk_schedules(zone_ids, zones, phones, duration, dwell_sec, seed):
+    """Per phone ([start offsets], [zone index]): dwells of 0.5-1.5x dwell_sec,
+    each move to a zone within TRACKER_ADJ_DIST (any zone when none is)."""
+    rng = np.random.default_rng(seed)
+    near = []
+    for z in zone_ids:
+        x, y = zones.get(z, (None, None))
+        nb = [j for j, o in enumerate(zone_ids) if o != z and x is not None and o in zones
+              and (zones[o][0] - x) ** 2 + (zones[o][1] - y) ** 2 <= TRACKER_ADJ_DIST ** 2]
+        near.append(nb or [j for j, o in enumerate(zone_ids) if o != z])
+    schedules = []
+    for _ in range(phones):
+        t, zi = 0.0, int(rng.integers(len(zone_ids)))
+        starts, idx = [], []
+        while t < duration:
+            starts.append(t)
+            idx.append(zi)
+            t += dwell_sec * (0.5 + rng.random())
+            if near[zi]:
+                zi = int(rng.choice(near[zi]))
+        schedules.append((starts, idx))
+    return schedules
+
+def synthetic_plans(cal, zones, phones, duration, seed, rate, hear_prob, noise_db, dwell_sec, rotate_sec):
+    zone_ids = sorted(cal)
+    fps = zone_fingerprints(cal)
+    pis = sorted({pi for fp in fps.values() for pi in fp})
+    schedules = walk_schedules(zone_ids, zones, phones, duration, dwell_sec, seed)
+    plans = {}
+    for pi in pis:
+        fp = np.array([fps[z].get(pi, np.nan) for z in zone_ids], dtype=np.float64)
+        plans[pi] = {"mode": "synthetic", "fingerprint": fp, "schedules": schedules, "rate": rate,
+                     "hear_prob": hear_prob, "noise_db": noise_db, "rotate_sec": rotate_sec, "seed": seed}
+    return plans
+
+def replay_plans(path, only_pis=None):
+    """Per-Pi offsets from the first message of the file, MACs and RSSI."""
+    events = list(replay_raw_rssi.iter_raw_rssi(path))
+    if not events:
+        raise SystemExit("ERROR: no messages in {}".format(path))
+    events.sort()
+    t_first = events[0][0]
+    span = events[-1][0] - t_first + 1.0    # one loop of the file
+    plans = {}
+    for ts, phone, pi, rssi in events:
+        if only_pis and pi not in only_pis:
+            continue
+        p = plans.setdefault(pi, {"mode": "replay", "offsets": [], "macs": [], "rssi": [], "span": span})
+        p["offsets"].append(ts - t_first)
+        p["macs"].append(phone)
+        p["rssi"].append(rssi)
+    return plans
+
+# --- emulated sniffer (child process) ---
+
+def emulate_sniffer(pi, host, port, topic, plan, t0, duration, speed, results):
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="soak-" + pi)   # no callbacks used
+    client.connect(host, port, keepalive=30)
+    client.loop_start()
+    deadline = time.time() + 10
+    while not client.is_connected() and time.time() < deadline:
+        time.sleep(0.01)
+    stats = {"pi": pi, "sent": 0, "failed": 0, "max_behind_sec": 0.0, "loops": 0}
+
+    def publish(mac, rssi, ts):
+        payload = json.dumps({"ts": ts, "rpi_id": pi, "mac": mac, "rssi": int(rssi)}, separators=(",", ":"))
+        if client.publish(topic, payload, qos=0, retain=False).rc == mqtt.MQTT_ERR_SUCCESS:
+            stats["sent"] += 1
+        else:
+            stats["failed"] += 1
+
+    while time.time() < t0:
+        time.sleep(0.005)
+    end = t0 + duration
+    if plan["mode"] == "replay":
+        offsets, macs, rssi, span = plan["offsets"], plan["macs"], plan["rssi"], plan["span"]
+        i = 0
+        while offsets:
+            due = t0 + (offsets[i] + stats["loops"] * span) / speed
+            if due >= end:
+                break
+            now = time.time()
+            if due > now:
+                time.sleep(min(due - now, TICK_SEC))
+                continue
+            stats["max_behind_sec"] = max(stats["max_behind_sec"], now - due)
+            publish(macs[i], rssi[i], now)
+            i += 1
+            if i == len(offsets):
+                i = 0
+                stats["loops"] += 1
+    else:
+        rng = np.random.default_rng([plan["seed"], zlib.crc32(pi.encode())])
+        fp, schedules, rate = plan["fingerprint"], plan["schedules"], plan["rate"]
+        rotate, noise, hear = plan["rotate_sec"], plan["noise_db"], plan["hear_prob"]
+        next_due = t0 + rng.random(len(schedules)) / rate
+        while True:
+            now = time.time()
+            if now >= end:
+                break
+            due = np.flatnonzero(next_due <= now)
+            if len(due):
+                stats["max_behind_sec"] = max(stats["max_behind_sec"], float(now - next_due[due].min()))
+            for i in due:
+                t = next_due[i] - t0
+                starts, idx = schedules[i]
+                mean = fp[idx[bisect.bisect_right(starts, t) - 1]]
+                if np.isnan(mean) or rng.random() > hear:
+                    continue
+                r = min(max(round(BASE_RSSI + mean + rng.normal(0.0, noise)), RSSI_RANGE[0]), RSSI_RANGE[1])
+                publish(phone_mac(int(i), int(t // rotate) if rotate > 0 else 0), r, now)
+            next_due[due] += (0.5 + rng.random(len(due))) / rate
+            time.sleep(max(0.0, min(TICK_SEC, float(next_due.min()) - time.time())))
+
+    client.disconnect()     # queued after the pending publishes
+    client.loop_stop()
+    stats["max_behind_sec"] = round(stats["max_behind_sec"], 3)
+    results.put(stats)
+
+# --- run_live subprocess and measurements ---
+
+def rss_mb(pid):
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss / 2 ** 20
+        except psutil.Error:
+            return None
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+def wait_for_line(path, text, proc, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                if text in f.read():
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+def parse_log(path):
+    """Last [STATS] counters and [ADMISSION] summary of the run_live log."""
+    stats, adm = None, {}
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            m = STATS_RE.search(line)
+            if m:
+                stats = dict(zip(("ingested", "scored", "assigned", "uncertain", "spooled", "shed", "filtered"),
+                                 map(int, m.groups())))
+            elif line.startswith("[ADMISSION] admitted="):
+                adm = {k: float(v.rstrip("s")) if k == "max_lag" else int(v)
+                       for k, v in (kv.split("=", 1) for kv in line.split()[1:])}
+    return stats or {}, adm
+
+def read_jsonl(path):
+    out = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    out.append(json.loads(line))
+                except ValueError:
+                    continue
+    return out
+
+def memory_summary(samples, warmup_sec):
+    """Start/end/peak RSS after warmup and the fitted growth rate."""
+    if not samples:
+        return None
+    after = [(t, m) for t, m in samples if t >= warmup_sec] or samples
+    t = np.array([s[0] for s in after])
+    m = np.array([s[1] for s in after])
+    slope = float(np.polyfit(t, m, 1)[0]) if len(after) >= 3 and t[-1] > t[0] else 0.0
+    return {"start_mb": round(float(m[0]), 1), "end_mb": round(float(m[-1]), 1),
+            "peak_mb": round(max(s[1] for s in samples), 1), "growth_mb": round(float(m[-1] - m[0]), 1),
+            "slope_mb_per_hour": round(slope * 3600.0, 1)}
+
+def run(args):
+    cal = live.load_calibration(args.cal)
+    if not cal:
+        raise SystemExit("ERROR: {} missing or has no vectors.".format(args.cal))
+    only = {p.strip().lower() for p in args.pis.split(",") if p.strip()} if args.pis else None
+    if args.replay:
+        plans = replay_plans(args.replay, only)
+        mode = "replay {} at {}x".format(args.replay, args.speed)
+    else:
+        plans = synthetic_plans(cal, live.load_zones(args.zones), args.phones, args.duration, args.seed,
+                                args.rate, SOAK_HEAR_PROB, SOAK_NOISE_DB, SOAK_DWELL_SEC, args.rotate_sec)
+        if only:
+            plans = {pi: p for pi, p in plans.items() if pi in only}
+        mode = "synthetic {} phones at {}/s".format(args.phones, args.rate)
+    if not plans:
+        raise SystemExit("ERROR: no Pis to emulate.")
+
+    # Read inputs before anything is removed: they may live in the workdir
+    with open(args.cal, "rb") as f:
+        cal_bytes = f.read()
+    zones_bytes = None
+    if os.path.exists(args.zones):
+        with open(args.zones, "rb") as f:
+            zones_bytes = f.read()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="soak_")
+    marker = os.path.join(workdir, WORKDIR_MARKER)
+    if os.path.isdir(workdir) and os.listdir(workdir) and not os.path.exists(marker):
+        raise SystemExit("ERROR: --workdir {} is not empty and was not created by soak_test.py.".format(workdir))
+    os.makedirs(workdir, exist_ok=True)
+    open(marker, "a").close()
+    out_dir = os.path.join(workdir, "output")
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    with open(os.path.join(out_dir, "calibration.jsonl"), "wb") as f:
+        f.write(cal_bytes)
+    if zones_bytes is not None:
+        with open(os.path.join(workdir, "zones.csv"), "wb") as f:
+            f.write(zones_bytes)
+
+    broker = None
+    if args.broker:
+        host, _, port = args.broker.partition(":")
+        port = int(port or 1883)
+    else:
+        broker = local_broker.LocalBroker("127.0.0.1", 0).start()
+        host, port = broker.host, broker.port
+    print("[SOAK] {} | {} emulated Pis | {}s | broker {}:{}{} | workdir {}".format(
+        mode, len(plans), args.duration, host, port, " (in-process)" if broker else "", workdir))
+
+    env = dict(os.environ, MQTT_BROKER_IP=host, MQTT_BROKER_PORT=str(port), MULTI_STORE="0",
+               LATENCY_TRACE_SEC=str(args.trace_sec), OUTPUT_ROTATE="none", OUTPUT_COMPRESS="none",
+               OCCUPANCY_HTTP_ADDR="", ASSIGN_FEED_ADDR="", PYTHONUNBUFFERED="1")
+    log_path = os.path.join(workdir, "run_live.log")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_live_geometry.py")
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen([sys.executable, script], cwd=workdir, env=env, stdout=log,
+                                stderr=subprocess.STDOUT)
+    try:
+        if not wait_for_line(log_path, "[MQTT] Subscribed", proc, 30):
+            raise SystemExit("ERROR: run_live did not subscribe, see {}".format(log_path))
+
+        results = mp.Queue()
+        t0 = time.time() + 1.0
+        procs = [mp.Process(target=emulate_sniffer, name="sniffer-" + pi, daemon=True,
+                            args=(pi, host, port, live.MQTT_TOPIC, plan, t0, args.duration, args.speed, results))
+                 for pi, plan in sorted(plans.items())]
+        for p in procs:
+            p.start()
+
+        samples = []
+        stop = threading.Event()
+
+        def sample():
+            next_progress = t0 + PROGRESS_SEC
+            while not stop.wait(args.sample_sec):
+                mb = rss_mb(proc.pid)
+                if mb is not None:
+                    samples.append((time.time() - t0, mb))
+                if broker is not None and time.time() >= next_progress:
+                    next_progress += PROGRESS_SEC
+                    print("[SOAK] t={:.0f}s rss={}MB broker received={received} forwarded={forwarded} "
+                          "dropped={dropped}".format(time.time() - t0, "-" if mb is None else round(mb, 1),
+                                                     **broker.stats()))
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        senders = [results.get(timeout=args.duration + 60) for _ in procs]
+        for p in procs:
+            p.join(timeout=10)
+        time.sleep(args.drain_sec)
+        stop.set()
+        sampler.join()
+    finally:
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGINT)
+            try:
+                proc.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        if broker is not None:
+            broker.stop()
+
+    stats, adm = parse_log(log_path)
+    trace = read_jsonl(os.path.join(out_dir, "latency_trace.jsonl"))
+    errors = len(read_jsonl(os.path.join(out_dir, "run_live_errors.jsonl")))
+    sent = sum(s["sent"] for s in senders)
+    received = sum(stats.get(k, 0) for k in ("ingested", "shed", "spooled", "filtered"))
+    rates = [sum(p["msgs"] for p in r["pis"].values()) / args.trace_sec for r in trace[:-1]]
+    report = {
+        "mode": mode,
+        "duration_sec": args.duration,
+        "emulated_pis": len(plans),
+        "exit_code": proc.returncode,
+        "sent": sent,
+        "send_failed": sum(s["failed"] for s in senders),
+        "sniffer_max_behind_sec": max(s["max_behind_sec"] for s in senders),
+        "broker": broker.stats() if broker is not None else None,
+        "scorer": dict(stats, intake_dropped=adm.get("intake_dropped", 0), max_queue_lag_sec=adm.get("max_lag")),
+        "throughput": {
+            "sent_per_sec": round(sent / args.duration, 1),
+            "received_per_sec": round(received / args.duration, 1),
+            "interval_min_per_sec": round(min(rates), 1) if rates else None,
+            "interval_mean_per_sec": round(sum(rates) / len(rates), 1) if rates else None,
+        },
+        "drop_rate": round(1.0 - received / sent, 5) if sent else None,
+        "shed_rate": round(stats.get("shed", 0) / received, 5) if received else None,
+        "memory": memory_summary(samples, min(30.0, 0.1 * args.duration)),
+        "latency_ms": trace[-1]["assign_latency_ms"] if trace else None,
+        "network_lag_p90_ms": {pi: (p["lag_ms"] or {}).get("p90") for pi, p in trace[-1]["pis"].items()}
+                              if trace else None,
+        "errors": errors,
+    }
+    with open(os.path.join(workdir, "soak_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print("[SOAK] report ->", os.path.join(workdir, "soak_report.json"))
+    return report
+
+def print_report(r):
+    sc, th, mem, lat = r["scorer"], r["throughput"], r["memory"], r["latency_ms"]
+    print("[SOAK] sent={} failed={} received={} ingested={} shed={} filtered={} intake_dropped={} | drop rate {}".format(
+        r["sent"], r["send_failed"], sum(sc.get(k, 0) for k in ("ingested", "shed", "spooled", "filtered")),
+        sc.get("ingested"), sc.get("shed"), sc.get("filtered"), sc.get("intake_dropped"),
+        "-" if r["drop_rate"] is None else "{:.3%}".format(r["drop_rate"])))
+    if r["broker"]:
+        print("[SOAK] broker received={received} forwarded={forwarded} dropped={dropped}".format(**r["broker"]))
+    print("[SOAK] throughput sent={} msg/s received={} msg/s (interval min {}) | sniffers max behind {}s".format(
+        th["sent_per_sec"], th["received_per_sec"], th["interval_min_per_sec"], r["sniffer_max_behind_sec"]))
+    print("[SOAK] assigned={} uncertain={} errors={} exit={}".format(
+        sc.get("assigned"), sc.get("uncertain"), r["errors"], r["exit_code"]))
+    if mem:
+        print("[SOAK] run_live RSS {start_mb} -> {end_mb} MB (peak {peak_mb}, {slope_mb_per_hour:+} MB/h)".format(**mem))
+    total = lat.get("total") if lat else None
+    print("[SOAK] capture->assignment " + ("p50={p50}ms p90={p90}ms p99={p99}ms".format(**total) if total else "n/a"))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--duration", type=float, default=SOAK_DURATION_SEC, help="seconds of sniffer traffic")
+    ap.add_argument("--replay", help="raw_rssi.jsonl to replay instead of the synthetic model")
+    ap.add_argument("--speed", type=float, default=1.0, help="replay speed factor (looped to fill --duration)")
+    ap.add_argument("--phones", type=int, default=50, help="synthetic phones")
+    ap.add_argument("--rate", type=float, default=SOAK_PROBE_RATE, help="synthetic probes per phone per second")
+    ap.add_argument("--rotate-sec", type=float, default=SOAK_MAC_ROTATE_SEC, help="synthetic MAC rotation period")
+    ap.add_argument("--pis", help="comma-separated subset of Pis to emulate")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--cal", default=live.CAL_JSONL, help="calibration.jsonl (copied into the workdir)")
+    ap.add_argument("--zones", default=live.ZONES_CSV)
+    ap.add_argument("--broker", help="host:port of an external broker (default: in-process)")
+    ap.add_argument("--workdir", help="scratch directory for run_live (default: a new temp dir)")
+    ap.add_argument("--trace-sec", type=float, default=10.0, help="run_live LATENCY_TRACE_SEC")
+    ap.add_argument("--sample-sec", type=float, default=1.0, help="RSS sampling period")
+    ap.add_argument("--drain-sec", type=float, default=5.0, help="wait after the sniffers stop")
+    run(ap.parse_args())
+
+if __name__ == "__main__":
+    main()
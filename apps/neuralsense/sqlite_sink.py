@@ -0,0 +1,286 @@
+# sqlite_sink.py
+#
+# Optional SQLite (WAL) sink for run_live_geometry, for on-laptop queries like
+# "where was session S0042 between 14:00 and 14:10" without scanning JSONL.
+#
+# The scorer thread only enqueues rows; a writer thread owns the connection
+# and commits them in batched transactions (every SQLITE_BATCH rows or
+# SQLITE_FLUSH_SEC). Readers open their own connections; WAL lets them run
+# while the writer is busy.
+#
+# Usage:
+#   python sqlite_sink.py where S0042 --start "2026-02-25 14:00" --end "2026-02-25 14:10"
+#   python sqlite_sink.py zone 5 --start "2026-02-25 14:00" --end "2026-02-25 15:00"
+#   python sqlite_sink.py sessions --since "2026-02-25 14:00"
+#   python sqlite_sink.py sql "SELECT zone_id, COUNT(*) FROM dwells GROUP BY zone_id"
+#   python sqlite_sink.py bench --rows 200000
+
+import argparse
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from config import OUTPUT_DIR
+from rolling_jsonl import KST, parse_time_arg
+
+SQLITE_BATCH = 2000
+SQLITE_FLUSH_SEC = 1.0
+QUEUE_MAX = 200000      # rows waiting for the writer; beyond this rows are dropped and counted
+CLOSE_TIMEOUT_SEC = 30.0    # close() waits this long for the writer to drain the queue
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assignments (
+  ts REAL NOT NULL, session_id TEXT, phone_id TEXT, zone_id INTEGER,
+  confidence REAL, second_zone_id INTEGER, margin REAL, n_sources INTEGER
+);
+CREATE TABLE IF NOT EXISTS transitions (
+  ts REAL NOT NULL, session_id TEXT, phone_id TEXT, from_zone INTEGER, zone_id INTEGER, confidence REAL
+);
+CREATE TABLE IF NOT EXISTS dwells (
+  ts REAL NOT NULL, session_id TEXT, phone_id TEXT, zone_id INTEGER, enter_ts REAL, dwell_sec REAL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+  session_id TEXT PRIMARY KEY, first_ts REAL, ts REAL, phone_id TEXT, zone_id INTEGER, n_assignments INTEGER
+);
+CREATE INDEX IF NOT EXISTS assignments_session_ts ON assignments (session_id, ts);
+CREATE INDEX IF NOT EXISTS assignments_zone_ts ON assignments (zone_id, ts);
+CREATE INDEX IF NOT EXISTS transitions_session_ts ON transitions (session_id, ts);
+CREATE INDEX IF NOT EXISTS transitions_zone_ts ON transitions (zone_id, ts);
+CREATE INDEX IF NOT EXISTS dwells_session_ts ON dwells (session_id, ts);
+CREATE INDEX IF NOT EXISTS dwells_zone_ts ON dwells (zone_id, ts);
+CREATE INDEX IF NOT EXISTS sessions_zone_ts ON sessions (zone_id, ts);
+"""
+
+INSERTS = {
+    "assignments": "INSERT INTO assignments VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+    "transitions": "INSERT INTO transitions VALUES (?, ?, ?, ?, ?, ?)",
+    "dwells": "INSERT INTO dwells VALUES (?, ?, ?, ?, ?, ?)",
+}
+UPSERT_SESSION = """
+INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (session_id) DO UPDATE SET
+  ts = MAX(sessions.ts, excluded.ts),
+  phone_id = CASE WHEN excluded.ts >= sessions.ts THEN excluded.phone_id ELSE sessions.phone_id END,
+  zone_id = CASE WHEN excluded.ts >= sessions.ts THEN excluded.zone_id ELSE sessions.zone_id END,
+  n_assignments = sessions.n_assignments + excluded.n_assignments
+"""
+
+def connect(path, readonly=False):
+    if readonly:
+        conn = sqlite3.connect("file:{}?mode=ro".format(path), uri=True)
+    else:
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+    return conn
+
+class SqliteSink:
+    def __init__(self, path, batch=SQLITE_BATCH, flush_sec=SQLITE_FLUSH_SEC, on_error=None):
+        self.path = path
+        self.batch = batch
+        self.flush_sec = flush_sec
+        self.on_error = on_error
+        self.q = queue.Queue(QUEUE_MAX)
+        self.dropped = 0
+        self.written = 0
+        self.commit_sec = 0.0
+        connect(path).close()       # create schema up front so readers never see an empty file
+        self._thread = threading.Thread(target=self._run, name="sqlite-sink", daemon=True)
+        self._thread.start()
+
+    # --- producer side (scorer thread) ---
+
+    def _put(self, item):
+        try:
+            self.q.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def assignment(self, rec):
+        self._put(("assignments", (rec["ts"], rec.get("session_id"), rec.get("phone_id"), rec.get("zone_id"),
+                                   rec.get("confidence"), rec.get("second_zone_id"), rec.get("margin"),
+                                   len(rec.get("sources") or ()))))
+
+    def transition(self, rec):
+        self._put(("transitions", (rec["ts"], rec.get("session_id"), rec.get("phone_id"), rec.get("from_zone"),
+                                   rec.get("to_zone"), rec.get("confidence"))))
+
+    def dwell(self, rec):
+        self._put(("dwells", (rec["exit_ts"], rec.get("session_id"), rec.get("phone_id"), rec.get("zone_id"),
+                              rec.get("enter_ts"), rec.get("dwell_sec"))))
+
+    def close(self, timeout=CLOSE_TIMEOUT_SEC):
+        """Stop the writer once it has drained the queue; gives up after timeout."""
+        deadline = time.time() + timeout
+        sentinel = 1
+        try:
+            self.q.put(None, timeout=timeout)   # blocking: the stop sentinel must not be dropped
+        except queue.Full:
+            sentinel = 0
+        self._thread.join(max(0.0, deadline - time.time()))
+        if self._thread.is_alive():
+            print("[SQLITE] Writer still busy after {:.0f}s; {} rows not written".format(
+                timeout, max(0, self.q.qsize() - sentinel)))
+
+    # --- writer thread ---
+
+    def _run(self):
+        conn = connect(self.path)
+        stop = False
+        while not stop:
+            rows = {name: [] for name in INSERTS}
+            n = 0
+            deadline = time.time() + self.flush_sec
+            while n < self.batch:
+                try:
+                    item = self.q.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                rows[item[0]].append(item[1])
+                n += 1
+            if n:
+                self._commit(conn, rows, n)
+        conn.close()
+
+    def _commit(self, conn, rows, n):
+        t0 = time.perf_counter()
+        sessions = {}
+        for ts, sid, phone, zone, *_ in rows["assignments"]:
+            s = sessions.get(sid)
+            if s is None:
+                sessions[sid] = [sid, ts, ts, phone, zone, 1]
+            else:
+                if ts >= s[2]:
+                    s[2], s[3], s[4] = ts, phone, zone
+                s[1] = min(s[1], ts)
+                s[5] += 1
+        try:
+            with conn:
+                for name, batch in rows.items():
+                    if batch:
+                        conn.executemany(INSERTS[name], batch)
+                if sessions:
+                    conn.executemany(UPSERT_SESSION, list(sessions.values()))
+        except sqlite3.Error as e:
+            if self.on_error is not None:
+                self.on_error("sqlite_sink", e)
+            return
+        self.written += n
+        self.commit_sec += time.perf_counter() - t0
+
+# --- queries ---
+
+def _kst(ts):
+    return datetime.fromtimestamp(ts, KST).strftime("%Y-%m-%d %H:%M:%S")
+
+def where(conn, sid, start_ts, end_ts):
+    """Zone timeline of one session: zone at start, transitions inside the
+    range, and assignment counts per zone."""
+    start_ts = start_ts if start_ts is not None else 0.0
+    end_ts = end_ts if end_ts is not None else float("inf")
+    row = conn.execute("SELECT ts, zone_id FROM transitions WHERE session_id = ? AND ts <= ? "
+                       "ORDER BY ts DESC LIMIT 1", (sid, start_ts)).fetchone()
+    print("session {}: zone at start = {}".format(sid, "{} (since {})".format(row[1], _kst(row[0])) if row else "-"))
+    for ts, frm, to, conf in conn.execute(
+            "SELECT ts, from_zone, zone_id, confidence FROM transitions WHERE session_id = ? AND ts > ? AND ts <= ? "
+            "ORDER BY ts", (sid, start_ts, end_ts)):
+        print("  {}  {} -> {}  (conf {:.2f})".format(_kst(ts), frm, to, conf or 0.0))
+    print("assignments per zone:")
+    for zone, n, lo, hi in conn.execute(
+            "SELECT zone_id, COUNT(*), MIN(ts), MAX(ts) FROM assignments WHERE session_id = ? AND ts BETWEEN ? AND ? "
+            "GROUP BY zone_id ORDER BY COUNT(*) DESC", (sid, start_ts, end_ts)):
+        print("  zone {:>3}: {:>6}  {} .. {}".format(zone, n, _kst(lo), _kst(hi)))
+
+def zone_sessions(conn, zone, start_ts, end_ts):
+    start_ts = start_ts if start_ts is not None else 0.0
+    end_ts = end_ts if end_ts is not None else float("inf")
+    print("zone {}: sessions with assignments".format(zone))
+    for sid, n, lo, hi in conn.execute(
+            "SELECT session_id, COUNT(*), MIN(ts), MAX(ts) FROM assignments WHERE zone_id = ? AND ts BETWEEN ? AND ? "
+            "GROUP BY session_id ORDER BY MIN(ts)", (zone, start_ts, end_ts)):
+        print("  {:<8} {:>6}  {} .. {}".format(sid, n, _kst(lo), _kst(hi)))
+    row = conn.execute("SELECT COUNT(*), AVG(dwell_sec) FROM dwells WHERE zone_id = ? AND ts BETWEEN ? AND ?",
+                       (zone, start_ts, end_ts)).fetchone()
+    print("dwells ended in range: {}  avg {:.1f}s".format(row[0], row[1] or 0.0))
+
+def bench(rows, batch):
+    """Insert benchmark through the real writer path; prints rows/s."""
+    d = tempfile.mkdtemp()
+    path = os.path.join(d, "bench.sqlite")
+    sink = SqliteSink(path, batch=batch)
+    now = time.time()
+    t0 = time.perf_counter()
+    for i in range(rows):
+        ts = now + i * 0.01
+        sink.assignment({"ts": ts, "session_id": "S{:04d}".format(i % 500), "phone_id": "aa:bb:cc:dd:{:02x}:{:02x}".format(
+            (i // 256) % 256, i % 256), "zone_id": i % 19, "confidence": 0.8, "second_zone_id": (i + 1) % 19,
+            "margin": 0.2, "sources": ["pi5", "pi7", "pi8", "pi9", "pi10", "pi11"]})
+        if i % 20 == 0:
+            sink.transition({"ts": ts, "session_id": "S{:04d}".format(i % 500), "phone_id": "x",
+                             "from_zone": i % 19, "to_zone": (i + 1) % 19, "confidence": 0.8})
+            sink.dwell({"exit_ts": ts, "session_id": "S{:04d}".format(i % 500), "phone_id": "x",
+                        "zone_id": i % 19, "enter_ts": ts - 30, "dwell_sec": 30.0})
+    enqueue_sec = time.perf_counter() - t0
+    sink.close()
+    total_sec = time.perf_counter() - t0
+    print("rows={} (+{} transitions, +{} dwells) batch={}".format(rows, rows // 20, rows // 20, batch))
+    print("enqueue: {:.2f}s ({:.1f} us/row on the scorer thread)".format(enqueue_sec, 1e6 * enqueue_sec / rows))
+    print("written: {} rows in {:.2f}s -> {:.0f} rows/s ({:.2f}s inside transactions), dropped={}".format(
+        sink.written, total_sec, sink.written / total_sec, sink.commit_sec, sink.dropped))
+    print("db size: {:.1f} MB".format(os.path.getsize(path) / 1e6))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=os.path.join(OUTPUT_DIR, "live.sqlite"))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    w = sub.add_parser("where", help="zone timeline of a session")
+    w.add_argument("session_id")
+    w.add_argument("--start")
+    w.add_argument("--end")
+    z = sub.add_parser("zone", help="sessions seen in a zone")
+    z.add_argument("zone_id", type=int)
+    z.add_argument("--start")
+    z.add_argument("--end")
+    s = sub.add_parser("sessions", help="sessions active since a time")
+    s.add_argument("--since")
+    q = sub.add_parser("sql", help="run a read-only query")
+    q.add_argument("query")
+    b = sub.add_parser("bench", help="insert throughput benchmark (temporary database)")
+    b.add_argument("--rows", type=int, default=200000)
+    b.add_argument("--batch", type=int, default=SQLITE_BATCH)
+    args = ap.parse_args()
+
+    if args.cmd == "bench":
+        bench(args.rows, args.batch)
+        return
+    if not os.path.exists(args.db):
+        raise SystemExit("ERROR: {} not found (set SQLITE_PATH for run_live)".format(args.db))
+    conn = connect(args.db, readonly=True)
+    if args.cmd == "where":
+        where(conn, args.session_id, parse_time_arg(args.start), parse_time_arg(args.end))
+    elif args.cmd == "zone":
+        zone_sessions(conn, args.zone_id, parse_time_arg(args.start), parse_time_arg(args.end))
+    elif args.cmd == "sessions":
+        since = parse_time_arg(args.since) or 0.0
+        for sid, first, last, phone, zone, n in conn.execute(
+                "SELECT session_id, first_ts, ts, phone_id, zone_id, n_assignments FROM sessions WHERE ts >= ? "
+                "ORDER BY ts DESC", (since,)):
+            print("{:<8} zone {:>3}  {} .. {}  {:>6} assignments  {}".format(sid, zone, _kst(first), _kst(last), n, phone))
+    elif args.cmd == "sql":
+        cur = conn.execute(args.query)
+        if cur.description:
+            print("\t".join(c[0] for c in cur.description))
+        for row in cur:
+            print("\t".join("" if v is None else str(v) for v in row))
+    conn.close()
+
+if __name__ == "__main__":
+    main()
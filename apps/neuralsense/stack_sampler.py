@@ -0,0 +1,164 @@
+# stack_sampler.py
+#
+# Low-overhead wall-clock stack sampler for live processes (run_live_geometry,
+# the Pi sniffer). Nothing runs while it is off: install() only registers a
+# signal handler and a control-file watcher that checks one file per second.
+#
+# While on, a daemon thread snapshots every thread's stack each
+# PROFILE_INTERVAL_MS (sys._current_frames) and counts collapsed stacks. On
+# stop (or after the time box) it writes
+#   OUTPUT_DIR/profile_<name>_<YYYYmmdd-HHMMSS>.collapsed
+# with one "thread;outer;...;inner count" line per stack, the input format of
+# flamegraph.pl and speedscope.
+#
+# Control:
+#   kill -USR1 <pid>                          toggle (POSIX)
+#   python stack_sampler.py run_live start 30 sample for 30 s (any OS)
+#   python stack_sampler.py run_live stop
+
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+
+from config import OUTPUT_DIR, PROFILE_INTERVAL_MS, PROFILE_MAX_SEC
+
+KST = timezone(timedelta(hours=9))
+CONTROL_POLL_SEC = 1.0
+
+def control_path(out_dir, name):
+    return os.path.join(out_dir, "profile_{}.ctl".format(name))
+
+def frame_label(code):
+    return "{}:{}".format(os.path.basename(code.co_filename), code.co_name).replace(";", ":")
+
+class StackSampler:
+    def __init__(self, name, out_dir, interval_sec=PROFILE_INTERVAL_MS / 1000.0, max_sec=PROFILE_MAX_SEC):
+        self.name = name
+        self.out_dir = out_dir
+        self.interval = interval_sec
+        self.max_sec = max_sec
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = None
+        self.last_path = None
+        self.control_ident = None   # watcher thread, left out of the samples
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, duration=None):
+        """Start sampling for `duration` seconds (default: until stop(), at most max_sec)."""
+        with self.lock:
+            if self.running():
+                return False
+            self.stop_event = threading.Event()
+            limit = min(duration, self.max_sec) if duration else self.max_sec
+            self.thread = threading.Thread(target=self._run, args=(self.stop_event, limit),
+                                           name="stack-sampler", daemon=True)
+            self.thread.start()
+        print("[PROFILE] Sampling every {:.0f} ms for up to {:.0f}s".format(self.interval * 1000, limit))
+        return True
+
+    def stop(self):
+        with self.lock:
+            if not self.running():
+                return False
+            self.stop_event.set()
+        return True
+
+    def toggle(self):
+        if not self.stop():
+            self.start()
+
+    def _run(self, stop_event, limit):
+        me = threading.get_ident()
+        control = self.control_ident
+        counts = {}
+        labels = {}         # code object -> label (a few hundred at most)
+        samples = 0
+        t0 = time.perf_counter()
+        cpu0 = time.process_time()
+        deadline = time.monotonic() + limit
+        while not stop_event.wait(self.interval) and time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or ident == control:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = frame_label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread-{}".format(ident)))
+                key = ";".join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+            samples += 1
+        elapsed = time.perf_counter() - t0
+        self._write(counts, samples, elapsed, time.process_time() - cpu0)
+
+    def _write(self, counts, samples, elapsed, cpu_sec):
+        stamp = datetime.now(KST).strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.out_dir, "profile_{}_{}.collapsed".format(self.name, stamp))
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                for key, n in sorted(counts.items(), key=lambda kv: -kv[1]):
+                    f.write("{} {}\n".format(key, n))
+        except OSError as e:
+            sys.stderr.write("[PROFILE] write failed: {}\n".format(e))
+            return
+        self.last_path = path
+        print("[PROFILE] {} samples over {:.1f}s (process CPU {:.0f}%) -> {}".format(
+            samples, elapsed, 100.0 * cpu_sec / elapsed if elapsed else 0.0, path))
+
+    def _watch_control(self):
+        """Poll the control file: "start [sec]" or "stop", removed once read."""
+        path = control_path(self.out_dir, self.name)
+        self.control_ident = threading.get_ident()
+        while True:
+            time.sleep(CONTROL_POLL_SEC)
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    cmd = f.read().split()
+                os.remove(path)
+            except OSError:
+                continue
+            if cmd and cmd[0] == "start":
+                try:
+                    self.start(float(cmd[1]) if len(cmd) > 1 else None)
+                except ValueError:
+                    sys.stderr.write("[PROFILE] bad control command: {}\n".format(" ".join(cmd)))
+            elif cmd and cmd[0] == "stop":
+                self.stop()
+
+def install(name, out_dir=OUTPUT_DIR):
+    """Make the current process profilable on demand; returns the sampler."""
+    sampler = StackSampler(name, out_dir)
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda signum, frame: sampler.toggle())
+    threading.Thread(target=sampler._watch_control, name="profile-control", daemon=True).start()
+    return sampler
+
+def main():
+    ap = argparse.ArgumentParser(description="Start/stop the sampler of a running process")
+    ap.add_argument("name", help="process name passed to install(): run_live | sniffer")
+    ap.add_argument("action", choices=("start", "stop"))
+    ap.add_argument("seconds", nargs="?", type=float, help="time box for start")
+    ap.add_argument("--out-dir", default=OUTPUT_DIR)
+    args = ap.parse_args()
+    cmd = args.action if args.seconds is None or args.action == "stop" else "start {}".format(args.seconds)
+    with open(control_path(args.out_dir, args.name), "w", encoding="utf-8") as f:
+        f.write(cmd)
+    print("Sent '{}' to {} (picked up within {:.0f}s)".format(cmd, args.name, CONTROL_POLL_SEC))
+
+if __name__ == "__main__":
+    main()
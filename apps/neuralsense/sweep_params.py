@@ -0,0 +1,304 @@
+# sweep_params.py
+#
+# Parallel parameter sweep over recorded RSSI.
+#
+# Replays a recorded raw_rssi.jsonl against ground truth (accuracy test folders
+# or a truth CSV) for a grid or random sample of run_live tuning knobs, and
+# prints a ranked accuracy / latency table.
+#
+# How it stays fast:
+#   1. Fresh vectors are built once per (WINDOW_SEC, PER_PI_FRESH_SEC, FUSION).
+#   2. Zone confidence is L1_WEIGHT * frac(l1 <= MATCH_DIFF_DBM)
+#      + RANK_WEIGHT * frac(rank_dist <= RANK_MATCH_THRESHOLD), and the two
+#      fractions are independent. For every vector, the per-zone fractions are
+#      tabulated once for every MATCH_DIFF_DBM and RANK_MATCH_THRESHOLD value in
+#      the search space, in a process pool.
+#   3. Each scoring combination (weights, thresholds, MARGIN_GATE,
+#      TRANSITION_CONFIRM_COUNT) is then a few array ops over those tables,
+#      evaluated across the pool.
+#
+# Usage:
+#   python sweep_params.py output_02252026/raw_rssi.jsonl --truth-folders accuracy_tests_02252026
+#   python sweep_params.py raw_rssi.jsonl --truth truth.csv --random 500 --workers 8 --out sweep.csv
+#   python sweep_params.py raw_rssi.jsonl --truth truth.csv --set MARGIN_GATE=0.1,0.15 --set WINDOW_SEC=5
+#   python sweep_params.py raw_rssi.jsonl --truth truth.csv --set FUSION=latest,median --set MARGIN_GATE=0.05,0.1,0.15
+
+import argparse
+import csv
+import itertools
+import os
+import random
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import evaluate_accuracy_tests as evaluator
+import rssi_window
+import run_live_geometry as live
+from config import MIN_SOURCES
+from replay_raw_rssi import iter_raw_rssi, parse_channels
+
+SEARCH_SPACE = {
+    "WINDOW_SEC": [3, 5, 8],
+    "PER_PI_FRESH_SEC": [2.0, 3.0, 4.0],
+    "FUSION": ["latest"],       # fused vectors shift margins: sweep with MARGIN_GATE
+    "MATCH_DIFF_DBM": [5.0, 6.0, 7.0, 8.0, 9.0],
+    "RANK_MATCH_THRESHOLD": [1.0, 1.25, 1.5, 2.0],
+    "RANK_WEIGHT": [0.2, 0.3, 0.4, 0.5, 0.6],   # L1_WEIGHT = 1 - RANK_WEIGHT
+    "MARGIN_GATE": [0.05, 0.1, 0.15, 0.2, 0.25],
+    "TRANSITION_CONFIRM_COUNT": [1, 2, 3, 4, 5],
+}
+SCORING_KEYS = ("MATCH_DIFF_DBM", "RANK_MATCH_THRESHOLD", "RANK_WEIGHT", "MARGIN_GATE", "TRANSITION_CONFIRM_COUNT")
+VECTOR_CHUNK = 256
+COMBO_CHUNK = 64
+
+# --- Stage 1: fresh vectors per (WINDOW_SEC, PER_PI_FRESH_SEC, FUSION) ---
+
+def build_vectors(events, windows, window_sec, fresh_sec, fusion="latest", min_sources=MIN_SOURCES, pis=()):
+    """Replay events through the live buffer logic; keep vectors of truth
+    phones that fall inside one of their windows.
+    Returns (vec_ts, vec_window, raw_vecs)."""
+    by_phone = defaultdict(list)
+    for wi, w in enumerate(windows):
+        by_phone[w["phone_id"]].append((w["start"], w["end"], wi))
+    fuser = rssi_window.Fusion(fusion, pis) if fusion != "latest" else None
+    buf = defaultdict(fuser.new_window if fuser is not None else deque)
+    vec_ts, vec_window, raw_vecs = [], [], []
+    for ts, phone, rpi_id, rssi in events:
+        spans = by_phone.get(phone)
+        if spans is None:
+            continue
+        d = buf[phone]
+        if fuser is None:
+            live.push_event(d, ts, rpi_id, rssi, window_sec)
+        else:
+            d.push(ts, rpi_id, rssi)
+        wi = next((i for s, e, i in spans if s <= ts <= e), None)
+        if wi is None:
+            continue
+        if fuser is None:
+            raw_vec = live.build_fresh_vector(d, ts, fresh_sec)
+        else:
+            raw_vec = fuser.vector(d, ts, fresh_sec)
+        if len(raw_vec) < min_sources:
+            continue
+        vec_ts.append(ts)
+        vec_window.append(wi)
+        raw_vecs.append(raw_vec)
+    vec_ts = np.asarray(vec_ts, dtype=np.float64)
+    vec_window = np.asarray(vec_window, dtype=np.int64)
+    order = np.lexsort((vec_ts, vec_window))     # counted_masks wants (group, ts) order
+    return vec_ts[order], vec_window[order], [raw_vecs[i] for i in order]
+
+# --- Stage 2: per-zone match fractions for every threshold value ---
+
+_model = None
+_tables = None
+
+def _init_model(model):
+    global _model
+    _model = model
+
+def _frac_tables(job):
+    """For a chunk of raw vectors: (n, |M|, Z) fraction of calibration rows with
+    l1 <= m, and (n, |R|, Z) fraction with rank_dist <= r."""
+    raw_vecs, match_values, rank_values = job
+    model = _model
+    counts = model["zone_counts"]
+    starts = np.r_[0, np.cumsum(counts)[:-1]].astype(np.int64)
+    m = np.asarray(match_values)[:, None]
+    r = np.asarray(rank_values)[:, None]
+    fl = np.empty((len(raw_vecs), len(match_values), len(counts)), dtype=np.float64)
+    fr = np.empty((len(raw_vecs), len(rank_values), len(counts)), dtype=np.float64)
+    for i, raw_vec in enumerate(raw_vecs):
+        l1, rd = live.masked_distances(raw_vec, model)
+        fl[i] = np.add.reduceat((l1[None, :] <= m).astype(np.float64), starts, axis=1) / counts
+        fr[i] = np.add.reduceat((rd[None, :] <= r).astype(np.float64), starts, axis=1) / counts
+    return fl, fr
+
+# --- Stage 3: score, gate, debounce, measure ---
+
+def _init_tables(tables):
+    global _tables
+    _tables = tables
+
+def evaluate_combo(t, combo):
+    """Accuracy / yield / latency for one scoring combination on one vector set."""
+    mi = t["match_index"][combo["MATCH_DIFF_DBM"]]
+    ri = t["rank_index"][combo["RANK_MATCH_THRESHOLD"]]
+    rank_w = combo["RANK_WEIGHT"]
+    conf = (1.0 - rank_w) * t["fl"][:, mi, :] + rank_w * t["fr"][:, ri, :]
+    order = np.argsort(-conf, axis=1, kind="stable")
+    rows = np.arange(len(conf))
+    best = t["zone_ids"][order[:, 0]]
+    best_conf = conf[rows, order[:, 0]]
+    second_conf = conf[rows, order[:, 1]] if conf.shape[1] > 1 else np.zeros(len(conf))
+    confident = (best_conf - second_conf) >= combo["MARGIN_GATE"]
+
+    win = t["vec_window"][confident]
+    ts = t["vec_ts"][confident]
+    pred = best[confident]
+    true = t["win_true"][win]
+    a = {"group": win, "ts": ts, "pred": pred, "true": true, "start": t["win_start"][win]}
+    settled, counted, streak_len = evaluator.counted_masks(a)
+    correct = pred == true
+    n_counted = int(counted.sum())
+    accuracy = float((correct & counted).sum()) / n_counted if n_counted else 0.0
+
+    # Debounce latency: the first confident prediction of a window sets the
+    # zone; afterwards the true zone needs TRANSITION_CONFIRM_COUNT in a row.
+    n = len(win)
+    first = np.r_[True, win[1:] != win[:-1]] if n else np.zeros(0, dtype=bool)
+    hit = correct & (first | (streak_len >= combo["TRANSITION_CONFIRM_COUNT"]))
+    lat = np.full(len(t["win_true"]), np.nan)
+    if hit.any():
+        hw = win[hit]
+        first_hit = np.r_[True, hw[1:] != hw[:-1]]
+        lat[hw[first_hit]] = ts[hit][first_hit] - t["win_start"][hw[first_hit]]
+    found = ~np.isnan(lat)
+
+    return {
+        "accuracy": round(accuracy, 4),
+        "counted": n_counted,
+        "assign_per_min": round(60.0 * len(win) / t["total_sec"], 2) if t["total_sec"] else 0.0,
+        "latency_median_sec": round(float(np.median(lat[found])), 2) if found.any() else None,
+        "windows_reached": "{}/{}".format(int(found.sum()), len(lat)),
+    }
+
+def _eval_chunk(jobs):
+    out = []
+    for key, combo in jobs:
+        res = evaluate_combo(_tables[key], combo)
+        res.update(combo)
+        res["WINDOW_SEC"], res["PER_PI_FRESH_SEC"], res["FUSION"] = key
+        res["L1_WEIGHT"] = round(1.0 - combo["RANK_WEIGHT"], 3)
+        out.append(res)
+    return out
+
+def _chunks(seq, n):
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
+def scoring_combos(space, n_random, rng):
+    grid = [dict(zip(SCORING_KEYS, vals)) for vals in itertools.product(*(space[k] for k in SCORING_KEYS))]
+    if n_random and n_random < len(grid):
+        return rng.sample(grid, n_random)
+    return grid
+
+def parse_set(values, space):
+    space = {k: list(v) for k, v in space.items()}
+    for item in values or []:
+        name, _, vals = item.partition("=")
+        name = name.strip().upper()
+        if name not in space:
+            raise SystemExit("ERROR: unknown parameter {} (one of {})".format(name, ", ".join(space)))
+        cast = int if name in ("WINDOW_SEC", "TRANSITION_CONFIRM_COUNT") else str if name == "FUSION" else float
+        space[name] = [cast(v.strip()) for v in vals.split(",") if v.strip()]
+    for f in space["FUSION"]:
+        if f != "latest" and f not in rssi_window.METHODS:
+            raise SystemExit("ERROR: FUSION must be latest or one of " + ", ".join(rssi_window.METHODS))
+    return space
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("raw_rssi", help="recorded raw_rssi.jsonl")
+    ap.add_argument("--cal", default=live.CAL_JSONL, help="calibration.jsonl")
+    ap.add_argument("--truth-folders", nargs="*", default=[], help="accuracy test folders/globs")
+    ap.add_argument("--truth", help="ground-truth CSV: phone_id,true_zone_id,start,end")
+    ap.add_argument("--set", action="append", help="override a search dimension, e.g. MARGIN_GATE=0.1,0.15")
+    ap.add_argument("--random", type=int, default=0, help="sample N scoring combinations instead of the full grid")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--out", default="sweep_results.csv")
+    ap.add_argument("--channels", help="use only these channels, e.g. 1,6,11 (multi-channel Pis)")
+    args = ap.parse_args()
+
+    windows = []
+    if args.truth_folders:
+        _, groups = evaluator.load_test_folders(args.truth_folders)
+        windows.extend(groups)
+    if args.truth:
+        windows.extend(evaluator.load_truth_csv(args.truth))
+    if not windows:
+        ap.error("need ground truth: --truth-folders and/or --truth")
+
+    space = parse_set(args.set, SEARCH_SPACE)
+    live.CAL_JSONL = args.cal
+    cal = live.load_calibration()
+    if not cal:
+        raise SystemExit("ERROR: {} missing or has no vectors.".format(args.cal))
+    model = live.compile_calibration(cal, live.compute_pi_weights(cal))
+
+    t0 = time.perf_counter()
+    lo = min(w["start"] for w in windows) - max(space["WINDOW_SEC"])
+    hi = max(w["end"] for w in windows)
+    phones = {w["phone_id"] for w in windows}
+    events = sorted((e for e in iter_raw_rssi(args.raw_rssi, lo, hi, parse_channels(args.channels)) if e[1] in phones), key=lambda e: e[0])
+    print("Loaded {} events for {} phones / {} truth windows in {:.1f}s".format(
+        len(events), len(phones), len(windows), time.perf_counter() - t0))
+
+    win_true = np.asarray([w["true_zone_id"] for w in windows], dtype=np.int64)
+    win_start = np.asarray([w["start"] for w in windows], dtype=np.float64)
+    total_sec = float(sum(w["end"] - w["start"] for w in windows))
+    match_values = space["MATCH_DIFF_DBM"]
+    rank_values = space["RANK_MATCH_THRESHOLD"]
+
+    tables = {}
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_model, initargs=(model,)) as pool:
+        for window_sec, fresh_sec, fusion in itertools.product(space["WINDOW_SEC"], space["PER_PI_FRESH_SEC"],
+                                                               space["FUSION"]):
+            if fusion != "latest" and window_sec != space["WINDOW_SEC"][0]:
+                continue    # ring buffers do not depend on WINDOW_SEC
+            t1 = time.perf_counter()
+            vec_ts, vec_window, raw_vecs = build_vectors(events, windows, window_sec, fresh_sec, fusion,
+                                                         pis=model["pis"])
+            fl_parts, fr_parts = [], []
+            jobs = [(chunk, match_values, rank_values) for chunk in _chunks(raw_vecs, VECTOR_CHUNK)]
+            for fl, fr in pool.map(_frac_tables, jobs):
+                fl_parts.append(fl)
+                fr_parts.append(fr)
+            nz = len(model["zone_ids"])
+            tables[(window_sec, fresh_sec, fusion)] = {
+                "fl": np.concatenate(fl_parts) if fl_parts else np.zeros((0, len(match_values), nz), np.float64),
+                "fr": np.concatenate(fr_parts) if fr_parts else np.zeros((0, len(rank_values), nz), np.float64),
+                "match_index": {v: i for i, v in enumerate(match_values)},
+                "rank_index": {v: i for i, v in enumerate(rank_values)},
+                "zone_ids": np.asarray(model["zone_ids"], dtype=np.int64),
+                "vec_ts": vec_ts, "vec_window": vec_window,
+                "win_true": win_true, "win_start": win_start, "total_sec": total_sec,
+            }
+            print("WINDOW_SEC={} PER_PI_FRESH_SEC={} FUSION={}: {} vectors precomputed in {:.1f}s".format(
+                window_sec, fresh_sec, fusion, len(raw_vecs), time.perf_counter() - t1))
+
+    rng = random.Random(args.seed)
+    combos = scoring_combos(space, args.random, rng)
+    jobs = [(key, c) for key in tables for c in combos]
+    t2 = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_tables, initargs=(tables,)) as pool:
+        for part in pool.map(_eval_chunk, list(_chunks(jobs, COMBO_CHUNK))):
+            results.extend(part)
+    print("Evaluated {} parameter sets in {:.1f}s".format(len(results), time.perf_counter() - t2))
+
+    inf = float("inf")
+    results.sort(key=lambda r: (-r["accuracy"], r["latency_median_sec"] if r["latency_median_sec"] is not None else inf,
+                                -r["assign_per_min"]))
+    cols = ["accuracy", "counted", "assign_per_min", "latency_median_sec", "windows_reached", "WINDOW_SEC",
+            "PER_PI_FRESH_SEC", "FUSION", "MATCH_DIFF_DBM", "MARGIN_GATE", "RANK_WEIGHT", "L1_WEIGHT",
+            "RANK_MATCH_THRESHOLD", "TRANSITION_CONFIRM_COUNT"]
+    with open(args.out, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=cols)
+        w.writeheader()
+        for r in results:
+            w.writerow({k: r[k] for k in cols})
+
+    print(" ".join("{:>10}".format(c[:10]) for c in cols))
+    for r in results[:args.top]:
+        print(" ".join("{:>10}".format("-" if r[c] is None else str(r[c])) for c in cols))
+    print("Wrote ->", args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+# zone_aggregates.py
+#
+# Incremental zone occupancy / dwell aggregates for the live scorer.
+#
+# - Current occupancy per zone (sessions whose confirmed zone it is, minus
+#   sessions idle for longer than idle_sec)
+# - Per-minute entry/exit counts per zone, kept for history_min minutes
+# - Per-minute dwell quantile sketches per zone (relative-error log buckets,
+#   mergeable, so any window of minutes can be summarized)
+#
+# run_live_geometry feeds it from its transition/dwell path and writes one
+# compact record per closed minute to zone_occupancy.jsonl. serve() exposes
+# the same data over HTTP (run_live: when OCCUPANCY_HTTP_ADDR is set):
+#   GET /occupancy              current per-zone headcount
+#   GET /minutes?n=15           last n closed minute records
+#   GET /dwell?minutes=60       per-zone dwell quantiles over the last n minutes
+# In multi-store mode serve() gets {store_id: aggregator} and the same paths
+# sit under /<store_id>/ (GET /stores lists the loaded stores).
+
+import json
+import math
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from jsonl_follow import parse_addr
+
+MINUTE_SEC = 60
+EXPIRE_EVERY_SEC = 5.0
+SKETCH_REL_ERR = 0.01       # dwell quantiles within 1% of the true value
+SKETCH_MIN_SEC = 0.1        # dwells shorter than this share one bucket
+QUANTILES = (0.5, 0.9, 0.99)
+
+class DwellSketch:
+    """Log-bucketed quantile sketch (DDSketch-style): bucket i holds values in
+    (gamma^(i-1), gamma^i], so any reported quantile is within SKETCH_REL_ERR."""
+
+    __slots__ = ("buckets", "n", "total")
+    GAMMA = (1.0 + SKETCH_REL_ERR) / (1.0 - SKETCH_REL_ERR)
+    LOG_GAMMA = math.log(GAMMA)
+
+    def __init__(self):
+        self.buckets = {}
+        self.n = 0
+        self.total = 0.0
+
+    def add(self, value):
+        key = math.ceil(math.log(max(value, SKETCH_MIN_SEC)) / self.LOG_GAMMA)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        self.n += 1
+        self.total += value
+
+    def merge(self, other):
+        for key, c in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + c
+        self.n += other.n
+        self.total += other.total
+
+    def quantile(self, q):
+        if self.n == 0:
+            return None
+        rank = q * (self.n - 1)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2.0 * self.GAMMA ** key / (self.GAMMA + 1.0)
+        return None
+
+    def summary(self):
+        out = {"dwell_n": self.n}
+        if self.n:
+            out["dwell_mean"] = round(self.total / self.n, 1)
+            for q in QUANTILES:
+                out["dwell_p{}".format(int(q * 100))] = round(self.quantile(q), 1)
+        return out
+
+class _Minute:
+    __slots__ = ("start", "entries", "exits", "dwell")
+
+    def __init__(self, start):
+        self.start = start
+        self.entries = {}   # zone_id -> count
+        self.exits = {}
+        self.dwell = {}     # zone_id -> DwellSketch
+
+class ZoneAggregator:
+    """Not thread-safe by itself: the scorer thread mutates, readers go through
+    the lock (serve() does)."""
+
+    def __init__(self, idle_sec, history_min, emit=None):
+        self.idle_sec = idle_sec
+        self.emit = emit                # callable(record) for each closed minute
+        self.lock = threading.Lock()
+        self.where = {}                 # session_id -> zone_id
+        self.last_seen = {}             # session_id -> ts
+        self.occ = {}                   # zone_id -> headcount
+        self.minute = None
+        self.history = deque(maxlen=history_min)   # closed _Minute objects
+        self.records = deque(maxlen=history_min)   # their emitted records
+        self.next_expire = 0.0
+
+    # --- mutation (scorer thread) ---
+
+    def _cur(self, ts):
+        start = ts - ts % MINUTE_SEC
+        if self.minute is None:
+            self.minute = _Minute(start)
+        return self.minute
+
+    def _enter(self, sid, zone, ts):
+        self.where[sid] = zone
+        self.occ[zone] = self.occ.get(zone, 0) + 1
+        m = self._cur(ts)
+        m.entries[zone] = m.entries.get(zone, 0) + 1
+
+    def _exit(self, sid, ts):
+        zone = self.where.pop(sid, None)
+        if zone is None:
+            return
+        n = self.occ.get(zone, 0) - 1
+        if n > 0:
+            self.occ[zone] = n
+        else:
+            self.occ.pop(zone, None)
+        m = self._cur(ts)
+        m.exits[zone] = m.exits.get(zone, 0) + 1
+
+    def move(self, sid, zone, ts):
+        """Session's confirmed zone is now `zone` (first sighting or transition)."""
+        with self.lock:
+            self.last_seen[sid] = ts
+            if self.where.get(sid) == zone:
+                return
+            self._exit(sid, ts)
+            self._enter(sid, zone, ts)
+
+    def touch(self, sid, zone, ts):
+        """Confident assignment for a session already in `zone`; re-enters it
+        if it had been expired as idle."""
+        self.last_seen[sid] = ts
+        if sid not in self.where:
+            with self.lock:
+                self._enter(sid, zone, ts)
+
+    def leave(self, sid, ts):
+        with self.lock:
+            self.last_seen.pop(sid, None)
+            self._exit(sid, ts)
+
+    def dwell(self, zone, dwell_sec, ts):
+        with self.lock:
+            m = self._cur(ts)
+            sk = m.dwell.get(zone)
+            if sk is None:
+                sk = m.dwell[zone] = DwellSketch()
+            sk.add(dwell_sec)
+
+    def tick(self, now_ts):
+        """Expire idle sessions and close finished minutes; call per message."""
+        if now_ts >= self.next_expire:
+            self.next_expire = now_ts + EXPIRE_EVERY_SEC
+            cutoff = now_ts - self.idle_sec
+            idle = [sid for sid, ts in self.last_seen.items() if ts < cutoff]
+            if idle:
+                with self.lock:
+                    for sid in idle:
+                        del self.last_seen[sid]
+                        self._exit(sid, now_ts)
+        m = self.minute
+        if m is None:
+            self._cur(now_ts)
+        elif now_ts >= m.start + MINUTE_SEC:
+            with self.lock:
+                rec = self._record(m)
+                self.history.append(m)
+                self.records.append(rec)
+                self.minute = _Minute(now_ts - now_ts % MINUTE_SEC)
+            if self.emit is not None:
+                self.emit(rec)
+
+    def _record(self, m):
+        zones = {}
+        for z in set(self.occ) | set(m.entries) | set(m.exits) | set(m.dwell):
+            rec = {"occ": self.occ.get(z, 0), "in": m.entries.get(z, 0), "out": m.exits.get(z, 0)}
+            sk = m.dwell.get(z)
+            if sk is not None:
+                rec.update(sk.summary())
+            zones[str(z)] = rec
+        return {"ts": m.start, "minute_sec": MINUTE_SEC, "occupancy": sum(self.occ.values()),
+                "zones": dict(sorted(zones.items(), key=lambda kv: int(kv[0])))}
+
+    # --- queries (any thread) ---
+
+    def occupancy(self):
+        with self.lock:
+            return {"occupancy": sum(self.occ.values()),
+                    "zones": {str(z): n for z, n in sorted(self.occ.items())}}
+
+    def last_minutes(self, n):
+        with self.lock:
+            return list(self.records)[-n:] if n > 0 else []
+
+    def dwell_window(self, minutes):
+        with self.lock:
+            recent = list(self.history)[-minutes:] if minutes > 0 else []
+            merged = {}
+            for m in recent:
+                for z, sk in m.dwell.items():
+                    merged.setdefault(z, DwellSketch()).merge(sk)
+        return {"minutes": len(recent),
+                "zones": {str(z): merged[z].summary() for z in sorted(merged)}}
+
+class _Handler(BaseHTTPRequestHandler):
+    agg = None      # ZoneAggregator, or {store_id: ZoneAggregator}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        q = parse_qs(url.query)
+        agg, path = self.agg, url.path
+        if isinstance(agg, dict):
+            if path == "/stores":
+                self._send(sorted(agg.copy()))   # copy: stores load/evict concurrently
+                return
+            _, store, path = (path.split("/", 2) + ["", ""])[:3]
+            agg, path = agg.get(store), "/" + path
+            if agg is None:
+                self.send_error(404)
+                return
+        try:
+            if path == "/occupancy":
+                body = agg.occupancy()
+            elif path == "/minutes":
+                body = agg.last_minutes(int(q.get("n", ["15"])[0]))
+            elif path == "/dwell":
+                body = agg.dwell_window(int(q.get("minutes", ["60"])[0]))
+            else:
+                self.send_error(404)
+                return
+        except ValueError:
+            self.send_error(400)
+            return
+        self._send(body)
+
+    def _send(self, body):
+        data = json.dumps(body, separators=(",", ":")).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        pass
+
+def serve(agg, addr):
+    """Start the query endpoint on a daemon thread; returns the server. `agg`
+    may be a dict of aggregators by store id (read live, so stores can come
+    and go)."""
+    handler = type("ZoneAggHandler", (_Handler,), {"agg": agg})
+    server = ThreadingHTTPServer(parse_addr(addr), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="zone-agg-http", daemon=True).start()
+    return server
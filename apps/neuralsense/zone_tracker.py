@@ -0,0 +1,200 @@
+# zone_tracker.py
+#
+# Online HMM zone tracker, an alternative to the confirm-count debounce in
+# run_live_geometry (TRACKER=hmm).
+#
+# - States are the calibrated zones. The transition matrix comes from
+#   zones.csv geometry: a session stays with TRACKER_STAY_PROB per tick and
+#   otherwise moves to a zone within TRACKER_ADJ_DIST, plus a small floor so
+#   a missed zone can still be recovered.
+# - Emissions are the per-zone confidence vectors of every scored message,
+#   margin-gated ones included: p(obs | zone) ~ exp(beta * conf).
+# - Observations are collected per session and folded in once per tick
+#   (TRACKER_TICK_SEC) for all sessions seen in that tick: one belief @ T
+#   matrix product, so the cost per tick is O(active sessions * zones^2)
+#   however many messages arrived.
+# - A session switches zone when the forward posterior of another zone
+#   reaches TRACKER_SWITCH_PROB. The dwell boundary is the start of the tick
+#   where that zone first led the posterior.
+#
+# Usage (synthetic benchmark, per-tick cost vs active sessions):
+#   python zone_tracker.py
+
+import time
+
+import numpy as np
+
+from config import (TRACKER_TICK_SEC, TRACKER_STAY_PROB, TRACKER_ADJ_DIST, TRACKER_EMISSION_BETA,
+                    TRACKER_SWITCH_PROB, TRACKER_IDLE_SEC)
+
+TELEPORT_PROB = 1e-3    # per tick, to any zone, whatever the distance
+INITIAL_ROWS = 64
+
+def transition_matrix(zone_ids, zones, stay_prob=TRACKER_STAY_PROB, adj_dist=TRACKER_ADJ_DIST,
+                      teleport=TELEPORT_PROB):
+    """Row-stochastic (Z, Z) matrix over zone_ids from zone coordinates {zid: (x, y)}.
+    Zones without coordinates only keep the stay and teleport terms."""
+    n = len(zone_ids)
+    xy = np.array([zones.get(z, (np.nan, np.nan)) for z in zone_ids], dtype=np.float64).reshape(n, 2)
+    dist = np.sqrt(((xy[:, None, :] - xy[None, :, :]) ** 2).sum(axis=2))
+    adj = (dist <= adj_dist) & ~np.eye(n, dtype=bool)
+    deg = adj.sum(axis=1, keepdims=True)
+    move = np.where(deg > 0, 1.0 - stay_prob, 0.0)
+    t = np.where(adj, move / np.maximum(deg, 1), 0.0)
+    t[np.diag_indices(n)] = 1.0 - move[:, 0]
+    t = t + teleport / n
+    return t / t.sum(axis=1, keepdims=True)
+
+class HmmTracker:
+    """Forward-filtered zone beliefs for all live sessions of one store.
+
+    observe() is called per scored message; step(now) once the tick has
+    elapsed returns the confirmed zone changes as
+    (sid, phone, from_zone, to_zone, exit_ts, posterior).
+    """
+
+    def __init__(self, zone_ids, zones, tick_sec=TRACKER_TICK_SEC, stay_prob=TRACKER_STAY_PROB,
+                 adj_dist=TRACKER_ADJ_DIST, beta=TRACKER_EMISSION_BETA, switch_prob=TRACKER_SWITCH_PROB,
+                 idle_sec=TRACKER_IDLE_SEC):
+        self.zone_ids = list(zone_ids)
+        self.zindex = {z: i for i, z in enumerate(self.zone_ids)}
+        self.trans = transition_matrix(self.zone_ids, zones, stay_prob, adj_dist)
+        self.tick_sec = tick_sec
+        self.beta = beta
+        self.switch_prob = switch_prob
+        self.idle_sec = idle_sec
+        self.last_tick = None
+        self.rows = {}          # sid -> row
+        self.free = []
+        self.sids = []
+        self.phones = []
+        self._alloc(INITIAL_ROWS)
+
+    def _alloc(self, n):
+        nz = len(self.zone_ids)
+        old = len(self.sids)
+        def grow(name, fill, dtype, shape=()):
+            a = np.full((n,) + shape, fill, dtype=dtype)
+            if old:
+                a[:old] = getattr(self, name)
+            setattr(self, name, a)
+        grow("belief", 0.0, np.float64, (nz,))
+        grow("obs_sum", 0.0, np.float64, (nz,))
+        grow("obs_n", 0, np.int64)
+        grow("obs_ts", 0.0, np.float64)     # first observation of the current tick
+        grow("last_ts", 0.0, np.float64)
+        grow("lead_ts", 0.0, np.float64)    # when the current argmax took the lead
+        grow("zone", -1, np.int64)          # confirmed zone index, -1 none yet
+        grow("lead", -1, np.int64)
+        self.free.extend(range(n - 1, old - 1, -1))
+        self.sids.extend([None] * (n - old))
+        self.phones.extend([None] * (n - old))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def observe(self, sid, phone, conf, ts, zone_id=None):
+        """Queue one confidence vector (ordered as zone_ids) for the next tick.
+        zone_id seeds a new session's belief (e.g. a restored confirmed zone)."""
+        r = self.rows.get(sid)
+        if r is None:
+            if not self.free:
+                self._alloc(2 * len(self.sids))
+            r = self.free.pop()
+            self.rows[sid] = r
+            self.sids[r] = sid
+            zi = self.zindex.get(zone_id, -1) if zone_id is not None else -1
+            if zi >= 0:
+                self.belief[r] = 0.0
+                self.belief[r, zi] = 1.0
+            else:
+                self.belief[r] = 1.0 / len(self.zone_ids)
+            self.zone[r] = zi
+            self.lead[r] = zi
+            self.lead_ts[r] = ts
+            self.obs_sum[r] = 0.0
+            self.obs_n[r] = 0
+        self.phones[r] = phone
+        if self.obs_n[r] == 0:
+            self.obs_ts[r] = ts
+        self.obs_sum[r] += conf
+        self.obs_n[r] += 1
+        self.last_ts[r] = ts
+
+    def release(self, sid):
+        r = self.rows.pop(sid, None)
+        if r is None:
+            return
+        self.sids[r] = None
+        self.phones[r] = None
+        self.obs_n[r] = 0
+        self.free.append(r)
+
+    def due(self, now_ts):
+        if self.last_tick is None:
+            self.last_tick = now_ts
+        return now_ts - self.last_tick >= self.tick_sec
+
+    def step(self, now_ts):
+        """Fold queued observations into the beliefs; returns confirmed changes."""
+        self.last_tick = now_ts
+        rows = np.flatnonzero(self.obs_n > 0)
+        changes = []
+        if len(rows):
+            # Mean confidence per session: consecutive vectors share most of
+            # their window, so they are not independent observations.
+            conf = self.obs_sum[rows] / self.obs_n[rows, None]
+            lik = np.exp(self.beta * (conf - conf.max(axis=1, keepdims=True)))
+            b = (self.belief[rows] @ self.trans) * lik
+            b /= b.sum(axis=1, keepdims=True)
+            self.belief[rows] = b
+            self.obs_sum[rows] = 0.0
+            self.obs_n[rows] = 0
+
+            top = b.argmax(axis=1)
+            post = b[np.arange(len(rows)), top]
+            new_lead = top != self.lead[rows]
+            self.lead[rows[new_lead]] = top[new_lead]
+            self.lead_ts[rows[new_lead]] = self.obs_ts[rows[new_lead]]
+            switch = (top != self.zone[rows]) & (post >= self.switch_prob)
+            for i in np.flatnonzero(switch):
+                r = rows[i]
+                prev = int(self.zone[r])
+                self.zone[r] = top[i]
+                changes.append((self.sids[r], self.phones[r],
+                                self.zone_ids[prev] if prev >= 0 else None,
+                                self.zone_ids[top[i]], float(self.lead_ts[r]), float(post[i])))
+
+        if self.rows:
+            live = np.fromiter(self.rows.values(), dtype=np.int64, count=len(self.rows))
+            for r in live[now_ts - self.last_ts[live] > self.idle_sec]:
+                self.release(self.sids[r])
+        return changes
+
+# --- benchmark ---
+
+def _bench(zone_count=19, ticks=200, seed=0):
+    rng = np.random.default_rng(seed)
+    zone_ids = list(range(1, zone_count + 1))
+    zones = {z: (2 * ((z - 1) % 6) - 5, 2 * ((z - 1) // 6) - 2) for z in zone_ids}
+    for sessions in (10, 100, 1000):
+        tr = HmmTracker(zone_ids, zones, tick_sec=1.0)
+        true = rng.integers(0, zone_count, sessions)
+        t_obs = t_step = 0.0
+        for k in range(ticks):
+            conf = rng.random((sessions, zone_count)) * 0.4
+            conf[np.arange(sessions), true] += 0.4
+            t0 = time.perf_counter()
+            for s in range(sessions):
+                tr.observe(s, "p", conf[s], float(k))
+            t1 = time.perf_counter()
+            tr.step(float(k) + 1.0)
+            t2 = time.perf_counter()
+            t_obs += t1 - t0
+            t_step += t2 - t1
+        hit = (tr.zone[[tr.rows[s] for s in range(sessions)]] == true).mean()
+        print("{:>5} sessions: step {:.3f} ms/tick, observe {:.2f} us/msg, tracked correctly {:.0%}".format(
+            sessions, 1e3 * t_step / ticks, 1e6 * t_obs / (ticks * sessions), hit))
+
+if __name__ == "__main__":
+    _bench()